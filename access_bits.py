@@ -0,0 +1,158 @@
+"""Биты доступа Mifare Classic (C1/C2/C3) и права на блоки сектора
+
+Байты 6-8 трейлера хранят условия доступа для трех групп блоков данных и
+трейлера, каждое - прямой и инвертированной копией. По ним строится
+таблица прав сектора: каким ключом (A или B) какой блок можно прочитать
+и записать. Операции заранее выбирают нужный тип ключа и не отправляют
+APDU, которые карта все равно отклонит.
+"""
+from card_geometry import CLASSIC_1K, TRAILER_ACCESS_GROUP
+
+# Права на блок данных: (C1, C2, C3) -> (чтение, запись) - набор ключей
+DATA_PERMISSIONS = {
+    (0, 0, 0): ("AB", "AB"),
+    (0, 1, 0): ("AB", ""),
+    (1, 0, 0): ("AB", "B"),
+    (1, 1, 0): ("AB", "B"),
+    (0, 0, 1): ("AB", ""),
+    (0, 1, 1): ("B", "B"),
+    (1, 0, 1): ("B", ""),
+    (1, 1, 1): ("", ""),
+}
+
+# Права на трейлер: запись ключа A, чтение/запись битов доступа, чтение/запись ключа B
+TRAILER_PERMISSIONS = {
+    (0, 0, 0): {"key_a_write": "A", "access_read": "A", "access_write": "", "key_b_read": "A", "key_b_write": "A"},
+    (0, 1, 0): {"key_a_write": "", "access_read": "A", "access_write": "", "key_b_read": "A", "key_b_write": ""},
+    (1, 0, 0): {"key_a_write": "B", "access_read": "AB", "access_write": "", "key_b_read": "", "key_b_write": "B"},
+    (1, 1, 0): {"key_a_write": "", "access_read": "AB", "access_write": "", "key_b_read": "", "key_b_write": ""},
+    (0, 0, 1): {"key_a_write": "A", "access_read": "A", "access_write": "A", "key_b_read": "A", "key_b_write": "A"},
+    (0, 1, 1): {"key_a_write": "B", "access_read": "AB", "access_write": "B", "key_b_read": "", "key_b_write": "B"},
+    (1, 0, 1): {"key_a_write": "", "access_read": "AB", "access_write": "B", "key_b_read": "", "key_b_write": ""},
+    (1, 1, 1): {"key_a_write": "", "access_read": "AB", "access_write": "", "key_b_read": "", "key_b_write": ""},
+}
+
+
+def access_bytes(value):
+    """Байты 6-8 трейлера из hex строки (6 или 8 символов) или байтов"""
+    if isinstance(value, str):
+        value = value.strip().replace(" ", "")
+        if len(value) not in (6, 8) or not all(c in "0123456789ABCDEFabcdef" for c in value):
+            raise Exception("Биты доступа должны содержать 8 hex символов")
+        value = bytes.fromhex(value)
+    return bytes(value[:3])
+
+
+def decode_access_bits(value):
+    """Условия (C1, C2, C3) групп 0-3; None, если инвертированные копии не совпадают"""
+    b6, b7, b8 = access_bytes(value)
+    if (b6 & 0x0F) != (~b7 >> 4) & 0x0F or (b6 >> 4) != (~b8) & 0x0F or (b7 & 0x0F) != (~b8 >> 4) & 0x0F:
+        return None
+    return [((b7 >> (4 + group)) & 1, (b8 >> group) & 1, (b8 >> (4 + group)) & 1)
+            for group in range(4)]
+
+
+def encode_access_bits(conditions, user_byte=0x69):
+    """Биты доступа (4 байта с байтом пользователя) из условий групп 0-3"""
+    c1 = c2 = c3 = 0
+    for group, (bit1, bit2, bit3) in enumerate(conditions):
+        c1 |= bit1 << group
+        c2 |= bit2 << group
+        c3 |= bit3 << group
+    b6 = ((~c2 & 0x0F) << 4) | (~c1 & 0x0F)
+    b7 = (c1 << 4) | (~c3 & 0x0F)
+    b8 = (c3 << 4) | c2
+    return bytes([b6, b7, b8, user_byte])
+
+
+def access_conditions(trailer, group):
+    """Условия (C1, C2, C3) группы блоков по трейлеру; None, если биты доступа повреждены"""
+    conditions = decode_access_bits(trailer[6:9])
+    return conditions[group] if conditions else None
+
+
+def validate_access_bits(value, key_type="A"):
+    """Проверка битов доступа перед записью в трейлер
+
+    Несогласованные копии навсегда блокируют сектор, поэтому такие биты
+    отклоняются. Отклоняются и условия, при которых ключ key_type больше
+    не сможет записать ключ A: приложение пишет трейлеры ключом A, и
+    декодирование (возврат транспортного ключа) стало бы невозможным.
+    """
+    conditions = decode_access_bits(value)
+    if conditions is None:
+        raise Exception("Биты доступа несогласованы (инвертированные копии C1/C2/C3 не совпадают) "
+                        "- запись такого трейлера заблокирует сектор")
+    trailer = TRAILER_PERMISSIONS[conditions[TRAILER_ACCESS_GROUP]]
+    if key_type not in trailer["key_a_write"]:
+        raise Exception(f"С такими битами доступа ключ {key_type} не сможет перезаписать ключ A "
+                        f"- сектор нельзя будет декодировать")
+    return conditions
+
+
+class SectorPermissions:
+    """Таблица прав сектора: какой блок каким ключом можно читать и писать"""
+
+    def __init__(self, sector, access_bits, geometry=CLASSIC_1K):
+        self.sector = sector
+        self.geometry = geometry
+        self.access_bits = access_bytes(access_bits).hex().upper()
+        self.conditions = decode_access_bits(access_bits)
+        if self.conditions is None:
+            raise Exception(f"Биты доступа сектора {sector} несогласованы")
+        trailer = TRAILER_PERMISSIONS[self.conditions[TRAILER_ACCESS_GROUP]]
+        # Если ключ B можно прочитать, он не работает как ключ доступа
+        self.key_b_readable = "A" in trailer["key_b_read"]
+
+    @classmethod
+    def from_trailer(cls, sector, trailer, geometry=CLASSIC_1K):
+        """Права по прочитанному трейлеру; None, если биты доступа не прочитаны или повреждены"""
+        if decode_access_bits(trailer[6:9]) is None:
+            return None
+        return cls(sector, trailer[6:10], geometry)
+
+    def _usable(self, keys):
+        return keys.replace("B", "") if self.key_b_readable else keys
+
+    def read_keys(self, block_num):
+        """Ключи, которыми блок можно прочитать"""
+        group = self.geometry.access_group(block_num)
+        conditions = self.conditions[group]
+        if group == TRAILER_ACCESS_GROUP:
+            return self._usable(TRAILER_PERMISSIONS[conditions]["access_read"])
+        return self._usable(DATA_PERMISSIONS[conditions][0])
+
+    def write_keys(self, block_num):
+        """Ключи, которыми блок можно записать (для трейлера - хотя бы его часть)"""
+        if block_num == 0:
+            # Блок производителя только читается
+            return ""
+        group = self.geometry.access_group(block_num)
+        conditions = self.conditions[group]
+        if group == TRAILER_ACCESS_GROUP:
+            trailer = TRAILER_PERMISSIONS[conditions]
+            keys = "".join(key for key in "AB" if any(key in trailer[part] for part in
+                                                      ("key_a_write", "access_write", "key_b_write")))
+            return self._usable(keys)
+        return self._usable(DATA_PERMISSIONS[conditions][1])
+
+    def can_read(self, block_num, key_type):
+        return key_type in self.read_keys(block_num)
+
+    def can_write(self, block_num, key_type):
+        return key_type in self.write_keys(block_num)
+
+    def best_key_type(self, action, blocks, key_types=("A", "B")):
+        """Тип ключа, которым можно выполнить action ("read"/"write") для наибольшего числа блоков
+
+        При равенстве - первый из key_types.
+        """
+        allowed = self.read_keys if action == "read" else self.write_keys
+        return max(key_types, key=lambda key_type: (
+            sum(1 for block_num in blocks if key_type in allowed(block_num)),
+            -key_types.index(key_type)))
+
+    def table(self):
+        """Права всех блоков сектора: {блок: {"read": "AB", "write": "B"}}"""
+        return {block_num: {"read": self.read_keys(block_num), "write": self.write_keys(block_num)}
+                for block_num in self.geometry.sector_blocks(self.sector)}
@@ -0,0 +1,247 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Класс команды по байту INS псевдо-APDU ACR
+COMMAND_CLASSES = {
+    0xCA: "GET UID",
+    0x82: "LOAD KEY",
+    0x86: "AUTH",
+    0xB0: "READ",
+    0xD6: "UPDATE",
+}
+# Верхние границы корзин гистограммы задержки, мс (последняя корзина - все, что больше)
+HISTOGRAM_BOUNDS_MS = (2, 5, 10, 20, 50, 100, 250, 500, 1000)
+# Сколько последних операций хранить
+MAX_RECENT_SPANS = 50
+
+
+def command_class(apdu):
+    """Класс команды APDU (LOAD KEY, AUTH, READ, UPDATE, GET UID)"""
+    if len(apdu) > 1 and apdu[0] == 0xFF:
+        return COMMAND_CLASSES.get(apdu[1], f"FF {apdu[1]:02X}")
+    return "OTHER"
+
+
+def percentile(values, percent):
+    """Перцентиль списка значений по ближайшему рангу (точный, в отличие от гистограммы)"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, int(round(percent / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms):
+        index = 0
+        while index < len(HISTOGRAM_BOUNDS_MS) and elapsed_ms > HISTOGRAM_BOUNDS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, percent):
+        """Оценка перцентиля: верхняя граница корзины, в которую он попал"""
+        if not self.count:
+            return 0.0
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                if index < len(HISTOGRAM_BOUNDS_MS):
+                    return min(float(HISTOGRAM_BOUNDS_MS[index]), round(self.max_ms, 2))
+                return round(self.max_ms, 2)
+        return self.max_ms
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "max_ms": round(self.max_ms, 2),
+            "histogram": dict(zip(labels, self.buckets)),
+        }
+
+
+class ReaderStats:
+    """Статистика APDU одного считывателя"""
+
+    def __init__(self):
+        self.commands = {}
+        self.status_words = {}
+        self.errors = 0
+        self.retries = 0
+
+    def to_dict(self):
+        return {
+            "apdus": sum(h.count for h in self.commands.values()),
+            "errors": self.errors,
+            "retries": self.retries,
+            "status_words": dict(self.status_words),
+            "commands": {name: h.to_dict() for name, h in self.commands.items()},
+        }
+
+
+class OperationSpan:
+    """Операция (вызов Eel функции) и все APDU, которые она отправила"""
+
+    def __init__(self, name, reader_name):
+        self.name = name
+        self.reader_name = reader_name
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.apdus = 0
+        self.apdu_ms = 0.0
+        self.commands = {}
+        self.status_words = {}
+        self.retries = 0
+        # Ответы не 90 00 (в том числе неподошедшие ключи при переборе)
+        self.failed = 0
+        self.errors = 0
+        self.status = None
+        self.error = ""
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "reader": self.reader_name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 1),
+            "apdus": self.apdus,
+            "apdu_ms": round(self.apdu_ms, 1),
+            # Время вне обмена с картой - собственный код приложения
+            "code_ms": round(max(0.0, self.duration_ms - self.apdu_ms), 1),
+            "commands": dict(self.commands),
+            "status_words": dict(self.status_words),
+            "retries": self.retries,
+            "failed": self.failed,
+            "errors": self.errors,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class ApduMonitor:
+    """Сбор статистики всех APDU: по считывателям, классам команд и операциям
+
+    Гистограммы задержки по считывателю и классу команды показывают, что
+    медленнее - считыватель (GET UID, LOAD KEY) или карта (AUTH, READ,
+    UPDATE), а разница между временем операции и временем APDU - время
+    собственного кода.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.readers = {}
+        self.operations = {}
+        self.recent = deque(maxlen=MAX_RECENT_SPANS)
+
+    @property
+    def current_span(self):
+        return getattr(self._local, "span", None)
+
+    def record(self, reader_name, apdu, status, elapsed):
+        """Учет APDU: status - (sw1, sw2) или None, если transmit выбросил исключение"""
+        name = command_class(apdu)
+        elapsed_ms = elapsed * 1000.0
+        sw = f"{status[0]:02X} {status[1]:02X}" if status else "EXC"
+        failed = status != (0x90, 0x00)
+        with self._lock:
+            reader = self.readers.setdefault(reader_name, ReaderStats())
+            reader.commands.setdefault(name, LatencyHistogram()).add(elapsed_ms)
+            reader.status_words[sw] = reader.status_words.get(sw, 0) + 1
+            if status is None:
+                reader.errors += 1
+        span = self.current_span
+        if span is not None:
+            span.apdus += 1
+            span.apdu_ms += elapsed_ms
+            span.commands[name] = span.commands.get(name, 0) + 1
+            span.status_words[sw] = span.status_words.get(sw, 0) + 1
+            if status is None:
+                span.errors += 1
+            elif failed:
+                span.failed += 1
+
+    def record_retry(self, reader_name):
+        """Повтор команды (например, после потери аутентификации)"""
+        with self._lock:
+            self.readers.setdefault(reader_name, ReaderStats()).retries += 1
+        span = self.current_span
+        if span is not None:
+            span.retries += 1
+
+    @contextmanager
+    def span(self, name, reader_name):
+        """Операция: все APDU этого потока внутри блока относятся к ней"""
+        span = OperationSpan(name, reader_name)
+        previous = self.current_span
+        self._local.span = span
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration_ms = (time.perf_counter() - started) * 1000.0
+            self._local.span = previous
+            self._finish_span(span)
+
+    def _finish_span(self, span):
+        with self._lock:
+            totals = self.operations.setdefault(span.name, {
+                "count": 0, "errors": 0, "apdus": 0, "retries": 0,
+                "duration_ms": 0.0, "apdu_ms": 0.0,
+            })
+            totals["count"] += 1
+            totals["apdus"] += span.apdus
+            totals["retries"] += span.retries
+            totals["duration_ms"] += span.duration_ms
+            totals["apdu_ms"] += span.apdu_ms
+            if span.status not in (None, "success"):
+                totals["errors"] += 1
+            self.recent.append(span.to_dict())
+
+    def snapshot(self):
+        """Вся статистика для интерфейса"""
+        with self._lock:
+            operations = {}
+            for name, totals in self.operations.items():
+                count = totals["count"]
+                operations[name] = {
+                    "count": count,
+                    "errors": totals["errors"],
+                    "retries": totals["retries"],
+                    "apdus_avg": round(totals["apdus"] / count, 1),
+                    "duration_ms_avg": round(totals["duration_ms"] / count, 1),
+                    "apdu_ms_avg": round(totals["apdu_ms"] / count, 1),
+                    "code_ms_avg": round(max(0.0, totals["duration_ms"] - totals["apdu_ms"]) / count, 1),
+                }
+            return {
+                "readers": {name: stats.to_dict() for name, stats in self.readers.items()},
+                "operations": operations,
+                "recent": list(self.recent),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.readers = {}
+            self.operations = {}
+            self.recent.clear()
+
+
+# Общий экземпляр для всех соединений
+apdu_monitor = ApduMonitor()
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import threading
+import time
+from card_keyring import TRANSPORT_KEY
+
+# База журнала операций над картами
+AUDIT_FILE = "mifare_audit.db"
+# Запись пачкой: по числу накопленных записей или по времени
+FLUSH_BATCH_SIZE = 100
+FLUSH_INTERVAL = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    uid TEXT,
+    reader TEXT,
+    operation TEXT NOT NULL,
+    lock_no INTEGER,
+    key_a TEXT,
+    params TEXT,
+    status TEXT,
+    error TEXT,
+    duration_ms REAL,
+    apdus INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_operations_lock_no ON operations (lock_no, ts);
+CREATE INDEX IF NOT EXISTS idx_operations_uid ON operations (uid, ts);
+CREATE INDEX IF NOT EXISTS idx_operations_key_a ON operations (key_a, ts);
+CREATE INDEX IF NOT EXISTS idx_operations_operation ON operations (operation, ts);
+CREATE INDEX IF NOT EXISTS idx_operations_ts ON operations (ts);
+"""
+
+COLUMNS = ("id", "ts", "uid", "reader", "operation", "lock_no", "key_a", "params",
+           "status", "error", "duration_ms", "apdus")
+
+
+def describe_operation(operation, args, config, result):
+    """Номер замка, записанный ключ A и параметры операции для журнала"""
+    lock_no, key_a, params = None, None, {}
+    if operation == "write_setup_card" and args:
+        lock_no = int(args[0]) if str(args[0]).isdigit() else None
+        params = dict(zip(("lock_no", "wait_time", "sound_mode", "alarm_mode", "lock_mode"), args))
+    elif operation == "check_lock_number":
+        lock_no = result.get("lock_number")
+    elif operation == "encode":
+        key_a = config.get("default_key_a", TRANSPORT_KEY)
+        params = {"key_a": key_a, "key_b": config.get("default_key_b", TRANSPORT_KEY),
+                  "access_bits": config.get("default_access_bits"), "block": config.get("default_block")}
+    elif operation == "decode":
+        key_a = TRANSPORT_KEY
+        params = {"access_bits": config.get("default_access_bits"), "block": config.get("default_block")}
+    return lock_no, key_a, params
+
+
+class AuditStore:
+    """Журнал операций над картами в SQLite (режим WAL)
+
+    record() только добавляет запись в буфер; в базу буфер пишется одной
+    транзакцией фоновым потоком. Перед поиском буфер сбрасывается, поэтому
+    поиск видит все записанные операции.
+    """
+
+    def __init__(self, db_file=AUDIT_FILE):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True, name="audit-writer")
+        self._thread.start()
+
+    def record(self, reader, operation, uid=None, lock_no=None, key_a=None, params=None,
+               status=None, error="", duration_ms=None, apdus=None, ts=None):
+        """Добавление записи в буфер"""
+        row = (ts or time.time(), uid, reader, operation, lock_no, key_a,
+               json.dumps(params or {}, ensure_ascii=False), status, error or "",
+               round(duration_ms, 1) if duration_ms is not None else None, apdus)
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= FLUSH_BATCH_SIZE
+        if full:
+            self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Ошибка записи журнала операций: {e}")
+
+    def flush(self):
+        """Запись буфера в базу одной транзакцией"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        with self._db_lock, self.db:
+            self.db.executemany(
+                "INSERT INTO operations (ts, uid, reader, operation, lock_no, key_a, params, "
+                "status, error, duration_ms, apdus) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def search(self, uid=None, lock_no=None, key_a=None, operation=None, status=None,
+               limit=100, offset=0):
+        """Поиск записей (новые первыми); uid и key_a - по префиксу"""
+        self.flush()
+        where, values = [], []
+        if uid:
+            # Префикс через диапазон, чтобы работал индекс по uid
+            prefix = uid.strip().upper()
+            where.append("uid >= ? AND uid < ?")
+            values += [prefix, prefix + "\uffff"]
+        if lock_no not in (None, ""):
+            where.append("lock_no = ?")
+            values.append(int(lock_no))
+        if key_a:
+            prefix = key_a.strip().upper()
+            where.append("key_a >= ? AND key_a < ?")
+            values += [prefix, prefix + "\uffff"]
+        if operation:
+            where.append("operation = ?")
+            values.append(operation)
+        if status:
+            where.append("status = ?")
+            values.append(status)
+        query = f"SELECT {', '.join(COLUMNS)} FROM operations"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY ts DESC LIMIT ? OFFSET ?"
+        values += [int(limit), int(offset)]
+        with self._db_lock:
+            rows = self.db.execute(query, values).fetchall()
+        records = []
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            record["params"] = json.loads(record["params"]) if record["params"] else {}
+            records.append(record)
+        return records
+
+    def lock_history(self, lock_no, limit=100):
+        """Все операции с номером замка (например, какая карта настроила замок 317)"""
+        return self.search(lock_no=lock_no, limit=limit)
+
+    def card_history(self, uid, limit=100):
+        """Все операции с картой"""
+        return self.search(uid=uid, limit=limit)
+
+    def get_stats(self):
+        """Число записей по операциям"""
+        self.flush()
+        with self._db_lock:
+            rows = self.db.execute(
+                "SELECT operation, COUNT(*) FROM operations GROUP BY operation").fetchall()
+        by_operation = dict(rows)
+        return {"total": sum(by_operation.values()), "by_operation": by_operation}
+
+    def close(self):
+        """Запись остатка буфера и закрытие базы"""
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=2)
+        self.flush()
+        with self._db_lock:
+            self.db.close()
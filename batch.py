@@ -0,0 +1,232 @@
+"""Пакетное выполнение операций над картами без интерфейса Eel
+
+Задания читаются из манифеста JSON lines (файл или stdin), по одному на
+строку, и выполняются тем же кодом, что и кнопки окна (card_service).
+Результат каждого задания сразу выводится строкой JSON, в конце - строка
+с итогом: пропускная способность и задержка заданий.
+
+    {"op": "setup", "lock_no": 120, "wait_time": 5, "sound_mode": 3}
+    {"op": "check"}
+    {"op": "dump", "reader": "ACR1252 0"}
+
+    python batch.py jobs.jsonl
+    python batch.py --simulator 2 jobs.jsonl      # на симуляторе из 2 считывателей
+    python batch.py --wait-card - < jobs.jsonl    # каждое задание - на новой карте
+
+Задания одного считывателя выполняются по очереди, разных - параллельно;
+без "reader" задания распределяются по считывателям по кругу. Пустые
+строки и строки, начинающиеся с #, пропускаются. Код возврата 1, если
+хотя бы одно задание завершилось ошибкой.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from apdu_monitor import percentile
+from audit_store import AuditStore
+from card_service import CONFIG_FILE, OPERATIONS, CardService, load_config, resolve_operation
+from job_queue import JobManager
+from reader_registry import reader_registry
+
+# Пауза между опросами считывателя в режиме --wait-card, секунд
+CARD_POLL_INTERVAL = 0.3
+
+
+def parse_job(line):
+    """Задание из строки манифеста: (имя операции, аргументы, считыватель)"""
+    try:
+        spec = json.loads(line)
+    except ValueError as e:
+        raise Exception(f"Неверный JSON: {e}")
+    name, args = resolve_operation(spec)
+    return name, args, spec.get("reader")
+
+
+def read_manifest(stream):
+    """Строки манифеста: (номер строки, текст) без пустых строк и комментариев"""
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line_no, line
+
+
+def wait_for_new_card(service, reader_name, previous_uid, cancel_event, timeout):
+    """Ожидание карты с UID, отличным от previous_uid; False по таймауту или отмене"""
+    deadline = time.monotonic() + timeout if timeout else None
+    while not cancel_event.is_set():
+        uid = service.probe_uid(reader_name)
+        if uid and uid != previous_uid:
+            return True
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        cancel_event.wait(CARD_POLL_INTERVAL)
+    return False
+
+
+class BatchRunner:
+    """Выполнение заданий манифеста на очереди считывателей и вывод результатов"""
+
+    def __init__(self, service, readers, out=sys.stdout, wait_card=False, card_timeout=0):
+        self.service = service
+        self.readers = readers
+        self.out = out
+        self.wait_card = wait_card
+        self.card_timeout = card_timeout
+        self.jobs = JobManager(max_workers=max(1, len(readers)), on_finished=self._finished)
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._pending = 0
+        self._lines = {}
+        self._last_uids = {}
+        self.records = []
+
+    def emit(self, record):
+        """Строка JSON в выходной поток"""
+        with self._lock:
+            self.out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.out.flush()
+
+    def submit(self, line_no, line, index):
+        """Постановка задания строки манифеста в очередь считывателя"""
+        try:
+            name, args, reader_name = parse_job(line)
+        except Exception as e:
+            self._record({"type": "job", "id": None, "line": line_no, "op": None, "reader": None,
+                          "status": "error", "error": str(e), "uid": None,
+                          "latency_ms": 0, "queue_ms": 0, "result": None})
+            return
+        reader_name = reader_name or self.readers[index % len(self.readers)]
+        # Под блокировкой: задание может завершиться раньше, чем известен его номер строки
+        with self._lock:
+            self._pending += 1
+            job_id = self.jobs.submit(name, reader_name, self._run, name, args)
+            self._lines[job_id] = line_no
+
+    def _run(self, job, name, args):
+        if self.wait_card:
+            previous_uid = self._last_uids.get(job.reader_name)
+            if not wait_for_new_card(self.service, job.reader_name, previous_uid,
+                                     job.cancel_event, self.card_timeout):
+                return {"status": "error", "data": "", "error": "Карта не приложена"}
+            # Время задания считается с момента, когда карта приложена
+            job.started_at = time.time()
+        operation, _ = OPERATIONS[name]
+        result = self.service.run(job.reader_name, operation, *args, cancel_event=job.cancel_event)
+        if result.get("uid"):
+            self._last_uids[job.reader_name] = result["uid"]
+        return result
+
+    def _finished(self, job):
+        result = job.result or {}
+        finished_at = job.finished_at or time.time()
+        # Задание, отмененное в очереди, не начиналось: задержка выполнения нулевая
+        started_at = job.started_at or finished_at
+        with self._lock:
+            line_no = self._lines.pop(job.id, None)
+        self._record({
+            "type": "job",
+            "id": job.id,
+            "line": line_no,
+            "op": job.name,
+            "reader": job.reader_name,
+            "status": result.get("status", job.status),
+            "error": result.get("error", ""),
+            "uid": result.get("uid"),
+            "latency_ms": round((finished_at - started_at) * 1000, 1),
+            "queue_ms": round((started_at - job.created_at) * 1000, 1),
+            "result": result,
+        })
+        with self._lock:
+            self._pending -= 1
+            self._done.notify_all()
+
+    def _record(self, record):
+        with self._lock:
+            self.records.append(record)
+        self.emit(record)
+
+    def wait(self):
+        """Ожидание завершения всех поставленных заданий"""
+        with self._lock:
+            while self._pending:
+                self._done.wait()
+
+    def cancel(self):
+        """Отмена оставшихся заданий (Ctrl+C)"""
+        for job in self.jobs.list_jobs():
+            self.jobs.cancel(job["job_id"])
+
+    def summary(self, elapsed):
+        """Итог пакета: число заданий, пропускная способность, задержка по операциям"""
+        def latency(records):
+            values = [record["latency_ms"] for record in records]
+            return {
+                "count": len(values),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "max_ms": max(values) if values else 0,
+            }
+
+        finished = [record for record in self.records if record["op"]]
+        operations = {}
+        for record in finished:
+            operations.setdefault(record["op"], []).append(record)
+        ok = sum(1 for record in self.records if record["status"] == "success")
+        return {
+            "type": "summary",
+            "jobs": len(self.records),
+            "ok": ok,
+            "errors": len(self.records) - ok,
+            "elapsed_s": round(elapsed, 3),
+            "jobs_per_s": round(len(finished) / elapsed, 2) if elapsed > 0 else 0,
+            "readers": self.readers,
+            "latency": latency(finished),
+            "operations": {name: latency(records) for name, records in operations.items()},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетное выполнение операций над картами из манифеста JSON lines")
+    parser.add_argument("manifest", help="файл манифеста или - для stdin")
+    parser.add_argument("--reader", action="append", help="считыватель (можно несколько); по умолчанию - все")
+    parser.add_argument("--config", default=CONFIG_FILE, help="файл конфигурации")
+    parser.add_argument("--simulator", type=int, metavar="N", help="симулятор из N считывателей вместо PC/SC")
+    parser.add_argument("--wait-card", action="store_true", help="перед каждым заданием ждать новую карту")
+    parser.add_argument("--card-timeout", type=float, default=0, help="сколько ждать карту, секунд (0 - без ограничения)")
+    parser.add_argument("--no-audit", action="store_true", help="не записывать операции в журнал")
+    args = parser.parse_args(argv)
+
+    if args.simulator:
+        # До первого обращения к списку считывателей
+        os.environ["PSOFT_SIMULATOR"] = str(args.simulator)
+
+    readers = args.reader or reader_registry.names()
+    if not readers:
+        print("Ошибка: нет подключенных считывателей", file=sys.stderr)
+        return 1
+    service = CardService(load_config(args.config), audit=None if args.no_audit else AuditStore(),
+                          notify=lambda message: print(message, file=sys.stderr))
+    runner = BatchRunner(service, readers, wait_card=args.wait_card, card_timeout=args.card_timeout)
+    stream = sys.stdin if args.manifest == "-" else open(args.manifest, 'r', encoding='utf-8')
+    started = time.perf_counter()
+    try:
+        for index, (line_no, line) in enumerate(read_manifest(stream)):
+            runner.submit(line_no, line, index)
+        runner.wait()
+    except KeyboardInterrupt:
+        runner.cancel()
+        runner.wait()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    summary = runner.summary(time.perf_counter() - started)
+    runner.emit(summary)
+    runner.jobs.shutdown()
+    service.close()
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,494 @@
+"""Бенчмарк операций над картой на симуляторе считывателя
+
+Каждая операция из card_operations выполняется на симулированном ACR1252
+с реалистичной задержкой APDU для нескольких состояний карты. Для каждой
+пары "сценарий + операция" считаются число APDU и p50/p95 времени
+выполнения, результат сравнивается с сохраненным baseline.
+
+Меньше APDU ничего не стоит, если карта записана неверно, поэтому после
+каждого прогона проверяется и содержимое карты симулятора, а перед
+замером выполняются проверки поведения: биты доступа (кодирование,
+декодирование и совпадение прав с симулятором), выдача номеров замков,
+продолжение операции с контрольной точки и запись только отличающихся
+блоков.
+
+    python benchmark.py                     # прогон и сравнение с baseline
+    python benchmark.py --save-baseline     # сохранить новый baseline
+    python benchmark.py -n 3 --operation dump_card --scenario blank
+
+Код возврата 1, если найдена регрессия или не пройдена проверка.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from smartcard.Exceptions import CardConnectionException
+import card_operations
+from access_bits import DATA_PERMISSIONS, SectorPermissions, decode_access_bits, encode_access_bits
+from apdu_monitor import percentile
+from card_keyring import Keyring, TRANSPORT_KEY
+from card_operations import OperationContext, ZERO_BLOCK, build_setup_blocks, trailer_location
+from card_service import CardService
+from card_simulator import SimulatedMifareCard, SimulatedStation
+from checkpoints import CheckpointStore
+from production import LockNumberAllocator
+from reader_pool import ReaderConnectionPool
+from reader_registry import ReaderRegistry
+
+# p95 по пяти прогонам - это максимум из них, поэтому он сравнивается только при достаточном числе прогонов
+MIN_P95_ITERATIONS = 20
+# Рост времени меньше этого не считается регрессией, как бы мала ни была база, мс
+MIN_LATENCY_DELTA_MS = 5.0
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Настройки как у закодированного объекта: свои ключи A и B
+BENCH_CONFIG = {
+    "default_key_a": "A0A1A2A3A4A5",
+    "default_key_b": "B0B1B2B3B4B5",
+    "default_access_bits": "FF078069",
+    "default_block": "62",
+    "keyring": {},
+}
+# Ключ, которого нет в наборе (сектора "чужой" системы)
+UNKNOWN_KEY = "5A5A5A5A5A5A"
+LOCKED_SECTORS = (4, 5, 6, 7)
+# Биты доступа, при которых первый блок сектора только читается
+READ_ONLY_FIRST_BLOCK = "EF078169"
+RESTRICTED_SECTOR = 2
+
+OPERATIONS = {
+    "dump_card": (card_operations.dump_card, ()),
+    "clear_all_blocks": (card_operations.clear_all_blocks, ()),
+    "encode": (card_operations.encode, ()),
+    "decode": (card_operations.decode, ()),
+    "write_setup_card": (card_operations.write_setup_card, (1, 3, 1, 1, 0, False)),
+    "clear_setup_blocks": (card_operations.clear_setup_blocks, ()),
+    "check_lock_number": (card_operations.check_lock_number, ()),
+}
+
+
+class CountingCard(SimulatedMifareCard):
+    """Карта, считающая записи блоков; связь с ней теряется на fail_at-й записи"""
+
+    def __init__(self, card_type="1k", fail_at=None):
+        super().__init__(card_type=card_type)
+        self.fail_at = fail_at
+        self.writes = 0
+
+    def write(self, block_num, data, key_type):
+        self.writes += 1
+        if self.writes == self.fail_at:
+            raise CardConnectionException("Карту сдвинули с антенны", 0)
+        return super().write(block_num, data, key_type)
+
+
+def data_blocks(card):
+    """Блоки данных карты, которые можно записать (без блока 0 и трейлеров)"""
+    return [block_num for block_num in range(1, card.geometry.block_count)
+            if block_num != card.trailer_of(card.sector_of(block_num))]
+
+
+def fill_data(card):
+    """Блоки данных заполняются номером блока: очистка и дамп должны это заметить"""
+    for block_num in data_blocks(card):
+        card.set_block(block_num, bytes([block_num & 0xFF]) * 16)
+    return card
+
+
+def blank_card():
+    """Чистая карта: везде транспортный ключ"""
+    return fill_data(SimulatedMifareCard(card_type="1k"))
+
+
+def encoded_card():
+    """Карта после encode: сектор 15 закрыт ключами из настроек"""
+    card = blank_card()
+    card.set_sector_key(15, key_a=BENCH_CONFIG["default_key_a"], key_b=BENCH_CONFIG["default_key_b"])
+    return card
+
+
+def partially_locked_card():
+    """Закодированная карта, часть секторов которой закрыта неизвестным ключом"""
+    card = encoded_card()
+    for sector in LOCKED_SECTORS:
+        card.set_sector_key(sector, key_a=UNKNOWN_KEY, key_b=UNKNOWN_KEY)
+    return card
+
+
+def restricted_card():
+    """Чистая карта, первый блок сектора 2 которой записать нельзя: отказ переводит карту в HALT"""
+    card = blank_card()
+    card.set_sector_key(RESTRICTED_SECTOR, access_bits=READ_ONLY_FIRST_BLOCK)
+    return card
+
+
+def blank_4k_card():
+    """Чистая карта 4K: 32 сектора по 4 блока и 8 секторов по 16"""
+    return fill_data(SimulatedMifareCard(card_type="4k"))
+
+
+SCENARIOS = {
+    "blank": blank_card,
+    "encoded": encoded_card,
+    "partially_locked": partially_locked_card,
+    "restricted": restricted_card,
+    "blank_4k": blank_4k_card,
+}
+
+
+def run_once(station, operation, args, card, keymap_file, config=BENCH_CONFIG):
+    """Один прогон операции на карте card: (секунды, число APDU, результат)"""
+    reader = station.reader_list[0]
+    reader.insert(card)
+    # Новые пул и набор ключей - холодный старт, как у новой карты на станции
+    pool = ReaderConnectionPool(ReaderRegistry(station.readers))
+    keyring = Keyring(keymap_file)
+    keyring.set_keys(config)
+    apdu_before = reader.apdu_count
+    started = time.perf_counter()
+    connection = pool.acquire(reader.name)
+    try:
+        connection.key_slots.preload(connection, keyring.keys())
+        connection.begin_operation()
+        result = operation(OperationContext(connection, config, keyring), *args)
+    finally:
+        pool.release(reader.name)
+    elapsed = time.perf_counter() - started
+    pool.close_all()
+    return elapsed, reader.apdu_count - apdu_before, result
+
+
+def check_card(name, card, before, result, args):
+    """Содержимое карты после операции name; before - память карты до нее
+
+    Возвращает список расхождений (строки).
+    """
+    problems = []
+    success = result.get("status") == "success"
+    if name in ("dump_card", "check_lock_number") and bytes(card.memory) != before:
+        problems.append("операция чтения изменила карту")
+    if name == "dump_card":
+        for record in result.get("sectors", []):
+            if not record["key"]:
+                continue
+            for block in record["blocks"]:
+                block_num = block["block"]
+                if block_num == card.trailer_of(record["sector"]) or block.get("denied"):
+                    continue
+                if block["data"] is None:
+                    problems.append(f"блок {block_num} не прочитан, хотя сектор открыт")
+                elif block["data"] != card.block(block_num).hex(" ").upper():
+                    problems.append(f"блок {block_num}: в дампе {block['data']}")
+    elif name == "clear_all_blocks":
+        statuses = {block["block"]: block["status"]
+                    for record in result.get("sectors", []) for block in record["blocks"]}
+        for block_num in data_blocks(card):
+            old = before[block_num * 16:(block_num + 1) * 16]
+            status = statuses.get(block_num)
+            if status in ("cleared", "unchanged") and card.block(block_num) != ZERO_BLOCK:
+                problems.append(f"блок {block_num} ({status}) не нулевой")
+            elif status in ("auth_error", "forbidden") and card.block(block_num) != old:
+                problems.append(f"блок {block_num} ({status}) изменен")
+            elif status in ("error", "verify_error"):
+                problems.append(f"блок {block_num}: {status}")
+    elif name in ("encode", "decode") and success:
+        sector, trailer_block = trailer_location(BENCH_CONFIG)
+        access_bits = BENCH_CONFIG["default_access_bits"]
+        if name == "encode":
+            expected = BENCH_CONFIG["default_key_a"] + access_bits + BENCH_CONFIG["default_key_b"]
+        else:
+            expected = TRANSPORT_KEY + access_bits + TRANSPORT_KEY
+        if card.block(trailer_block).hex().upper() != expected:
+            problems.append(f"трейлер сектора {sector}: {card.block(trailer_block).hex().upper()}")
+    elif name == "write_setup_card" and success:
+        block_60, block_61 = build_setup_blocks(*args[:5], TRANSPORT_KEY)
+        if card.block(60) != block_60 or card.block(61) != block_61:
+            problems.append("блоки 60/61 не совпадают с настроечной картой")
+    elif name == "clear_setup_blocks" and success:
+        if card.block(60) != ZERO_BLOCK or card.block(61) != ZERO_BLOCK:
+            problems.append("блоки 60/61 не очищены")
+    elif name == "check_lock_number" and success:
+        if result.get("lock_number") != card.block(62)[4]:
+            problems.append(f"номер замка {result.get('lock_number')}, на карте {card.block(62)[4]}")
+    return problems
+
+
+def run_benchmark(scenarios, operations, iterations=5, latency_scale=1.0):
+    """Прогон всех пар "сценарий + операция"; результаты по ключу 'сценарий/операция'"""
+    station = SimulatedStation(1, latency_scale=latency_scale, with_cards=False)
+    results = {}
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        keymap_file = os.path.join(tmp_dir, "keymap.json")
+        for scenario in scenarios:
+            for name in operations:
+                operation, args = OPERATIONS[name]
+                timings, apdus, statuses = [], [], set()
+                for _ in range(iterations):
+                    card = SCENARIOS[scenario]()
+                    before = bytes(card.memory)
+                    elapsed, apdu_count, result = run_once(station, operation, args, card, keymap_file)
+                    timings.append(elapsed)
+                    apdus.append(apdu_count)
+                    statuses.add(result.get("status"))
+                    failures.extend(f"{scenario}/{name}: {problem}"
+                                    for problem in check_card(name, card, before, result, args))
+                results[f"{scenario}/{name}"] = {
+                    "apdus": max(apdus),
+                    "p50_ms": round(percentile(timings, 50) * 1000, 1),
+                    "p95_ms": round(percentile(timings, 95) * 1000, 1),
+                    "status": ",".join(sorted(str(s) for s in statuses)),
+                }
+    # Одно расхождение на всех прогонах показывается один раз
+    failures = list(dict.fromkeys(failures))
+    return {"latency_scale": latency_scale, "iterations": iterations, "results": results,
+            "failures": failures}
+
+
+def check_access_bits():
+    """Кодирование и декодирование всех условий доступа и совпадение прав с симулятором"""
+    problems = []
+    for conditions in itertools.product(sorted(DATA_PERMISSIONS), repeat=4):
+        encoded = encode_access_bits(conditions)
+        if decode_access_bits(encoded) != list(conditions):
+            problems.append(f"{encoded.hex().upper()} не декодируется обратно в {conditions}")
+        # Несогласованные копии должны отвергаться
+        if decode_access_bits(bytes([encoded[0] ^ 0x01]) + encoded[1:]) is not None:
+            problems.append(f"{encoded.hex().upper()} с испорченной копией C1 принят")
+    card = SimulatedMifareCard(card_type="1k")
+    for data_conditions, trailer_conditions in itertools.product(sorted(DATA_PERMISSIONS), repeat=2):
+        access_bits = encode_access_bits([data_conditions] * 3 + [trailer_conditions]).hex().upper()
+        card.set_sector_key(1, access_bits=access_bits)
+        permissions = SectorPermissions(1, access_bits)
+        for key_type in "AB":
+            can_read = card.read(4, key_type) is not None
+            if permissions.can_read(4, key_type) != can_read:
+                problems.append(f"биты {access_bits}: чтение ключом {key_type} - на карте {can_read}")
+            can_write = card.write(4, bytes(16), key_type)
+            if permissions.can_write(4, key_type) != can_write:
+                problems.append(f"биты {access_bits}: запись ключом {key_type} - на карте {can_write}")
+    return problems
+
+
+def check_lock_numbers():
+    """Границы диапазона номеров замков, повторная выдача возвращенных и выдача из потоков"""
+    problems = []
+    allocator = LockNumberAllocator(5, 7)
+    numbers = [allocator.allocate() for _ in range(4)]
+    if numbers != [5, 6, 7, None]:
+        problems.append(f"диапазон 5-7 выдан как {numbers}")
+    allocator.commit(5)
+    allocator.give_back(7)
+    allocator.give_back(6)
+    # Записанный номер не возвращается
+    allocator.give_back(5)
+    numbers = [allocator.allocate() for _ in range(3)]
+    if numbers != [6, 7, None]:
+        problems.append(f"после возврата 6 и 7 выдано {numbers}")
+    allocator = LockNumberAllocator(1, 200)
+    issued = []
+
+    def worker():
+        while True:
+            number = allocator.allocate()
+            if number is None:
+                return
+            if number % 3 == 0 and number not in issued:
+                # Неудачная запись: номер возвращается и выдается снова
+                issued.append(number)
+                allocator.give_back(number)
+                continue
+            allocator.commit(number)
+            issued.append(number)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    committed = [number for number in issued if number % 3 != 0] + \
+        [number for number in set(issued) if number % 3 == 0]
+    if sorted(committed) != list(range(1, 201)) or allocator.get_stats()["committed"] != 200:
+        problems.append("номера 1-200 из нескольких потоков выданы с повторами или пропусками")
+    return problems
+
+
+def check_checkpoint_resume(station, keymap_file):
+    """Очистка, прерванная потерей карты, продолжается с незавершенного сектора"""
+    problems = []
+    card = fill_data(CountingCard(fail_at=10))
+    reader = station.reader_list[0]
+    reader.insert(card)
+    service = CardService(BENCH_CONFIG, pool=ReaderConnectionPool(ReaderRegistry(station.readers)),
+                          keyring=Keyring(keymap_file), checkpoints=CheckpointStore())
+    result = service.run(reader.name, card_operations.clear_all_blocks)
+    service.pool.close_all()
+    blocks = data_blocks(card)
+    if result["status"] != "success" or result.get("attempts") != 2:
+        problems.append(f"статус {result['status']}, попыток {result.get('attempts')}: {result.get('error')}")
+    if any(card.block(block_num) != ZERO_BLOCK for block_num in blocks):
+        problems.append("после продолжения остались неочищенные блоки")
+    # Готовые секторы не перезаписываются: лишние записи - только в прерванном секторе
+    if card.writes > len(blocks) + 4:
+        problems.append(f"{card.writes} записей на {len(blocks)} блоков - очистка начата заново")
+    return problems
+
+
+def check_delta_writes(station, keymap_file):
+    """Запись только отличающихся блоков: повтор операции не отправляет UPDATE"""
+    problems = []
+    config = dict(BENCH_CONFIG, delta_writes=True)
+    card = CountingCard()
+    # Половина блоков данных уже нулевая
+    for block_num in data_blocks(card)[::2]:
+        card.set_block(block_num, b"\x5A" * 16)
+    expected = sum(1 for block_num in data_blocks(card) if card.block(block_num) != ZERO_BLOCK)
+    # Набор ключей один на все прогоны: ключ, записанный encode, уже известен
+    keyring_file = os.path.join(os.path.dirname(keymap_file), "delta_keymap.json")
+    runs = [
+        ("clear_all_blocks", card_operations.clear_all_blocks, (), expected),
+        ("clear_all_blocks", card_operations.clear_all_blocks, (), 0),
+        ("write_setup_card", card_operations.write_setup_card, OPERATIONS["write_setup_card"][1], 2),
+        ("write_setup_card", card_operations.write_setup_card, OPERATIONS["write_setup_card"][1], 0),
+        ("encode", card_operations.encode, (), 1),
+        ("encode", card_operations.encode, (), 0),
+    ]
+    keyring = Keyring(keyring_file)
+    keyring.set_keys(config)
+    reader = station.reader_list[0]
+    reader.insert(card)
+    pool = ReaderConnectionPool(ReaderRegistry(station.readers))
+    for name, operation, args, writes in runs:
+        before = bytes(card.memory)
+        card.writes = 0
+        connection = pool.acquire(reader.name)
+        try:
+            connection.begin_operation()
+            result = operation(OperationContext(connection, config, keyring), *args)
+        finally:
+            pool.release(reader.name)
+        if card.writes != writes:
+            problems.append(f"{name}: {card.writes} записей вместо {writes}")
+        problems.extend(f"{name}: {problem}" for problem in check_card(name, card, before, result, args))
+    pool.close_all()
+    return problems
+
+
+def run_checks():
+    """Проверки поведения; список не пройденных (строки)"""
+    station = SimulatedStation(1, latency_scale=0, with_cards=False)
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        keymap_file = os.path.join(tmp_dir, "keymap.json")
+        checks = {
+            "access_bits": check_access_bits,
+            "lock_numbers": check_lock_numbers,
+            "checkpoint_resume": lambda: check_checkpoint_resume(station, keymap_file),
+            "delta_writes": lambda: check_delta_writes(station, keymap_file),
+        }
+        for name, check in checks.items():
+            try:
+                problems = check()
+            except Exception as e:
+                problems = [f"ошибка: {e}"]
+            failures.extend(f"{name}: {problem}" for problem in problems)
+    return failures
+
+
+def slower(current, base, tolerance):
+    """Время выросло больше допуска: доля tolerance от базы, но не меньше MIN_LATENCY_DELTA_MS"""
+    return base > 0 and current - base > max(base * tolerance, MIN_LATENCY_DELTA_MS)
+
+
+def compare(report, baseline, tolerance):
+    """Сравнение с baseline: список регрессий (строки)
+
+    Число APDU и статус сравниваются строго. Время - по p50, а p95 -
+    только если и прогон, и baseline сделаны не менее чем за
+    MIN_P95_ITERATIONS итераций.
+    """
+    regressions = []
+    same_latency = baseline.get("latency_scale") == report["latency_scale"]
+    check_p95 = min(report["iterations"], baseline.get("iterations", 0)) >= MIN_P95_ITERATIONS
+    for key, current in report["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        # Время сравнивается, только если задержка симулятора та же
+        current["baseline"] = base if same_latency else {"apdus": base["apdus"], "status": base["status"]}
+        if current["apdus"] > base["apdus"]:
+            regressions.append(f"{key}: APDU {base['apdus']} -> {current['apdus']}")
+        if same_latency and slower(current["p50_ms"], base["p50_ms"], tolerance):
+            regressions.append(f"{key}: p50 {base['p50_ms']} мс -> {current['p50_ms']} мс")
+        if same_latency and check_p95 and slower(current["p95_ms"], base["p95_ms"], tolerance):
+            regressions.append(f"{key}: p95 {base['p95_ms']} мс -> {current['p95_ms']} мс")
+        if current["status"] != base["status"]:
+            regressions.append(f"{key}: статус {base['status']} -> {current['status']}")
+    return regressions
+
+
+def format_delta(current, base):
+    if base is None:
+        return ""
+    if base == 0:
+        return " (=)" if current == 0 else " (новое)"
+    delta = (current - base) * 100.0 / base
+    return " (=)" if abs(delta) < 0.5 else f" ({delta:+.0f}%)"
+
+
+def print_report(report):
+    print(f"{'сценарий/операция':<38} {'APDU':>10} {'p50, мс':>16} {'p95, мс':>16}  статус")
+    for key, row in report["results"].items():
+        base = row.get("baseline", {})
+        apdus = f"{row['apdus']}{format_delta(row['apdus'], base.get('apdus'))}"
+        p50 = f"{row['p50_ms']}{format_delta(row['p50_ms'], base.get('p50_ms'))}"
+        p95 = f"{row['p95_ms']}{format_delta(row['p95_ms'], base.get('p95_ms'))}"
+        print(f"{key:<38} {apdus:>10} {p50:>16} {p95:>16}  {row['status']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк операций над картой на симуляторе")
+    parser.add_argument("-n", "--iterations", type=int, default=5, help="прогонов на пару сценарий/операция")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="множитель задержки APDU симулятора")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="только эти сценарии")
+    parser.add_argument("--operation", action="append", choices=sorted(OPERATIONS), help="только эти операции")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="файл baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результат как baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p50/p95 (доля, не меньше 5 мс)")
+    parser.add_argument("--json", action="store_true", help="вывести отчет в JSON")
+    parser.add_argument("--skip-checks", action="store_true", help="не выполнять проверки поведения")
+    args = parser.parse_args(argv)
+
+    failures = [] if args.skip_checks else run_checks()
+    report = run_benchmark(args.scenario or list(SCENARIOS), args.operation or list(OPERATIONS),
+                           args.iterations, args.latency_scale)
+    failures += report.pop("failures")
+    regressions = []
+    if args.save_baseline and failures:
+        print("Baseline не сохранен: проверки не пройдены")
+    elif args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        print(f"Baseline сохранен: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+    if args.json:
+        print(json.dumps({"report": report, "regressions": regressions, "failures": failures},
+                         indent=4, ensure_ascii=False))
+    else:
+        print_report(report)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ: {line}")
+        for line in failures:
+            print(f"ПРОВЕРКА: {line}")
+    return 1 if regressions or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Геометрия карт Mifare Classic: Mini, 1K и 4K
+
+Секторы 0-31 состоят из 4 блоков, последние 8 секторов карты 4K
+(32-39) - из 16 блоков. Трейлер - последний блок сектора. Тип карты
+определяется по ATR (PC/SC part 3, байты имени карты NN) или по SAK.
+"""
+
+BLOCK_SIZE = 16
+# Первые 32 сектора - по 4 блока, остальные - по 16
+SMALL_SECTOR_COUNT = 32
+SMALL_SECTOR_BLOCKS = 4
+LARGE_SECTOR_BLOCKS = 16
+# Группа битов доступа трейлера (C1/C2/C3 для блока 3 сектора)
+TRAILER_ACCESS_GROUP = 3
+
+
+class CardGeometry:
+    """Расположение секторов и блоков карты"""
+
+    def __init__(self, name, sector_count):
+        self.name = name
+        self.sector_count = sector_count
+        self._first_blocks = []
+        block_count = 0
+        for sector in range(sector_count):
+            self._first_blocks.append(block_count)
+            block_count += self.sector_size(sector)
+        self.block_count = block_count
+
+    def __repr__(self):
+        return f"<CardGeometry {self.name}: {self.sector_count} секторов, {self.block_count} блоков>"
+
+    @property
+    def memory_size(self):
+        """Объем памяти карты в байтах"""
+        return self.block_count * BLOCK_SIZE
+
+    def sector_size(self, sector):
+        """Число блоков сектора"""
+        return SMALL_SECTOR_BLOCKS if sector < SMALL_SECTOR_COUNT else LARGE_SECTOR_BLOCKS
+
+    def first_block(self, sector):
+        """Первый блок сектора (его адресует AUTH)"""
+        if not 0 <= sector < self.sector_count:
+            raise Exception(f"Сектор {sector} вне карты {self.name}")
+        return self._first_blocks[sector]
+
+    def sector_blocks(self, sector):
+        """Номера блоков сектора"""
+        first = self.first_block(sector)
+        return range(first, first + self.sector_size(sector))
+
+    def trailer_block(self, sector):
+        return self.first_block(sector) + self.sector_size(sector) - 1
+
+    def sector_of(self, block_num):
+        """Сектор, которому принадлежит блок"""
+        if not 0 <= block_num < self.block_count:
+            raise Exception(f"Блок {block_num} вне карты {self.name}")
+        small_blocks = SMALL_SECTOR_COUNT * SMALL_SECTOR_BLOCKS
+        if block_num < small_blocks:
+            return block_num // SMALL_SECTOR_BLOCKS
+        return SMALL_SECTOR_COUNT + (block_num - small_blocks) // LARGE_SECTOR_BLOCKS
+
+    def is_trailer(self, block_num):
+        return block_num == self.trailer_block(self.sector_of(block_num))
+
+    def access_group(self, block_num):
+        """Группа битов доступа блока (0-2 - данные, 3 - трейлер)
+
+        В секторе из 16 блоков одна группа битов относится к 5 блокам подряд.
+        """
+        sector = self.sector_of(block_num)
+        if block_num == self.trailer_block(sector):
+            return TRAILER_ACCESS_GROUP
+        index = block_num - self.first_block(sector)
+        if self.sector_size(sector) == LARGE_SECTOR_BLOCKS:
+            return index // 5
+        return index
+
+
+CLASSIC_MINI = CardGeometry("Mifare Classic Mini", 5)
+CLASSIC_1K = CardGeometry("Mifare Classic 1K", 16)
+CLASSIC_4K = CardGeometry("Mifare Classic 4K", 40)
+
+# Имя карты NN в ATR бесконтактной карты (PC/SC part 3, приложение A)
+ATR_CARD_NAMES = {
+    0x0001: CLASSIC_1K,
+    0x0002: CLASSIC_4K,
+    0x0026: CLASSIC_MINI,
+}
+# RID PC/SC в исторических байтах ATR, за ним - стандарт SS и имя карты NN NN
+PCSC_RID = [0xA0, 0x00, 0x00, 0x03, 0x06]
+
+# SAK (ответ на SELECT) карт Mifare Classic и их эмуляций
+SAK_GEOMETRIES = {
+    0x08: CLASSIC_1K,
+    0x28: CLASSIC_1K,
+    0x88: CLASSIC_1K,
+    0x09: CLASSIC_MINI,
+    0x18: CLASSIC_4K,
+    0x38: CLASSIC_4K,
+}
+
+
+def geometry_from_atr(atr):
+    """Геометрия по ATR считывателя ACR; None, если карта не распознана"""
+    atr = list(atr or [])
+    for index in range(len(atr) - len(PCSC_RID) - 2):
+        if atr[index:index + len(PCSC_RID)] == PCSC_RID:
+            name_offset = index + len(PCSC_RID) + 1
+            card_name = (atr[name_offset] << 8) | atr[name_offset + 1]
+            return ATR_CARD_NAMES.get(card_name)
+    return None
+
+
+def geometry_from_sak(sak):
+    """Геометрия по SAK; None, если это не Mifare Classic"""
+    return SAK_GEOMETRIES.get(sak)
+
+
+def geometry_for_size(size):
+    """Геометрия по размеру дампа в байтах"""
+    for geometry in (CLASSIC_MINI, CLASSIC_1K, CLASSIC_4K):
+        if geometry.memory_size == size:
+            return geometry
+    raise Exception(f"Неверный размер дампа: {size} байт (ожидается 320, 1024 или 4096)")
+
+
+def detect_geometry(atr=None, sak=None, default=CLASSIC_1K):
+    """Геометрия карты по ATR, затем по SAK; если не распознана - default"""
+    return geometry_from_atr(atr) or geometry_from_sak(sak) or default
@@ -0,0 +1,126 @@
+"""Образ памяти карты Mifare Classic в одном bytearray
+
+Блоки и секторы доступны как memoryview без копирования, известные
+(прочитанные или записанные) блоки отмечены битовой маской. Образ
+сохраняется в стандартный бинарный дамп .mfd и читается из него.
+"""
+from collections import namedtuple
+from card_geometry import BLOCK_SIZE, CLASSIC_1K, geometry_for_size
+
+# Поля трейлера - memoryview на байты образа
+Trailer = namedtuple("Trailer", "key_a access_bits user_byte key_b")
+
+
+class CardImage:
+    """Память карты: bytearray block_count * 16 байт и маска известных блоков
+
+    Размер и расположение секторов задает геометрия карты (Mini, 1K, 4K):
+    образ карты 4K занимает 4 КБ.
+    """
+
+    def __init__(self, geometry=CLASSIC_1K, uid=None):
+        self.geometry = geometry
+        self.block_count = geometry.block_count
+        self.data = bytearray(geometry.memory_size)
+        self.view = memoryview(self.data)
+        # Бит N установлен - содержимое блока N известно
+        self.known_mask = 0
+        self.uid = uid
+
+    @property
+    def sector_count(self):
+        return self.geometry.sector_count
+
+    @property
+    def full_mask(self):
+        return (1 << self.block_count) - 1
+
+    @property
+    def unknown_mask(self):
+        return self.full_mask & ~self.known_mask
+
+    def sector_blocks(self, sector):
+        """Номера блоков сектора"""
+        return self.geometry.sector_blocks(sector)
+
+    def sector_of(self, block_num):
+        return self.geometry.sector_of(block_num)
+
+    def trailer_block(self, sector):
+        return self.geometry.trailer_block(sector)
+
+    def is_trailer(self, block_num):
+        return self.geometry.is_trailer(block_num)
+
+    def block(self, block_num):
+        """Блок как memoryview (16 байт, без копирования)"""
+        offset = block_num * BLOCK_SIZE
+        return self.view[offset:offset + BLOCK_SIZE]
+
+    def sector(self, sector):
+        """Все блоки сектора как один memoryview"""
+        blocks = self.sector_blocks(sector)
+        return self.view[blocks[0] * BLOCK_SIZE:(blocks[-1] + 1) * BLOCK_SIZE]
+
+    def set_block(self, block_num, data):
+        """Запись 16 байт блока в образ и отметка блока известным"""
+        if len(data) != BLOCK_SIZE:
+            raise Exception(f"Для блока {block_num} нужно 16 байт, получено {len(data)}")
+        self.block(block_num)[:] = bytes(data)
+        self.known_mask |= 1 << block_num
+
+    def forget_block(self, block_num):
+        """Содержимое блока неизвестно (например, чтение не удалось)"""
+        self.known_mask &= ~(1 << block_num)
+
+    def is_known(self, block_num):
+        return bool(self.known_mask >> block_num & 1)
+
+    def known_blocks(self, sector=None):
+        """Известные блоки (всей карты или сектора) по возрастанию"""
+        blocks = self.sector_blocks(sector) if sector is not None else range(self.block_count)
+        return [block_num for block_num in blocks if self.is_known(block_num)]
+
+    def block_hex(self, block_num):
+        """Блок строкой "AA BB ..." для интерфейса"""
+        return self.block(block_num).hex(" ").upper()
+
+    def trailer(self, sector):
+        """Разобранный трейлер сектора"""
+        block = self.block(self.trailer_block(sector))
+        return Trailer(block[0:6], block[6:9], block[9:10], block[10:16])
+
+    def trailer_fields(self, sector):
+        """Поля трейлера hex строками (биты доступа - 4 байта, как в настройках)"""
+        block = self.block(self.trailer_block(sector))
+        return {
+            "key_a": block[0:6].hex().upper(),
+            "access_bits": block[6:10].hex().upper(),
+            "key_b": block[10:16].hex().upper(),
+        }
+
+    def to_mfd(self):
+        """Бинарный дамп .mfd (вся память подряд; неизвестные блоки - нули)"""
+        return bytes(self.data)
+
+    @classmethod
+    def from_mfd(cls, raw):
+        """Образ из бинарного дампа .mfd (все блоки считаются известными)
+
+        Тип карты определяется по размеру дампа.
+        """
+        image = cls(geometry_for_size(len(raw)))
+        image.data[:] = raw
+        image.known_mask = image.full_mask
+        # UID - первые 4 байта блока производителя
+        image.uid = bytes(raw[0:4]).hex().upper()
+        return image
+
+    def save_mfd(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_mfd())
+
+    @classmethod
+    def load_mfd(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_mfd(f.read())
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+
+# Файл с выученными ключами карт и статистикой попаданий
+KEYMAP_FILE = "mifare_keymap.json"
+TRANSPORT_KEY = "FFFFFFFFFFFF"
+KEY_TYPE_CODES = {"A": 0x60, "B": 0x61}
+
+
+def is_valid_key(key):
+    """Проверка ключа: ровно 12 hex символов"""
+    return len(key) == 12 and all(c in "0123456789ABCDEF" for c in key.upper())
+
+
+class Keyring:
+    """Общий набор ключей для всех операций
+
+    Состоит из именованных ключей (из настроек), глобальной статистики
+    удачных аутентификаций, по которой упорядочиваются ключи вне списка
+    операции, и сохраняемой карты "UID + сектор -> ключ, который подошел". Биты
+    доступа секторов карт запоминаются только на время работы программы:
+    трейлер могли изменить другим устройством.
+    """
+
+    def __init__(self, keymap_file=KEYMAP_FILE):
+        self.keymap_file = keymap_file
+        self._lock = threading.Lock()
+        # Запись файла из нескольких потоков (пул, производство, сервер) - по очереди
+        self._save_lock = threading.Lock()
+        self.named_keys = {"transport": TRANSPORT_KEY}
+        self.hits = {}
+        self.cards = {}
+        # UID -> {сектор: биты доступа hex}, не сохраняется
+        self.access = {}
+        self.dirty = False
+        self.load()
+
+    def set_keys(self, config):
+        """Обновление именованных ключей из конфигурации"""
+        named_keys = {"transport": TRANSPORT_KEY}
+        named_keys["default_key_a"] = config.get("default_key_a", TRANSPORT_KEY).upper()
+        named_keys["default_key_b"] = config.get("default_key_b", TRANSPORT_KEY).upper()
+        for name, key in config.get("keyring", {}).items():
+            if is_valid_key(key):
+                named_keys[name] = key.upper()
+        self.named_keys = named_keys
+
+    def keys(self):
+        """Уникальные ключи набора в порядке добавления"""
+        unique = []
+        for key in self.named_keys.values():
+            if key not in unique:
+                unique.append(key)
+        return unique
+
+    def candidates(self, uid, sector, preferred=(), key_types=("A", "B")):
+        """Порядок перебора (тип ключа, ключ) для сектора карты
+
+        Первым идет ключ, который уже подошел к этому сектору этой карты,
+        затем предпочтительные ключи операции в заданном ею порядке и
+        остальные ключи набора. Число удачных аутентификаций упорядочивает
+        только остальные ключи; при равенстве сохраняется порядок набора.
+        Порядок ключей операции статистика не меняет намеренно: он задан
+        логикой операции (decode сначала пробует текущий ключ из настроек,
+        encode - транспортный), а глобальные попадания по всем картам ее
+        не знают.
+        """
+        ordered = []
+        for key_type, key in preferred:
+            if key_type in key_types and (key_type, key.upper()) not in ordered:
+                ordered.append((key_type, key.upper()))
+        rest = []
+        for key_type in key_types:
+            for key in self.keys():
+                if (key_type, key) not in ordered and (key_type, key) not in rest:
+                    rest.append((key_type, key))
+        rest.sort(key=lambda item: -self.hits.get(f"{item[0]}:{item[1]}", 0))
+        ordered.extend(rest)
+        known = self.known_key(uid, sector)
+        if known and known[0] in key_types:
+            if known in ordered:
+                ordered.remove(known)
+            ordered.insert(0, known)
+        return ordered
+
+    def known_key(self, uid, sector):
+        """Ключ, который подошел к сектору карты в прошлый раз"""
+        if not uid:
+            return None
+        known = self.cards.get(uid, {}).get(str(sector))
+        return (known[0], known[1]) if known else None
+
+    def record_success(self, uid, sector, key_type, key):
+        """Учет удачной аутентификации"""
+        key = key.upper()
+        with self._lock:
+            name = f"{key_type}:{key}"
+            self.hits[name] = self.hits.get(name, 0) + 1
+            self.dirty = True
+            if uid:
+                self.cards.setdefault(uid, {})[str(sector)] = [key_type, key]
+
+    def record_failure(self, uid, sector, key_type, key):
+        """Неудачная аутентификация: забываем устаревший ключ сектора"""
+        if self.known_key(uid, sector) == (key_type, key.upper()):
+            with self._lock:
+                self.cards[uid].pop(str(sector), None)
+                self.dirty = True
+
+    def learn(self, uid, sector, key_type, key):
+        """Запоминание ключа, записанного в трейлер сектора"""
+        if uid:
+            with self._lock:
+                self.cards.setdefault(uid, {})[str(sector)] = [key_type, key.upper()]
+                self.dirty = True
+
+    def known_access(self, uid, sector):
+        """Биты доступа сектора карты, если трейлер уже читали или записывали"""
+        if not uid:
+            return None
+        return self.access.get(uid, {}).get(sector)
+
+    def learn_access(self, uid, sector, access_bits):
+        """Запоминание битов доступа сектора карты"""
+        if uid:
+            with self._lock:
+                self.access.setdefault(uid, {})[sector] = access_bits.upper()
+
+    def load(self):
+        """Загрузка карты ключей из файла"""
+        try:
+            if os.path.exists(self.keymap_file):
+                with open(self.keymap_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.hits = data.get("hits", {})
+                self.cards = data.get("cards", {})
+        except Exception as e:
+            print(f"Ошибка загрузки карты ключей: {e}")
+
+    def save(self):
+        """Сохранение карты ключей, если она изменилась
+
+        Снимок и запись с заменой файла выполняются под одной блокировкой:
+        иначе два потока пишут один временный файл, и после замены в нем
+        может оказаться смесь двух JSON.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self.dirty:
+                    return
+                data = {"hits": dict(self.hits), "cards": {uid: dict(sectors) for uid, sectors in self.cards.items()}}
+                self.dirty = False
+            try:
+                tmp_file = self.keymap_file + ".tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_file, self.keymap_file)
+            except Exception as e:
+                print(f"Ошибка сохранения карты ключей: {e}")
+
+    def get_stats(self):
+        """Именованные ключи, статистика попаданий и число известных карт"""
+        return {
+            "named_keys": dict(self.named_keys),
+            "hits": dict(self.hits),
+            "known_cards": len(self.cards),
+        }
@@ -0,0 +1,575 @@
+from card_keyring import TRANSPORT_KEY
+from card_image import CardImage
+from checkpoints import Checkpoint, TRANSIENT_ERRORS
+from access_bits import SectorPermissions, validate_access_bits
+from sector_transaction import SectorTransaction
+import write_planner
+
+ZERO_BLOCK = bytes(16)
+# Состояния блока очистки для отчета write_planner
+DELTA_CLEAR_STATUSES = {
+    write_planner.WRITTEN: "cleared",
+    write_planner.SKIPPED: "unchanged",
+    write_planner.VERIFY_FAILED: "verify_error",
+    write_planner.ERROR: "error",
+}
+# Блок 60 настроечной карты одинаков для обоих режимов
+SETUP_BLOCK_60_HEX = "484E31394D2D31000000000000000000"
+
+
+class OperationCancelled(Exception):
+    """Операция отменена пользователем"""
+
+
+class OperationContext:
+    """Все, что нужно операции над картой: соединение, настройки, набор ключей и уведомления"""
+
+    def __init__(self, connection, config, keyring, notify=None, progress=None, cancel_event=None,
+                 emit=None, checkpoint=None):
+        self.connection = connection
+        self.config = config
+        self.keyring = keyring
+        self.notify = notify or (lambda message: None)
+        self.progress = progress or (lambda done, total, message: None)
+        self.cancel_event = cancel_event
+        # Структурированные события по ходу операции (например, готовый сектор)
+        self.emit = emit or (lambda event: None)
+        # Тип карты (Mini, 1K, 4K) определен пулом по ATR
+        self.geometry = connection.geometry
+        # Образ карты: все прочитанные и записанные операцией блоки
+        self.image = CardImage(self.geometry, uid=connection.uid)
+        # Готовые секторы прерванного запуска той же операции над этой картой
+        self.checkpoint = checkpoint or Checkpoint(None, connection.uid)
+        self.checkpoint.restore(self.image)
+
+    def check_cancelled(self):
+        """Прерывание операции, если ее отменили (вызывается между секторами)"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise OperationCancelled("Операция отменена")
+
+    @property
+    def uid(self):
+        return self.connection.uid
+
+    @property
+    def delta_writes(self):
+        """Записывать только отличающиеся блоки с проверкой чтением"""
+        return bool(self.config.get("delta_writes", False))
+
+    def resume_sectors(self, operation):
+        """Незавершенные секторы карты; готовые секторы снова отправляются событием "sector"
+        """
+        total = self.geometry.sector_count
+        start = self.checkpoint.next_sector
+        for record in self.checkpoint.sectors:
+            self.emit({"type": "sector", "operation": operation, "resumed": True, **record})
+        if start:
+            self.notify(f"Продолжение с сектора {start}: секторы 0-{start - 1} уже готовы")
+        return range(start, total)
+
+    def transaction(self, sector, preferred=(), key_types=("A",)):
+        """Открытие транзакции сектора (аутентификация выполняется сразу)"""
+        # Сектора нет на карте (например, сектор 15 у Mifare Classic Mini) - ошибка, а не "ключ не подошел"
+        self.geometry.first_block(sector)
+        transaction = SectorTransaction(self.connection, self.keyring, sector, preferred, key_types)
+        transaction.open()
+        return transaction
+
+    def sector_permissions(self, sector):
+        """Права сектора по известному трейлеру (прочитанному в образ или запомненному)
+
+        None - биты доступа сектора неизвестны.
+        """
+        trailer_block = self.geometry.trailer_block(sector)
+        if self.image.is_known(trailer_block):
+            permissions = SectorPermissions.from_trailer(sector, self.image.block(trailer_block), self.geometry)
+            if permissions:
+                self.keyring.learn_access(self.uid, sector, permissions.access_bits)
+                return permissions
+        access_bits = self.keyring.known_access(self.uid, sector)
+        return SectorPermissions(sector, access_bits, self.geometry) if access_bits else None
+
+    def switch_key_type(self, transaction, key_type):
+        """Повторная аутентификация сектора ключом другого типа; при неудаче - прежним ключом"""
+        previous = (transaction.key_type, transaction.key)
+        transaction.key_types = (key_type,)
+        if transaction.open():
+            return True
+        transaction.authenticate(*previous)
+        return False
+
+
+def new_result(**extra):
+    """Пустой результат операции"""
+    result = {"status": "success", "data": "", "error": ""}
+    result.update(extra)
+    return result
+
+
+def byte2hex(byte_val):
+    """Преобразование байта в hex строку"""
+    return f"{byte_val:02X}"
+
+
+def trailer_location(config):
+    """Сектор и трейлерный блок для блока по умолчанию из настроек"""
+    block = int(config.get("default_block", "62"))
+    if block not in [33, 62]:
+        raise Exception("Номер блока по умолчанию должен быть 33 или 62")
+    if block == 62:
+        return 15, 63  # Трейлерный блок сектора 15
+    return 8, 35  # Трейлерный блок сектора 8
+
+
+def build_setup_blocks(lock_no, wait_time, sound_mode, alarm_mode, lock_mode, password=TRANSPORT_KEY):
+    """Данные блоков 60 и 61 настроечной карты (аналог Delphi кода)"""
+    data_block_60 = bytes.fromhex(SETUP_BLOCK_60_HEX)
+    if int(lock_mode) == 0:
+        # Нормальный режим
+        s = "AA"
+        # Формирование байта флагов
+        b = 0
+        b |= 0x10  # Установка бита 4
+        b |= 0x20  # Установка бита 5
+        # Режим звука
+        sound_mode = int(sound_mode)
+        if sound_mode == 1:
+            b |= 0x02
+        elif sound_mode == 2:
+            b |= 0x01
+        elif sound_mode == 3:
+            b |= 0x03
+        # Режим тревоги
+        alarm_mode = int(alarm_mode)
+        if alarm_mode == 1:
+            b |= 0x80
+        elif alarm_mode == 2:
+            b |= 0xC0
+        s += byte2hex(b)
+        s += "AA"
+        # Режим замка (нормальный)
+        s += byte2hex(0)
+        # Время ожидания
+        s += byte2hex(wait_time & 0xFF)
+        s += "00"
+        # Номер замка - записываем в правильном порядке (little-endian)
+        cabno = lock_no & 0xFFFF
+        s += byte2hex(cabno & 0xFF)  # LoByte первым
+        s += byte2hex((cabno >> 8) & 0xFF)  # HiByte вторым
+        # Фиксированный пароль
+        s += password
+        s += "00"
+        # Блок всегда 16 байт: недостающие байты дополняются нулями
+        return data_block_60, bytes.fromhex(s.ljust(32, "0"))
+    # Специальный режим - точные данные как в примерах
+    # Блок 61: AA32AA020600[номер_замка]00[9F792063F24B3E00]
+    # Например для замка 2: AA32AA02060002009F792063F24B3E00
+    header = "AA32AA020600"
+    # Номер замка (1 байт) + 00
+    middle = byte2hex(lock_no & 0xFF) + "00"
+    footer = "9F792063F24B3E00"
+    return data_block_60, bytes.fromhex(header + middle + footer)
+
+
+def status_word(sw1, sw2):
+    """Слово состояния ответа в виде строки '63 00'"""
+    return f"{sw1:02X} {sw2:02X}"
+
+
+def dump_card(ctx):
+    """Функция дампа карты
+
+    Каждый прочитанный сектор сразу отправляется событием "sector";
+    итоговый результат содержит список секторов, а не готовый текст.
+    """
+    result = new_result()
+    config = ctx.config
+    # Ключи в порядке приоритета (после известного для карты ключа)
+    key_attempts = [
+        ("A", TRANSPORT_KEY),
+        ("A", config.get("default_key_a", TRANSPORT_KEY)),
+        ("B", TRANSPORT_KEY),
+        ("B", config.get("default_key_b", TRANSPORT_KEY))
+    ]
+    image = ctx.image
+    sectors = ctx.checkpoint.sectors
+    sector_count = ctx.geometry.sector_count
+    for sector in ctx.resume_sectors("dump"):
+        ctx.check_cancelled()
+        ctx.progress(sector, sector_count, f"Сектор {sector}")
+        transaction = ctx.transaction(sector, key_attempts, ("A", "B"))
+        trailer_read = None
+        permissions = None
+        if transaction.authenticated:
+            # Трейлер читается первым: по битам доступа видно, какие блоки каким ключом читать
+            trailer_read = transaction.read_into(image, transaction.trailer_block)
+            permissions = ctx.sector_permissions(sector)
+            data_blocks = [block_num for block_num in transaction.blocks
+                           if block_num != transaction.trailer_block]
+            if permissions:
+                # Текущий тип ключа - первым: при равенстве повторная аутентификация не нужна
+                key_types = (transaction.key_type,) + tuple(t for t in "AB" if t != transaction.key_type)
+                key_type = permissions.best_key_type("read", data_blocks, key_types)
+                if key_type != transaction.key_type:
+                    ctx.switch_key_type(transaction, key_type)
+        record = {"sector": sector, "key_type": transaction.key_type, "key": transaction.key, "blocks": []}
+        for block_num in transaction.blocks:
+            if not transaction.authenticated:
+                record["blocks"].append({"block": block_num, "data": None, "sw": None})
+                continue
+            if block_num == transaction.trailer_block:
+                ok, sw1, sw2 = trailer_read
+            elif permissions and not permissions.can_read(block_num, transaction.key_type):
+                # Биты доступа запрещают чтение этим ключом - APDU не отправляется
+                record["blocks"].append({"block": block_num, "data": None, "sw": None, "denied": True})
+                continue
+            else:
+                # Блоки сектора читаются под одной аутентификацией
+                ok, sw1, sw2 = transaction.read_into(image, block_num)
+            data = image.block_hex(block_num) if ok else None
+            record["blocks"].append({"block": block_num, "data": data, "sw": status_word(sw1, sw2)})
+        # Если трейлер прочитан, разбираем его структуру
+        if image.is_known(transaction.trailer_block):
+            record["trailer"] = image.trailer_fields(sector)
+        ctx.checkpoint.complete_sector(record, image)
+        ctx.emit({"type": "sector", "operation": "dump", **record})
+    ctx.progress(sector_count, sector_count, "Дамп завершен")
+    result["card"] = ctx.geometry.name
+    result["sectors"] = list(sectors)
+    result["summary"] = {
+        "sectors_authenticated": sum(1 for record in sectors if record["key"]),
+        "blocks_read": sum(1 for record in sectors for block in record["blocks"] if block["data"]),
+    }
+    return result
+
+
+def plan_sector_writes(ctx, transaction, permissions, data_blocks):
+    """Блоки сектора, запись которых карта отклонит
+
+    Если другим типом ключа можно записать больше блоков, сектор
+    аутентифицируется им. Блок производителя (0) не записывается никогда.
+    """
+    if permissions is None:
+        return {block_num for block_num in data_blocks if block_num == 0}
+    key_types = (transaction.key_type,) + tuple(t for t in "AB" if t != transaction.key_type)
+    key_type = permissions.best_key_type("write", data_blocks, key_types)
+    if key_type != transaction.key_type:
+        ctx.switch_key_type(transaction, key_type)
+    return {block_num for block_num in data_blocks
+            if block_num == 0 or not permissions.can_write(block_num, transaction.key_type)}
+
+
+def clear_all_blocks(ctx):
+    """Очистка всех блоков карты (заполнение нулями)
+
+    Как и дамп, отправляет событие "sector" после каждого сектора.
+    Состояние блока: cleared, skipped (трейлер), forbidden (запись запрещена
+    битами доступа или это блок производителя), auth_error или error;
+    в режиме delta_writes еще unchanged (блок уже нулевой) и verify_error.
+    """
+    result = new_result()
+    config = ctx.config
+    preferred = [
+        ("A", TRANSPORT_KEY),
+        ("A", config.get("default_key_a", TRANSPORT_KEY)),
+        ("B", TRANSPORT_KEY),
+        ("B", config.get("default_key_b", TRANSPORT_KEY))
+    ]
+    delta = ctx.delta_writes
+    sectors = ctx.checkpoint.sectors
+    sector_count = ctx.geometry.sector_count
+    # Очищаем все секторы карты, одна аутентификация на сектор (в том числе на 16 блоков карты 4K)
+    for sector in ctx.resume_sectors("clear"):
+        ctx.check_cancelled()
+        ctx.progress(sector, sector_count, f"Сектор {sector}")
+        trailer_block = ctx.geometry.trailer_block(sector)
+        data_blocks = [block_num for block_num in ctx.geometry.sector_blocks(sector) if block_num != trailer_block]
+        # По известным битам доступа сразу выбирается тип ключа, которым блоки можно записать
+        permissions = ctx.sector_permissions(sector)
+        key_type = permissions.best_key_type("write", data_blocks) if permissions else "A"
+        transaction = ctx.transaction(sector, preferred, (key_type,))
+        if not transaction.authenticated and key_type != "A":
+            transaction = ctx.transaction(sector, preferred)
+        forbidden = set(data_blocks)
+        if transaction.authenticated:
+            forbidden = plan_sector_writes(ctx, transaction, permissions, data_blocks)
+        record = {"sector": sector, "key_type": transaction.key_type, "key": transaction.key, "blocks": []}
+        delta_report = {}
+        if delta and transaction.authenticated:
+            # Записываются только блоки, которые еще не нулевые
+            delta_report = write_planner.write_sector_delta(
+                transaction, {block_num: ZERO_BLOCK for block_num in data_blocks
+                              if block_num not in forbidden}, image=ctx.image)
+        for block_num in transaction.blocks:
+            block = {"block": block_num}
+            # Пропускаем трейлерные блоки, так как их сложно очистить
+            if block_num == transaction.trailer_block:
+                block["status"] = "skipped"
+            elif not transaction.authenticated:
+                block["status"] = "auth_error"
+            elif block_num in forbidden:
+                # Карта все равно отклонит запись - APDU не отправляется
+                block["status"] = "forbidden"
+            elif delta:
+                entry = delta_report[block_num]
+                block["status"] = DELTA_CLEAR_STATUSES[entry["status"]]
+                block["sw"] = entry["sw"]
+            else:
+                try:
+                    ok, sw1, sw2 = transaction.write_block(block_num, ZERO_BLOCK)
+                    if not ok and permissions is None:
+                        # Первый отказ в секторе с неизвестными правами: читаем трейлер
+                        # и планируем остальные блоки сектора по битам доступа
+                        transaction.read_into(ctx.image, transaction.trailer_block)
+                        permissions = ctx.sector_permissions(sector)
+                        forbidden = plan_sector_writes(ctx, transaction, permissions, data_blocks)
+                        if permissions and block_num not in forbidden:
+                            ok, sw1, sw2 = transaction.write_block(block_num, ZERO_BLOCK)
+                    if ok:
+                        ctx.image.set_block(block_num, ZERO_BLOCK)
+                    block["status"] = "cleared" if ok else "forbidden" if block_num in forbidden else "error"
+                    block["sw"] = status_word(sw1, sw2)
+                except TRANSIENT_ERRORS:
+                    # Карта потеряна - сектор не готов, операцию продолжит повтор
+                    raise
+                except Exception as e:
+                    block["status"] = "error"
+                    block["message"] = str(e)
+            record["blocks"].append(block)
+        # Ключ мог смениться по битам доступа сектора
+        record["key_type"], record["key"] = transaction.key_type, transaction.key
+        ctx.checkpoint.complete_sector(record, ctx.image)
+        ctx.emit({"type": "sector", "operation": "clear", **record})
+    ctx.progress(sector_count, sector_count, "Очистка завершена")
+    result["card"] = ctx.geometry.name
+    statuses = [block["status"] for record in sectors for block in record["blocks"]]
+    result["sectors"] = list(sectors)
+    result["summary"] = {
+        "cleared": statuses.count("cleared"),
+        "errors": sum(statuses.count(status) for status in ("auth_error", "error", "verify_error")),
+        "forbidden": statuses.count("forbidden"),
+    }
+    if delta:
+        result["summary"]["unchanged"] = statuses.count("unchanged")
+    return result
+
+
+def write_trailer(ctx, result, key_a, access_bits, key_b, preferred):
+    """Запись трейлера сектора блока по умолчанию; возвращает (транзакция, успех)"""
+    sector, trailer_block = trailer_location(ctx.config)
+    try:
+        # Несогласованные биты доступа навсегда заблокируют сектор - не пишем их
+        validate_access_bits(access_bits)
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+        return None, False
+    new_data = bytes.fromhex(key_a + access_bits + key_b)
+    result["data"] += f"Попытка записи в блок {trailer_block} (сектор {sector})\n"
+    result["data"] += f"Данные для записи: {new_data.hex(' ').upper()}\n"
+    transaction = ctx.transaction(sector, preferred)
+    if not transaction.authenticated:
+        result["status"] = "error"
+        result["error"] = "Не удалось аутентифицироваться ни с одним ключом"
+        return transaction, False
+    result["data"] += f"Аутентификация с ключом {transaction.key} успешна\n"
+    if ctx.delta_writes:
+        entry = write_planner.write_sector_delta(transaction, {trailer_block: new_data},
+                                                 image=ctx.image)[trailer_block]
+        result["delta"] = write_planner.summarize([{trailer_block: entry}])
+        if entry["status"] == write_planner.SKIPPED:
+            result["data"] += f"Блок {trailer_block} уже содержит эти данные, запись пропущена\n"
+        elif entry["status"] != write_planner.WRITTEN:
+            result["status"] = "error"
+            result["error"] = f"Ошибка записи блока {trailer_block}: {entry['status']} {entry['sw']}"
+            return transaction, False
+        else:
+            result["data"] += f"Данные записаны в блок {trailer_block} и проверены чтением\n"
+    else:
+        ok, sw1, sw2 = transaction.write_block(trailer_block, new_data)
+        if not ok:
+            result["status"] = "error"
+            result["error"] = f"Ошибка записи: {hex(sw1)} {hex(sw2)}"
+            return transaction, False
+        ctx.image.set_block(trailer_block, new_data)
+        result["data"] += f"Данные успешно записаны в блок {trailer_block}\n"
+    result["data"] += f"Ключ A: {key_a}\n"
+    result["data"] += f"Биты доступа: {access_bits}\n"
+    result["data"] += f"Ключ B: {key_b}\n"
+    # Запоминаем новый ключ и биты доступа сектора для этой карты
+    ctx.keyring.learn(ctx.uid, sector, "A", key_a)
+    ctx.keyring.learn_access(ctx.uid, sector, access_bits)
+    return transaction, True
+
+
+def encode(ctx):
+    """Функция кодирования (записи ключей)"""
+    result = new_result()
+    config = ctx.config
+    key_a = config.get("default_key_a", TRANSPORT_KEY)
+    access_bits = config.get("default_access_bits", "FF078069")
+    key_b = config.get("default_key_b", TRANSPORT_KEY)
+    result["data"] += f"Новый ключ A: {key_a}\n"
+    # Известный ключ карты, затем ключ по умолчанию и ключ из настроек
+    transaction, ok = write_trailer(ctx, result, key_a, access_bits, key_b,
+                                    [("A", TRANSPORT_KEY), ("A", key_a)])
+    if not ok:
+        return result
+    # Проверяем, что новый ключ работает, сразу после записи
+    if transaction.authenticate("A", key_a):
+        result["data"] += "Новый ключ успешно работает для аутентификации\n"
+        ctx.notify(f"Карта закодирована паролем: {key_a}")
+    else:
+        result["data"] += "ВНИМАНИЕ: Новый ключ не работает для аутентификации!\n"
+    return result
+
+
+def decode(ctx):
+    """Функция декодирования (восстановления ключа FFFFFFFFFFFF)"""
+    result = new_result()
+    config = ctx.config
+    access_bits = config.get("default_access_bits", "FF078069")
+    current_key = config.get("default_key_a", TRANSPORT_KEY)
+    result["data"] += "Восстановление ключей F\n"
+    # Известный ключ карты, затем текущий ключ из настроек и ключ F
+    transaction, ok = write_trailer(ctx, result, TRANSPORT_KEY, access_bits, TRANSPORT_KEY,
+                                    [("A", current_key), ("A", TRANSPORT_KEY)])
+    if not ok:
+        return result
+    # Проверяем, что ключ F работает
+    if transaction.authenticate("A", TRANSPORT_KEY):
+        result["data"] += "Ключ F успешно работает\n"
+        ctx.notify("Карта успешно декодирована")
+    else:
+        result["data"] += "ВНИМАНИЕ: Ключ F не работает!\n"
+    return result
+
+
+def write_setup_card(ctx, lock_no, wait_time, sound_mode, alarm_mode, lock_mode, cb_auto_1):
+    """Запись настроечной карты с фиксированным паролем FFFFFFFFFFFF"""
+    result = new_result(new_lock_no=lock_no)
+    try:
+        lock_no = int(lock_no)
+        wait_time = int(wait_time)
+    except ValueError:
+        result["status"] = "error"
+        result["error"] = "Ошибка: Неверный формат номера замка или времени"
+        return result
+    password = TRANSPORT_KEY
+    result["data"] += f"Используется фиксированный пароль: {password}\n"
+    data_block_60, data_block_61 = build_setup_blocks(lock_no, wait_time, sound_mode,
+                                                      alarm_mode, lock_mode, password)
+    if int(lock_mode) != 0:
+        result["data"] += "Используется специальный режим записи\n"
+        result["data"] += f"Номер замка: {lock_no} (0x{lock_no:02X})\n"
+    result["data"] += f"Данные блок 61: {data_block_61.hex(' ').upper()}\n"
+    result["data"] += f"Данные блок 60: {data_block_60.hex(' ').upper()}\n"
+    # Блоки 60 и 61 лежат в секторе 15 - одна аутентификация на оба
+    transaction = ctx.transaction(15, [("A", password)])
+    if not transaction.authenticated:
+        result["status"] = "error"
+        result["error"] = "Ошибка аутентификации сектора 15"
+        return result
+    result["data"] += "Аутентификация сектора 15 успешна\n"
+    if ctx.delta_writes:
+        report = write_planner.write_sector_delta(transaction, {61: data_block_61, 60: data_block_60},
+                                                  image=ctx.image)
+        result["delta"] = write_planner.summarize([report])
+        for block_num in (61, 60):
+            entry = report[block_num]
+            if entry["status"] not in (write_planner.WRITTEN, write_planner.SKIPPED):
+                result["status"] = "error"
+                result["error"] = f"Ошибка записи в блок {block_num}: {entry['status']} {entry['sw']}"
+                return result
+            if entry["status"] == write_planner.SKIPPED:
+                result["data"] += f"Блок {block_num} уже содержит эти данные, запись пропущена\n"
+            else:
+                result["data"] += f"Данные записаны в блок {block_num} и проверены чтением\n"
+    else:
+        for block_num, data in ((61, data_block_61), (60, data_block_60)):
+            ok, sw1, sw2 = transaction.write_block(block_num, data)
+            if not ok:
+                result["status"] = "error"
+                result["error"] = f"Ошибка записи в блок {block_num}: {hex(sw1)} {hex(sw2)}"
+                return result
+            ctx.image.set_block(block_num, data)
+            result["data"] += f"Данные успешно записаны в блок {block_num}\n"
+    result["data"] += f"Карта успешно записана. Замок: {lock_no}\n"
+    ctx.notify(f"Настроечная карта успешно записана, номер замка {lock_no}")
+    # Автоинкремент номера замка
+    if cb_auto_1:
+        result["new_lock_no"] = lock_no + 1
+    return result
+
+
+def clear_setup_blocks(ctx):
+    """Очистка блоков 60 и 61 (заполнение нулями) с паролем из конфигурации"""
+    result = new_result()
+    config_password = ctx.config.get("default_key_a", TRANSPORT_KEY)
+    result["data"] += f"Используется пароль из конфигурации для аутентификации: {config_password}\n"
+    result["data"] += "Очистка блоков 60 и 61\n"
+    result["data"] += f"Данные для очистки: {ZERO_BLOCK.hex(' ').upper()}\n"
+    # Известный ключ карты, затем пароль из конфигурации и фиксированный ключ
+    transaction = ctx.transaction(15, [("A", config_password), ("A", TRANSPORT_KEY)])
+    if not transaction.authenticated:
+        result["status"] = "error"
+        result["error"] = "Ошибка аутентификации сектора 15"
+        return result
+    result["data"] += f"Аутентификация сектора 15 успешна (ключ {transaction.key})\n"
+    if ctx.delta_writes:
+        report = write_planner.write_sector_delta(transaction, {61: ZERO_BLOCK, 60: ZERO_BLOCK},
+                                                  image=ctx.image)
+        result["delta"] = write_planner.summarize([report])
+        for block_num in (61, 60):
+            entry = report[block_num]
+            if entry["status"] not in (write_planner.WRITTEN, write_planner.SKIPPED):
+                result["status"] = "error"
+                result["error"] = f"Ошибка очистки блока {block_num}: {entry['status']} {entry['sw']}"
+                return result
+            if entry["status"] == write_planner.SKIPPED:
+                result["data"] += f"Блок {block_num} уже пуст, запись пропущена\n"
+            else:
+                result["data"] += f"Блок {block_num} очищен и проверен чтением\n"
+        return result
+    for block_num in (61, 60):
+        ok, sw1, sw2 = transaction.write_block(block_num, ZERO_BLOCK)
+        if not ok:
+            result["status"] = "error"
+            result["error"] = f"Ошибка очистки блока {block_num}: {hex(sw1)} {hex(sw2)}"
+            return result
+        ctx.image.set_block(block_num, ZERO_BLOCK)
+        result["data"] += f"Блок {block_num} успешно очищен\n"
+    return result
+
+
+def check_lock_number(ctx):
+    """Проверка номера замка в блоке 62"""
+    result = new_result()
+    result["data"] += "Проверка номера замка в блоке 62...\n"
+    # Блок 62 находится в секторе 15
+    sector = 15
+    block_num = 62
+    # Сначала известный ключ карты, затем стандартный ключ и ключ A из настроек
+    preferred = [("A", TRANSPORT_KEY), ("A", ctx.config.get("default_key_a", TRANSPORT_KEY))]
+    transaction = ctx.transaction(sector, preferred)
+    if not transaction.authenticated:
+        tried = ", ".join(key for _, key in ctx.keyring.candidates(ctx.uid, sector, preferred, ("A",)))
+        result["status"] = "error"
+        result["error"] = f"Ошибка аутентификации сектора {sector} для чтения блока {block_num}. Пробовали ключи: {tried}"
+        return result
+    result["data"] += f"Аутентификация успешна с ключом {transaction.key}\n"
+    ok, sw1, sw2 = transaction.read_into(ctx.image, block_num)
+    if not ok:
+        result["status"] = "error"
+        result["error"] = f"Ошибка чтения блока {block_num}: {sw1:02X} {sw2:02X}"
+        return result
+    block = ctx.image.block(block_num)
+    result["data"] += f"Данные из блока {block_num}: {ctx.image.block_hex(block_num)}\n"
+    # Номер замка - один байт по смещению 4, например
+    # "0000000005000000 484E313908060000" - замок номер 5
+    lock_number_byte = block[4]
+    result["data"] += f"Номер замка (из байта 4): {lock_number_byte}\n"
+    result["data"] += f"  Байт: 0x{lock_number_byte:02X} ({lock_number_byte})\n"
+    result["lock_number"] = lock_number_byte
+    ctx.notify(f"Закрыт замок {lock_number_byte}")
+    return result
@@ -0,0 +1,270 @@
+"""Выполнение операций над картами без привязки к интерфейсу
+
+Конфигурация, пул соединений, набор ключей, журнал и контрольные точки
+собраны в CardService. Им пользуются окно Eel (main.py), пакетный режим
+без интерфейса (batch.py) и сервер считывателей (reader_server.py):
+операции из card_operations выполняются одним и тем же кодом с повтором
+после сбоя связи и записью в журнал.
+"""
+import json
+import os
+import time
+import card_operations
+from apdu_monitor import apdu_monitor
+from audit_store import describe_operation
+from card_keyring import Keyring
+from card_operations import OperationContext, OperationCancelled
+from checkpoints import CheckpointStore, TRANSIENT_ERRORS, retry_delays
+from operation_profiler import operation_profiler
+from reader_pool import ReaderConnectionPool
+from uid_sinks import default_sink_names, DEFAULT_SOCKET_PORT
+
+CONFIG_FILE = "mifare_config.json"
+# Порт HTTP/WebSocket сервера считывателей (reader_server.py), если он не задан в конфигурации
+DEFAULT_SERVER_PORT = 8766
+
+# Операции по имени: имя -> (функция, параметры со значениями по умолчанию)
+# None - параметр обязателен
+OPERATIONS = {
+    "dump_card": (card_operations.dump_card, ()),
+    "clear_all_blocks": (card_operations.clear_all_blocks, ()),
+    "encode": (card_operations.encode, ()),
+    "decode": (card_operations.decode, ()),
+    "write_setup_card": (card_operations.write_setup_card, (
+        ("lock_no", None), ("wait_time", 10), ("sound_mode", 0), ("alarm_mode", 0),
+        ("lock_mode", 0), ("cb_auto_1", False))),
+    "clear_setup_blocks": (card_operations.clear_setup_blocks, ()),
+    "check_lock_number": (card_operations.check_lock_number, ()),
+}
+# Короткие имена операций
+ALIASES = {
+    "dump": "dump_card",
+    "clear": "clear_all_blocks",
+    "setup": "write_setup_card",
+    "clear_setup": "clear_setup_blocks",
+    "check": "check_lock_number",
+}
+
+
+def resolve_operation(spec):
+    """Операция из описания {"op": ..., параметры}: (имя операции, аргументы)"""
+    if not isinstance(spec, dict):
+        raise Exception("Задание должно быть объектом JSON")
+    name = ALIASES.get(spec.get("op"), spec.get("op"))
+    if name not in OPERATIONS:
+        raise Exception(f"Неизвестная операция: {spec.get('op')}")
+    operation, params = OPERATIONS[name]
+    args = []
+    for param, default in params:
+        value = spec.get(param, default)
+        if value is None:
+            raise Exception(f"Для операции {name} нужен параметр {param}")
+        args.append(value)
+    return name, tuple(args)
+
+
+def default_config():
+    """Настройки по умолчанию"""
+    return {
+        "default_key_a": "FFFFFFFFFFFF",
+        "default_key_b": "FFFFFFFFFFFF",
+        "default_access_bits": "FF078069",
+        "default_block": "62",
+        "keyring": {},
+        "delta_writes": False,
+        "uid_sinks": default_sink_names(),
+        "uid_socket_port": DEFAULT_SOCKET_PORT,
+        "reader_server_host": "127.0.0.1",
+        # Сеть выключена, пока не заданы порт и токен
+        "reader_server_port": 0,
+        "reader_server_token": "",
+        "reader_server_origins": [],
+        "profiling": False
+    }
+
+
+def load_config(path=CONFIG_FILE):
+    """Загрузка конфигурации из файла (если файла нет - он создается)"""
+    defaults = default_config()
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+                # Проверяем, что все нужные поля есть
+                for key in defaults:
+                    if key not in config:
+                        config[key] = defaults[key]
+                return config
+        else:
+            save_config(defaults, path)
+            return defaults
+    except Exception as e:
+        print(f"Ошибка загрузки конфигурации: {e}")
+        return defaults
+
+
+def save_config(config, path=CONFIG_FILE):
+    """Сохранение конфигурации в файл"""
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)
+    except Exception as e:
+        print(f"Ошибка сохранения конфигурации: {e}")
+
+
+class CardService:
+    """Операции над картами на соединениях из общего пула
+
+    audit=None - операции не записываются в журнал. notify(message) -
+    сообщения о ходе работы (повторы после сбоя связи и т.п.).
+    """
+
+    def __init__(self, config, pool=None, keyring=None, audit=None, checkpoints=None, notify=None):
+        self.config = config
+        self.pool = pool if pool is not None else ReaderConnectionPool()
+        # Общий набор ключей с выученной картой "UID + сектор -> ключ"
+        self.keyring = keyring if keyring is not None else Keyring()
+        self.keyring.set_keys(config)
+        self.audit = audit
+        # Готовые секторы операций, прерванных сбоем связи с картой
+        self.checkpoints = checkpoints if checkpoints is not None else CheckpointStore()
+        self.notify = notify or (lambda message: None)
+        # Образ карты (CardImage) последнего успешного дампа каждого считывателя - для сохранения в .mfd
+        self.last_images = {}
+
+    def set_config(self, config):
+        """Новая конфигурация (после сохранения или сброса настроек)"""
+        self.config = config
+        self.keyring.set_keys(config)
+
+    def get_connection(self, reader_name):
+        """Получение соединения из пула (None, если считыватель или карта недоступны)"""
+        try:
+            if not reader_name or "Ошибка" in reader_name:
+                raise Exception("Выберите корректный считыватель!")
+            connection = self.pool.acquire(reader_name)
+        except Exception:
+            return None
+        # Ключи из набора загружаются в слоты один раз на соединение
+        connection.key_slots.preload(connection, self.keyring.keys())
+        return connection
+
+    def finish_operation(self, reader_name, connection, result, discard=False):
+        """Возврат соединения в пул и добавление статистики APDU к результату
+
+        discard=True - связь с картой потеряна, соединение закрывается.
+        """
+        result["apdu_stats"] = connection.key_slots.operation_report()
+        result["apdu_stats"]["apdu_total"] = connection.operation_apdus
+        result["uid"] = connection.uid
+        self.keyring.save()
+        self.pool.release(reader_name, discard=discard)
+
+    def probe_uid(self, reader_name):
+        """UID карты на считывателе или None, если карты нет"""
+        try:
+            connection = self.pool.acquire(reader_name)
+        except Exception:
+            return None
+        try:
+            return connection.uid
+        finally:
+            self.pool.release(reader_name)
+
+    def run(self, reader_name, operation, *args, progress=None, cancel_event=None, emit=None):
+        """Выполнение операции из card_operations на соединении из пула"""
+        # Все APDU операции, включая проверку соединения, относятся к ее span
+        with operation_profiler.profile(operation.__name__, reader_name), \
+                apdu_monitor.span(operation.__name__, reader_name) as span:
+            result = self._run(reader_name, operation, *args, progress=progress,
+                               cancel_event=cancel_event, emit=emit)
+            span.status = result.get("status")
+            span.error = result.get("error", "")
+        self.record_operation(reader_name, operation.__name__, args, result, span)
+        return result
+
+    def record_operation(self, reader_name, name, args, result, span):
+        """Запись операции в журнал"""
+        if self.audit is None:
+            return
+        lock_no, key_a, params = describe_operation(name, args, self.config, result)
+        self.audit.record(reader_name, name, uid=result.get("uid"), lock_no=lock_no, key_a=key_a,
+                          params=params, status=result.get("status"), error=result.get("error"),
+                          duration_ms=span.duration_ms, apdus=span.apdus)
+
+    def _run(self, reader_name, operation, *args, progress=None, cancel_event=None, emit=None):
+        """Операция с повтором после сбоя связи с картой
+
+        Если карту сдвинули с антенны, операция повторяется с паузами
+        retry_delays(), пока на считыватель не вернут ту же карту; готовые
+        секторы берутся из контрольной точки и повторно не читаются.
+        """
+        delays = retry_delays()
+        expected_uid = None
+        checkpoint = None
+        result = {"status": "error", "data": "", "error": "Ошибка подключения к считывателю"}
+        for attempt in range(len(delays) + 1):
+            if attempt:
+                delay = delays[attempt - 1]
+                self.notify(f"Связь с картой потеряна, повтор {attempt}/{len(delays)}...")
+                apdu_monitor.record_retry(reader_name)
+                if cancel_event is not None and cancel_event.wait(delay):
+                    result["status"] = "cancelled"
+                    result["error"] = "Операция отменена"
+                    return result
+                if cancel_event is None:
+                    time.sleep(delay)
+            connection = self.get_connection(reader_name)
+            if not connection:
+                if attempt == 0:
+                    return result
+                continue
+            if expected_uid is not None and connection.uid != expected_uid:
+                # Карта еще не вернулась полностью или на считывателе другая карта
+                self.pool.release(reader_name)
+                continue
+            expected_uid = connection.uid
+            checkpoint = self.checkpoints.resume(operation.__name__, connection.uid)
+            result = {"status": "success", "data": "", "error": ""}
+            lost = False
+            try:
+                ctx = OperationContext(connection, self.config, self.keyring, notify=self.notify,
+                                       progress=progress, cancel_event=cancel_event, emit=emit,
+                                       checkpoint=checkpoint)
+                result = operation(ctx, *args)
+                if operation is card_operations.dump_card and result["status"] == "success":
+                    # Образ для .mfd - только от законченного дампа, не от проверки или записи блока
+                    self.last_images[reader_name] = ctx.image
+            except OperationCancelled as e:
+                result["status"] = "cancelled"
+                result["error"] = str(e)
+            except TRANSIENT_ERRORS as e:
+                lost = True
+                result["status"] = "error"
+                result["error"] = f"Связь с картой потеряна: {e}"
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = f"Ошибка: {e}"
+            finally:
+                self.finish_operation(reader_name, connection, result, discard=lost)
+            result["attempts"] = attempt + 1
+            if not lost:
+                self.checkpoints.discard(checkpoint)
+                return result
+        result["attempts"] = len(delays) + 1
+        if checkpoint is not None and checkpoint.sectors:
+            result["error"] += (f". Приложите ту же карту и повторите операцию - "
+                                f"она продолжится с сектора {checkpoint.next_sector}")
+        return result
+
+    def close(self):
+        """Закрытие соединений и журнала"""
+        try:
+            self.pool.close_all()
+        except Exception:
+            pass
+        if self.audit is not None:
+            try:
+                self.audit.close()
+            except Exception:
+                pass
@@ -0,0 +1,421 @@
+"""Симулятор считывателей ACR и карт Mifare Classic (Mini, 1K, 4K) в памяти
+
+Эмулирует псевдо-APDU ACR, которые использует приложение: GET UID (FF CA),
+LOAD KEY (FF 82), AUTH (FF 86), READ (FF B0) и UPDATE (FF D6), с трейлерами
+секторов, битами доступа и семантикой ключей A/B. Интерфейс повторяет
+pyscard (readers(), createConnection(), connect(), transmit(), CardMonitor),
+поэтому пул соединений и мониторинг карт работают с ним без изменений.
+
+Включается переменной окружения PSOFT_SIMULATOR=<число считывателей>,
+тип карт по умолчанию - PSOFT_SIMULATOR_CARD=mini|1k|4k.
+"""
+import os
+import random
+import threading
+import time
+from smartcard.Exceptions import NoCardException, CardConnectionException
+from card_geometry import CLASSIC_1K, CLASSIC_4K, CLASSIC_MINI, TRAILER_ACCESS_GROUP
+from access_bits import DATA_PERMISSIONS, TRAILER_PERMISSIONS, access_conditions
+
+SW_OK = (0x90, 0x00)
+SW_FAIL = (0x63, 0x00)
+SW_WRONG_LENGTH = (0x67, 0x00)
+SW_NOT_SUPPORTED = (0x6A, 0x81)
+
+TRANSPORT_TRAILER = bytes.fromhex("FFFFFFFFFFFF" "FF078069" "FFFFFFFFFFFF")
+# ATR карты Mifare Classic 1K на считывателях ACR (PC/SC part 3, NN = 00 01)
+MIFARE_1K_ATR = [0x3B, 0x8F, 0x80, 0x01, 0x80, 0x4F, 0x0C, 0xA0, 0x00, 0x00,
+                 0x03, 0x06, 0x03, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00, 0x6A]
+# Тип карты: имя NN в ATR, SAK и ATQA
+CARD_TYPES = {
+    "mini": (CLASSIC_MINI, 0x26, 0x09, (0x04, 0x00)),
+    "1k": (CLASSIC_1K, 0x01, 0x08, (0x04, 0x00)),
+    "4k": (CLASSIC_4K, 0x02, 0x18, (0x02, 0x00)),
+}
+
+# Типичная задержка APDU на ACR1252 + Mifare Classic, секунды
+ACR_LATENCY = {0xCA: 0.004, 0x82: 0.003, 0x86: 0.012, 0xB0: 0.010, 0xD6: 0.020}
+
+
+def card_atr(card_name):
+    """ATR карты с именем NN (PC/SC part 3), последний байт - контрольная сумма TCK"""
+    atr = MIFARE_1K_ATR[:-1]
+    atr[13:15] = [card_name >> 8, card_name & 0xFF]
+    tck = 0
+    for b in atr[1:]:
+        tck ^= b
+    return atr + [tck]
+
+
+class SimulatedMifareCard:
+    """Карта Mifare Classic: Mini (5 секторов), 1K (16) или 4K (32 по 4 блока и 8 по 16)"""
+
+    def __init__(self, uid=None, card_type=None):
+        card_type = (card_type or os.environ.get("PSOFT_SIMULATOR_CARD") or "1k").lower()
+        if card_type not in CARD_TYPES:
+            raise Exception(f"Неизвестный тип карты симулятора: {card_type}")
+        self.geometry, card_name, sak, atqa = CARD_TYPES[card_type]
+        self.atr = card_atr(card_name)
+        self.uid = bytes(uid) if uid else bytes(random.randrange(256) for _ in range(4))
+        self.memory = bytearray(self.geometry.memory_size)
+        # Блок 0: UID, BCC, SAK, ATQA и данные производителя
+        bcc = 0
+        for b in self.uid[:4]:
+            bcc ^= b
+        self.memory[0:5] = self.uid[:4] + bytes([bcc])
+        self.memory[5:8] = bytes([sak, *atqa])
+        for sector in range(self.sector_count):
+            self.set_trailer(sector, TRANSPORT_TRAILER)
+
+    @property
+    def sector_count(self):
+        return self.geometry.sector_count
+
+    def sector_of(self, block_num):
+        return self.geometry.sector_of(block_num)
+
+    def trailer_of(self, sector):
+        return self.geometry.trailer_block(sector)
+
+    def block(self, block_num):
+        return bytes(self.memory[block_num * 16:(block_num + 1) * 16])
+
+    def set_block(self, block_num, data):
+        self.memory[block_num * 16:(block_num + 1) * 16] = bytes(data)
+
+    def set_trailer(self, sector, trailer):
+        """Прямая запись трейлера (для подготовки сценариев)"""
+        self.set_block(self.trailer_of(sector), trailer)
+
+    def set_sector_key(self, sector, key_a=None, key_b=None, access_bits=None):
+        """Смена ключей и битов доступа сектора без аутентификации"""
+        trailer = bytearray(self.block(self.trailer_of(sector)))
+        if key_a:
+            trailer[0:6] = bytes.fromhex(key_a)
+        if access_bits:
+            trailer[6:10] = bytes.fromhex(access_bits)
+        if key_b:
+            trailer[10:16] = bytes.fromhex(key_b)
+        self.set_trailer(sector, trailer)
+
+    def _conditions(self, block_num):
+        sector = self.sector_of(block_num)
+        trailer = self.block(self.trailer_of(sector))
+        return trailer, access_conditions(trailer, self.geometry.access_group(block_num))
+
+    def key_b_readable(self, sector):
+        trailer = self.block(self.trailer_of(sector))
+        conditions = access_conditions(trailer, TRAILER_ACCESS_GROUP)
+        return conditions is not None and "A" in TRAILER_PERMISSIONS[conditions]["key_b_read"]
+
+    def check_key(self, sector, key_type, key):
+        """Проверка ключа при AUTH"""
+        trailer = self.block(self.trailer_of(sector))
+        if access_conditions(trailer, TRAILER_ACCESS_GROUP) is None:
+            # Поврежденные биты доступа навсегда блокируют сектор
+            return False
+        if key_type == "A":
+            return trailer[0:6] == bytes(key)
+        return trailer[10:16] == bytes(key)
+
+    def read(self, block_num, key_type):
+        """Чтение блока с учетом битов доступа; None - доступ запрещен"""
+        trailer, conditions = self._conditions(block_num)
+        if conditions is None:
+            return None
+        sector = self.sector_of(block_num)
+        if key_type == "B" and self.key_b_readable(sector):
+            return None
+        if block_num != self.trailer_of(sector):
+            allowed = DATA_PERMISSIONS[conditions][0]
+            return self.block(block_num) if key_type in allowed else None
+        permissions = TRAILER_PERMISSIONS[conditions]
+        data = bytearray(16)
+        # Ключ A никогда не читается
+        if key_type in permissions["access_read"]:
+            data[6:10] = trailer[6:10]
+        if key_type in permissions["key_b_read"]:
+            data[10:16] = trailer[10:16]
+        return bytes(data)
+
+    def write(self, block_num, data, key_type):
+        """Запись блока с учетом битов доступа; False - доступ запрещен"""
+        trailer, conditions = self._conditions(block_num)
+        if conditions is None:
+            return False
+        sector = self.sector_of(block_num)
+        if key_type == "B" and self.key_b_readable(sector):
+            return False
+        if block_num == 0:
+            # Блок производителя не перезаписывается
+            return False
+        if block_num != self.trailer_of(sector):
+            if key_type not in DATA_PERMISSIONS[conditions][1]:
+                return False
+            self.set_block(block_num, data)
+            return True
+        permissions = TRAILER_PERMISSIONS[conditions]
+        new_trailer = bytearray(trailer)
+        # Каждая часть трейлера пишется, только если это разрешено
+        if key_type in permissions["key_a_write"]:
+            new_trailer[0:6] = data[0:6]
+        if key_type in permissions["access_write"]:
+            new_trailer[6:10] = data[6:10]
+        if key_type in permissions["key_b_write"]:
+            new_trailer[10:16] = data[10:16]
+        self.set_block(block_num, new_trailer)
+        return True
+
+
+class SimulatedConnection:
+    """Соединение с картой на симулированном считывателе"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.card = None
+        self.key_slots = {}
+        self.auth = None
+
+    def connect(self, protocol=None):
+        self.reader.responsive.wait()
+        card = self.reader.card
+        if card is None:
+            raise NoCardException("Карта не обнаружена", 0)
+        self.card = card
+        self.auth = None
+
+    def disconnect(self):
+        self.card = None
+        self.auth = None
+
+    def getATR(self):
+        self._check_card()
+        return list(self.card.atr)
+
+    def _check_card(self):
+        if self.card is None or self.reader.card is not self.card:
+            # Карту убрали или заменили - как и pyscard, соединение ломается
+            raise CardConnectionException("Карта удалена", 0)
+
+    def transmit(self, apdu):
+        # Зависший считыватель не отвечает, пока его не "переподключат"
+        self.reader.responsive.wait()
+        self._check_card()
+        self.reader.apdu_count += 1
+        ins = apdu[1] if len(apdu) > 1 else None
+        delay = self.reader.latency.get(ins, self.reader.latency.get("default", 0.0))
+        if delay:
+            time.sleep(delay * self.reader.latency_scale)
+        response, (sw1, sw2) = self._execute(list(apdu))
+        return list(response), sw1, sw2
+
+    def _execute(self, apdu):
+        if len(apdu) < 5 or apdu[0] != 0xFF:
+            return [], SW_NOT_SUPPORTED
+        ins, p2, lc = apdu[1], apdu[3], apdu[4]
+        card = self.card
+        if ins == 0xCA:
+            return list(card.uid), SW_OK
+        if ins == 0x82:
+            if lc != 6 or len(apdu) != 11:
+                return [], SW_WRONG_LENGTH
+            if p2 not in (0x00, 0x01):
+                return [], SW_FAIL
+            self.key_slots[p2] = bytes(apdu[5:11])
+            return [], SW_OK
+        if ins == 0x86:
+            if lc != 5 or len(apdu) != 10:
+                return [], SW_WRONG_LENGTH
+            block_num, key_code, slot = apdu[7], apdu[8], apdu[9]
+            key = self.key_slots.get(slot)
+            key_type = {0x60: "A", 0x61: "B"}.get(key_code)
+            if key is None or key_type is None or block_num >= card.geometry.block_count:
+                self.auth = None
+                return [], SW_FAIL
+            sector = card.sector_of(block_num)
+            if not card.check_key(sector, key_type, key):
+                # Неудачная аутентификация переводит карту в HALT
+                self.auth = None
+                return [], SW_FAIL
+            self.auth = (sector, key_type)
+            return [], SW_OK
+        if ins == 0xB0:
+            block_num = p2
+            data = None
+            if (self.auth is not None and block_num < card.geometry.block_count
+                    and self.auth[0] == card.sector_of(block_num)):
+                data = card.read(block_num, self.auth[1])
+            if data is None:
+                # Карта отвечает NAK и переходит в HALT: аутентификация потеряна
+                self.auth = None
+                return [], SW_FAIL
+            return list(data[:lc or 16]), SW_OK
+        if ins == 0xD6:
+            block_num = p2
+            if lc != 16 or len(apdu) != 21:
+                return [], SW_WRONG_LENGTH
+            if (self.auth is None or block_num >= card.geometry.block_count
+                    or self.auth[0] != card.sector_of(block_num)
+                    or not card.write(block_num, apdu[5:21], self.auth[1])):
+                # Отказ в записи тоже переводит карту в HALT
+                self.auth = None
+                return [], SW_FAIL
+            return [], SW_OK
+        return [], SW_NOT_SUPPORTED
+
+
+class SimulatedCard:
+    """Карта в событиях монитора (аналог smartcard.Card.Card)"""
+
+    def __init__(self, reader, atr):
+        self.reader = reader
+        self.atr = atr
+
+    def createConnection(self):
+        return self.reader.createConnection()
+
+
+class SimulatedReader:
+    """Симулированный считыватель (аналог smartcard.reader.Reader)"""
+
+    def __init__(self, name, station=None, latency=None, latency_scale=1.0):
+        self.name = name
+        self.station = station
+        self.card = None
+        self.latency = dict(latency) if latency is not None else dict(ACR_LATENCY)
+        self.latency_scale = latency_scale
+        self.apdu_count = 0
+        self.responsive = threading.Event()
+        self.responsive.set()
+
+    def __str__(self):
+        return self.name
+
+    def createConnection(self):
+        return SimulatedConnection(self)
+
+    def insert(self, card=None):
+        """Приложить карту (по умолчанию - новую чистую)"""
+        if self.card is not None:
+            self.remove()
+        self.card = card or SimulatedMifareCard()
+        if self.station:
+            self.station.monitor.notify([SimulatedCard(self, self.card.atr)], [])
+        return self.card
+
+    def hang(self):
+        """Зависание драйвера: connect и transmit блокируются до recover()"""
+        self.responsive.clear()
+
+    def recover(self):
+        self.responsive.set()
+
+    def remove(self):
+        """Убрать карту"""
+        card, self.card = self.card, None
+        if card is not None and self.station:
+            self.station.monitor.notify([], [SimulatedCard(self, card.atr)])
+        return card
+
+
+class SimulatedCardMonitor:
+    """Аналог smartcard.CardMonitoring.CardMonitor для симулятора"""
+
+    def __init__(self, station):
+        self.station = station
+        self._lock = threading.Lock()
+        self._observers = []
+
+    def addObserver(self, observer):
+        with self._lock:
+            self._observers.append(observer)
+        # Как и pyscard, новый наблюдатель сразу получает карты на считывателях
+        present = [SimulatedCard(reader, reader.card.atr)
+                   for reader in self.station.reader_list if reader.card is not None]
+        if present:
+            observer.update(self, (present, []))
+
+    def deleteObserver(self, observer):
+        with self._lock:
+            if observer in self._observers:
+                self._observers.remove(observer)
+
+    def notify(self, added, removed):
+        with self._lock:
+            observers = list(self._observers)
+        for observer in observers:
+            observer.update(self, (added, removed))
+
+
+class SimulatedStation:
+    """Набор симулированных считывателей и монитор карт"""
+
+    def __init__(self, reader_count=1, latency=None, latency_scale=1.0, with_cards=True):
+        self.monitor = SimulatedCardMonitor(self)
+        self.reader_list = [
+            SimulatedReader(f"Simulated ACR1252 {index}", self, latency, latency_scale)
+            for index in range(reader_count)
+        ]
+        if with_cards:
+            for reader in self.reader_list:
+                reader.card = SimulatedMifareCard()
+
+    def readers(self):
+        """Аналог smartcard.System.readers()"""
+        return list(self.reader_list)
+
+    def reader(self, name):
+        return next(reader for reader in self.reader_list if reader.name == name)
+
+    def plug(self, name=None, with_card=True):
+        """Подключение нового считывателя (горячее подключение USB)"""
+        reader = SimulatedReader(name or f"Simulated ACR1252 {len(self.reader_list)}", self,
+                                 latency_scale=self.reader_list[0].latency_scale if self.reader_list else 1.0)
+        if with_card:
+            reader.card = SimulatedMifareCard()
+        self.reader_list = self.reader_list + [reader]
+        return reader
+
+    def unplug(self, name):
+        """Отключение считывателя; лежавшая на нем карта пропадает из поля"""
+        reader = self.reader(name)
+        reader.remove()
+        self.reader_list = [other for other in self.reader_list if other is not reader]
+        return reader
+
+
+_default_station = None
+
+
+def simulation_enabled():
+    """Включен ли симулятор переменной окружения PSOFT_SIMULATOR"""
+    return os.environ.get("PSOFT_SIMULATOR", "") not in ("", "0")
+
+
+def default_station():
+    """Общая станция симулятора, число считывателей - из PSOFT_SIMULATOR"""
+    global _default_station
+    if _default_station is None:
+        try:
+            count = max(1, int(os.environ.get("PSOFT_SIMULATOR", "1")))
+        except ValueError:
+            count = 1
+        scale = float(os.environ.get("PSOFT_SIMULATOR_LATENCY", "1.0"))
+        _default_station = SimulatedStation(count, latency_scale=scale)
+    return _default_station
+
+
+def system_readers():
+    """Список считывателей: симулятор, если он включен, иначе PC/SC"""
+    if simulation_enabled():
+        return default_station().readers()
+    from smartcard.System import readers
+    return readers()
+
+
+def create_card_monitor():
+    """Монитор карт: симулятора, если он включен, иначе pyscard"""
+    if simulation_enabled():
+        return default_station().monitor
+    from smartcard.CardMonitoring import CardMonitor
+    return CardMonitor()
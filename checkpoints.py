@@ -0,0 +1,116 @@
+"""Контрольные точки операций над картой и повтор после сбоя связи
+
+Если карту сдвинули с антенны посреди дампа или очистки, transmit
+выбрасывает исключение. Готовые секторы сохраняются в контрольной точке
+по UID карты, операция повторяется с ограниченной паузой, и когда та же
+карта снова на считывателе, работа продолжается с первого незавершенного
+сектора.
+"""
+import threading
+import time
+from smartcard.Exceptions import CardConnectionException, NoCardException
+
+# Сколько хранится контрольная точка незавершенной операции, секунд
+CHECKPOINT_TTL = 600
+# Повтор после сбоя связи: число попыток и паузы между ними (удвоение до предела)
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 2.0
+# Сбои связи с картой, после которых операцию имеет смысл повторить
+TRANSIENT_ERRORS = (CardConnectionException, NoCardException)
+
+
+class Checkpoint:
+    """Готовые секторы одной операции над одной картой"""
+
+    def __init__(self, operation, uid):
+        self.operation = operation
+        self.uid = uid
+        # Записи готовых секторов в том виде, в каком они идут в результат
+        self.sectors = []
+        # Прочитанные и записанные блоки готовых секторов: {блок: 16 байт}
+        self.blocks = {}
+        self.resumes = 0
+        self.updated_at = time.time()
+
+    @property
+    def next_sector(self):
+        """Первый незавершенный сектор"""
+        return len(self.sectors)
+
+    def complete_sector(self, record, image):
+        """Сектор готов: запись сектора и его известные блоки образа"""
+        self.sectors.append(record)
+        for block_num in image.known_blocks(record["sector"]):
+            self.blocks[block_num] = bytes(image.block(block_num))
+        self.updated_at = time.time()
+
+    def restore(self, image):
+        """Блоки готовых секторов обратно в образ карты"""
+        for block_num, data in self.blocks.items():
+            image.set_block(block_num, data)
+
+
+class CheckpointStore:
+    """Контрольные точки по (операция, UID)
+
+    Точка живет, пока ее операция не завершится (успешно или нет, но без
+    сбоя связи), не истечет CHECKPOINT_TTL или с картой не выполнят другую
+    операцию: после нее готовые секторы могут уже не соответствовать карте.
+    """
+
+    def __init__(self, ttl=CHECKPOINT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._checkpoints = {}
+        self.stats = {"created": 0, "resumed": 0, "completed": 0, "expired": 0}
+
+    def _expire(self, now):
+        for key, checkpoint in list(self._checkpoints.items()):
+            if now - checkpoint.updated_at > self.ttl:
+                del self._checkpoints[key]
+                self.stats["expired"] += 1
+
+    def resume(self, operation, uid):
+        """Контрольная точка операции над картой: сохраненная или новая
+
+        Без UID точка не сохраняется - продолжить операцию будет нельзя.
+        """
+        if not uid:
+            return Checkpoint(operation, uid)
+        with self._lock:
+            self._expire(time.time())
+            for key in [key for key in self._checkpoints if key[1] == uid and key[0] != operation]:
+                del self._checkpoints[key]
+            checkpoint = self._checkpoints.get((operation, uid))
+            if checkpoint is not None and checkpoint.sectors:
+                checkpoint.resumes += 1
+                self.stats["resumed"] += 1
+                return checkpoint
+            checkpoint = Checkpoint(operation, uid)
+            self._checkpoints[(operation, uid)] = checkpoint
+            self.stats["created"] += 1
+            return checkpoint
+
+    def discard(self, checkpoint):
+        """Операция завершена - контрольная точка больше не нужна"""
+        with self._lock:
+            if self._checkpoints.get((checkpoint.operation, checkpoint.uid)) is checkpoint:
+                del self._checkpoints[(checkpoint.operation, checkpoint.uid)]
+                self.stats["completed"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending"] = [
+                {"operation": checkpoint.operation, "uid": checkpoint.uid,
+                 "next_sector": checkpoint.next_sector, "resumes": checkpoint.resumes,
+                 "age": round(time.time() - checkpoint.updated_at, 1)}
+                for checkpoint in self._checkpoints.values() if checkpoint.sectors
+            ]
+            return stats
+
+
+def retry_delays(attempts=RETRY_ATTEMPTS, base=RETRY_BASE_DELAY, limit=RETRY_MAX_DELAY):
+    """Паузы перед повторами: 0.25, 0.5, 1, 2, 2 ... секунд"""
+    return [min(base * 2 ** attempt, limit) for attempt in range(attempts)]
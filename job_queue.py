@@ -0,0 +1,137 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Сколько завершенных заданий хранить для get_job()
+MAX_FINISHED_JOBS = 200
+
+
+class Job:
+    """Задание над картой: операция, считыватель, состояние и флаг отмены"""
+
+    def __init__(self, job_id, name, reader_name, func, args):
+        self.id = job_id
+        self.name = name
+        self.reader_name = reader_name
+        self.func = func
+        self.args = args
+        self.status = "queued"
+        self.result = None
+        self.progress = None
+        self.cancel_event = threading.Event()
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def to_dict(self):
+        """Состояние задания для интерфейса"""
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "reader": self.reader_name,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "queue_wait": round(self.started_at - self.created_at, 3) if self.started_at else None,
+            "duration": round(self.finished_at - self.started_at, 3) if self.finished_at else None,
+        }
+
+
+class JobManager:
+    """Очередь заданий PC/SC на пуле настоящих потоков
+
+    Задания одного считывателя выполняются строго по очереди (FIFO),
+    задания разных считывателей - параллельно. Вызов submit() сразу
+    возвращает идентификатор задания, результат передается в on_finished.
+    """
+
+    def __init__(self, max_workers=4, on_finished=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pcsc")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._queues = {}
+        self._busy = set()
+        self._jobs = OrderedDict()
+        self.on_finished = on_finished
+
+    def submit(self, name, reader_name, func, *args):
+        """Постановка задания в очередь считывателя; func(job, *args) -> результат"""
+        with self._lock:
+            job = Job(f"job-{next(self._ids)}", name, reader_name, func, args)
+            self._jobs[job.id] = job
+            self._queues.setdefault(reader_name, deque()).append(job)
+            self._trim()
+            self._dispatch(reader_name)
+        return job.id
+
+    def _dispatch(self, reader_name):
+        """Запуск следующего задания считывателя, если он свободен (под self._lock)"""
+        if reader_name in self._busy:
+            return
+        queue = self._queues.get(reader_name)
+        while queue:
+            job = queue.popleft()
+            if job.cancelled:
+                continue
+            self._busy.add(reader_name)
+            job.status = "running"
+            self._executor.submit(self._run, job)
+            return
+
+    def _run(self, job):
+        job.started_at = time.time()
+        try:
+            job.result = job.func(job, *job.args)
+            job.status = "cancelled" if job.cancelled else "done"
+        except Exception as e:
+            job.result = {"status": "error", "data": "", "error": f"Ошибка: {e}"}
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._busy.discard(job.reader_name)
+                self._dispatch(job.reader_name)
+        if self.on_finished:
+            self.on_finished(job)
+
+    def cancel(self, job_id):
+        """Отмена задания: из очереди удаляется сразу, выполняющееся - между секторами"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.status not in ("queued", "running"):
+                return False
+            job.cancel_event.set()
+            was_queued = job.status == "queued"
+            if was_queued:
+                job.status = "cancelled"
+                job.finished_at = time.time()
+                job.result = {"status": "cancelled", "data": "", "error": "Операция отменена"}
+        if was_queued and self.on_finished:
+            self.on_finished(job)
+        return True
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def list_jobs(self):
+        return [job.to_dict() for job in list(self._jobs.values())]
+
+    def _trim(self):
+        """Удаление самых старых завершенных заданий"""
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.status in ("done", "error", "cancelled")]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        """Отмена всех заданий и остановка потоков"""
+        for job in list(self._jobs.values()):
+            job.cancel_event.set()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,113 @@
+from smartcard.util import toBytes
+from checkpoints import TRANSIENT_ERRORS
+
+# Энергозависимые слоты ключей ACR122 / ACR1252 (P2 команды LOAD KEY)
+KEY_SLOTS = (0x00, 0x01)
+
+
+def _empty_counters():
+    return {"load_key_sent": 0, "load_key_skipped": 0, "auth_sent": 0, "auth_ok": 0}
+
+
+class KeySlotAuthenticator:
+    """Аутентификация с учетом ключей, уже загруженных в слоты считывателя
+
+    Хранит, какой ключ лежит в каком слоте, и не посылает LOAD KEY,
+    если нужный ключ уже загружен. При нехватке слотов вытесняется
+    ключ, который дольше всех не использовался.
+    """
+
+    def __init__(self, slots=KEY_SLOTS):
+        self.slots = {slot: None for slot in slots}
+        self._lru = list(slots)
+        self.preloaded = False
+        self.totals = _empty_counters()
+        self.operation = _empty_counters()
+
+    def begin_operation(self):
+        """Сброс счетчиков текущей операции"""
+        self.operation = _empty_counters()
+
+    def _count(self, name):
+        self.totals[name] += 1
+        self.operation[name] += 1
+
+    def _touch(self, slot):
+        self._lru.remove(slot)
+        self._lru.append(slot)
+
+    def slot_for(self, key):
+        """Номер слота с ключом key или None"""
+        key = key.upper()
+        for slot, loaded in self.slots.items():
+            if loaded == key:
+                return slot
+        return None
+
+    def load_key(self, connection, key):
+        """Загрузка ключа в слот (если его там еще нет), возвращает номер слота"""
+        key = key.upper()
+        slot = self.slot_for(key)
+        if slot is not None:
+            self._count("load_key_skipped")
+            self._touch(slot)
+            return slot
+        slot = self._lru[0]
+        load_key_cmd = [0xFF, 0x82, 0x00, slot, 0x06] + toBytes(key)
+        self._count("load_key_sent")
+        try:
+            response, sw1, sw2 = connection.transmit(load_key_cmd)
+        except Exception:
+            self.slots[slot] = None
+            raise
+        if sw1 != 0x90 or sw2 != 0x00:
+            self.slots[slot] = None
+            return None
+        self.slots[slot] = key
+        self._touch(slot)
+        return slot
+
+    def preload(self, connection, keys):
+        """Однократная загрузка первых ключей набора в свободные слоты"""
+        if self.preloaded:
+            return
+        self.preloaded = True
+        unique = []
+        for key in keys:
+            key = key.upper()
+            if key not in unique:
+                unique.append(key)
+        for key in unique[:len(self.slots)]:
+            try:
+                self.load_key(connection, key)
+            except Exception:
+                break
+        # Предзагрузка не входит в экономию операции
+        self.begin_operation()
+
+    def authenticate(self, connection, sector, key_type=0x60, key="FFFFFFFFFFFF"):
+        """Аутентификация сектора ключом key (0x60 - ключ A, 0x61 - ключ B)"""
+        try:
+            # AUTH адресует первый блок сектора (у карты 4K секторы 32-39 по 16 блоков)
+            block_number = connection.geometry.first_block(int(sector))
+            slot = self.load_key(connection, key)
+            if slot is None:
+                return False
+            auth_cmd = [0xFF, 0x86, 0x00, 0x00, 0x05, 0x01, 0x00, block_number, key_type, slot]
+            self._count("auth_sent")
+            response, sw1, sw2 = connection.transmit(auth_cmd)
+            if sw1 == 0x90 and sw2 == 0x00:
+                self._count("auth_ok")
+                return True
+            return False
+        except TRANSIENT_ERRORS:
+            # Карта потеряна - это не "ключ не подошел"
+            raise
+        except Exception:
+            return False
+
+    def operation_report(self):
+        """Счетчики текущей операции и число сэкономленных APDU"""
+        report = dict(self.operation)
+        report["apdu_saved"] = report["load_key_skipped"]
+        return report
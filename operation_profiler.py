@@ -0,0 +1,207 @@
+"""Профилирование операций: cProfile и выборка стеков с записью в файлы
+
+Когда "дамп сегодня медленный", нужно видеть, куда ушло время: pyscard,
+переключения gevent в Eel, сборка строк в dump_card или задержки
+приемников UID. В режиме профилирования каждая операция (функция Eel,
+операция над картой в потоке считывателя, обработка приложенной карты)
+профилируется отдельно, и в каталог профилей пишутся файлы:
+
+    <время>_<операция>.prof    - статистика cProfile (pstats, snakeviz)
+    <время>_<операция>.folded  - свернутые стеки по выборке (flamegraph.pl, speedscope)
+    <время>_<операция>.txt     - первые PROFILE_TOP_N функций по собственному и общему времени
+
+Режим включается в настройках или переменной окружения PSOFT_PROFILE
+(1 - каталог profiles, другое значение - путь к каталогу). Выключенный
+режим стоит одной проверки флага на вызов.
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+
+# Каталог профилей по умолчанию
+PROFILE_DIR = "profiles"
+# Период выборки стеков, секунд
+PROFILE_SAMPLE_INTERVAL = 0.001
+# Сколько функций в сводке
+PROFILE_TOP_N = 25
+# Сколько последних профилей показывать в диагностике
+MAX_RECENT_PROFILES = 20
+
+_DISABLED = nullcontext()
+
+
+def frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """Выборка стека одного потока из отдельного потока с периодом interval"""
+
+    def __init__(self, thread_ident, root, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_ident = thread_ident
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="profile-sampler")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_ident)
+            names = []
+            while frame is not None:
+                names.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            names.append(self.root)
+            self.stacks[";".join(reversed(names))] += 1
+
+    def folded(self):
+        """Свернутые стеки: "корень;...;функция число_выборок" по строке на стек"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def top_functions(stats, count):
+    """Первые count функций pstats по собственному времени"""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:count]
+    return [{
+        "function": f"{os.path.basename(filename)}:{line}({name})",
+        "calls": calls,
+        "self_ms": round(self_time * 1000, 2),
+        "total_ms": round(total_time * 1000, 2),
+    } for (filename, line, name), (_, calls, self_time, total_time, _) in rows]
+
+
+class OperationProfiler:
+    """Профили операций и список последних записанных профилей"""
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.enabled = False
+        self.directory = directory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=MAX_RECENT_PROFILES)
+        self.stats = {"profiled": 0, "written": 0, "errors": 0}
+
+    def configure(self, enabled=None, directory=None):
+        """Включение режима; PSOFT_PROFILE включает его независимо от настроек"""
+        env = os.environ.get("PSOFT_PROFILE", "")
+        if env not in ("", "0"):
+            enabled = True
+            if env != "1":
+                directory = env
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if directory:
+            self.directory = directory
+
+    def profile(self, name, reader_name=None):
+        """Контекст профилирования операции (при выключенном режиме - пустой)"""
+        if not self.enabled or getattr(self._local, "active", False):
+            # Вложенная операция входит в профиль внешней
+            return _DISABLED
+        return self._profile(name, reader_name)
+
+    def wrap(self, func, kind=None):
+        """Функция, каждый вызов которой профилируется отдельно"""
+        name = f"{kind}.{func.__name__}" if kind else func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            with self.profile(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def _profile(self, name, reader_name):
+        self._local.active = True
+        root = f"{name} [{reader_name}]" if reader_name else name
+        sampler = StackSampler(threading.get_ident(), root)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: cProfile одновременно только в одном потоке - остается выборка
+            profiler = None
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            duration = time.perf_counter() - started
+            sampler.stop()
+            self._local.active = False
+            self._save(name, reader_name, duration, profiler, sampler)
+
+    def _save(self, name, reader_name, duration, profiler, sampler):
+        """Запись .prof, .folded и сводки; ошибка записи не прерывает операцию"""
+        record = {
+            "ts": time.time(),
+            "name": name,
+            "reader": reader_name,
+            "duration_ms": round(duration * 1000, 1),
+            "samples": sum(sampler.stacks.values()),
+            "files": [],
+            "top": [],
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = time.strftime("%Y%m%d_%H%M%S") + f"_{int(record['ts'] * 1000) % 1000:03d}"
+            safe_name = re.sub(r"[^\w.-]+", "_", f"{name}_{reader_name}" if reader_name else name)
+            base = os.path.join(self.directory, f"{stamp}_{safe_name}")
+            with open(base + ".folded", 'w', encoding='utf-8') as f:
+                f.write(sampler.folded())
+            record["files"].append(base + ".folded")
+            summary = [f"{name}" + (f" [{reader_name}]" if reader_name else "") +
+                       f": {record['duration_ms']} мс, выборок стека {record['samples']}\n"]
+            if profiler is not None:
+                profiler.dump_stats(base + ".prof")
+                record["files"].append(base + ".prof")
+                stream = io.StringIO()
+                stats = pstats.Stats(profiler, stream=stream)
+                record["top"] = top_functions(stats, 10)
+                stats.sort_stats("tottime").print_stats(PROFILE_TOP_N)
+                stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+                summary.append(stream.getvalue())
+            with open(base + ".txt", 'w', encoding='utf-8') as f:
+                f.writelines(summary)
+            record["files"].append(base + ".txt")
+            written = True
+        except Exception as e:
+            record["error"] = str(e)
+            written = False
+        with self._lock:
+            self.stats["profiled"] += 1
+            self.stats["written" if written else "errors"] += 1
+            self.recent.append(record)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["enabled"] = self.enabled
+            stats["directory"] = os.path.abspath(self.directory)
+            stats["recent"] = list(reversed(self.recent))
+            return stats
+
+
+# Общий профилировщик приложения; PSOFT_PROFILE действует и без окна (batch.py, reader_server.py)
+operation_profiler = OperationProfiler()
+operation_profiler.configure()
@@ -0,0 +1,263 @@
+import heapq
+import threading
+import time
+from smartcard.CardMonitoring import CardObserver
+from card_simulator import create_card_monitor
+
+
+class LockNumberAllocator:
+    """Потокобезопасная выдача номеров замков
+
+    Номер выдается allocate() и либо подтверждается commit() после
+    успешной записи, либо возвращается give_back() при ошибке. Возвращенные
+    номера выдаются повторно первыми, поэтому номера не повторяются и не
+    пропускаются.
+    """
+
+    def __init__(self, start, end=None):
+        self._lock = threading.Lock()
+        self.start = int(start)
+        self.end = int(end) if end not in (None, "") else None
+        self._next = self.start
+        self._returned = []
+        self._outstanding = set()
+        self.committed = 0
+
+    def allocate(self):
+        """Следующий свободный номер или None, если диапазон исчерпан"""
+        with self._lock:
+            if self._returned:
+                number = heapq.heappop(self._returned)
+            elif self.end is not None and self._next > self.end:
+                return None
+            else:
+                number = self._next
+                self._next += 1
+            self._outstanding.add(number)
+            return number
+
+    def commit(self, number):
+        """Номер записан на карту"""
+        with self._lock:
+            self._outstanding.discard(number)
+            self.committed += 1
+
+    def give_back(self, number):
+        """Запись не удалась - номер будет выдан снова"""
+        with self._lock:
+            if number in self._outstanding:
+                self._outstanding.discard(number)
+                heapq.heappush(self._returned, number)
+
+    def next_free(self):
+        """Наименьший номер, который будет выдан следующим"""
+        with self._lock:
+            candidates = list(self._returned)
+            if self.end is None or self._next <= self.end:
+                candidates.append(self._next)
+            return min(candidates) if candidates else None
+
+    def get_stats(self):
+        next_free = self.next_free()
+        with self._lock:
+            remaining = None
+            if self.end is not None:
+                remaining = max(0, self.end - self._next + 1) + len(self._returned) + len(self._outstanding)
+            return {
+                "start": self.start,
+                "end": self.end,
+                "next": next_free,
+                "committed": self.committed,
+                "in_progress": sorted(self._outstanding),
+                "remaining": remaining,
+            }
+
+
+class ProductionSession:
+    """Параллельная запись настроечных карт на нескольких считывателях
+
+    На каждый считыватель - свой поток. Поток ждет новую карту, берет
+    номер у общего LockNumberAllocator, записывает карту и ждет, пока ее
+    уберут. write_card(reader_name, lock_no) возвращает результат операции,
+    card_uid(reader_name) - UID карты на считывателе или None.
+    """
+
+    def __init__(self, reader_names, allocator, write_card, card_uid, poll_interval=0.3,
+                 on_card=None):
+        self.reader_names = list(reader_names)
+        self.allocator = allocator
+        self.write_card = write_card
+        self.card_uid = card_uid
+        self.poll_interval = poll_interval
+        self.on_card = on_card
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._active = 0
+        self.started_at = None
+        self.finished_at = None
+        self.cards = []
+        # UID, уже записанные в этой сессии (на любом считывателе)
+        self._programmed = set()
+        self.errors = 0
+        self.per_reader = {name: 0 for name in self.reader_names}
+
+    @property
+    def running(self):
+        return self._active > 0
+
+    def start(self):
+        """Запуск потоков по всем считывателям"""
+        self.started_at = time.time()
+        self._active = len(self.reader_names)
+        for reader_name in self.reader_names:
+            thread = threading.Thread(target=self._reader_loop, args=(reader_name,), daemon=True,
+                                      name=f"production-{reader_name}")
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self):
+        """Остановка после текущей карты"""
+        self._stop.set()
+
+    def _reader_loop(self, reader_name):
+        try:
+            self._produce(reader_name)
+        finally:
+            with self._lock:
+                self._active -= 1
+                finished = self._active == 0
+                if finished:
+                    self.finished_at = time.time()
+            if finished:
+                self._finished()
+
+    def _finished(self):
+        """Все потоки сессии завершились"""
+
+    def _write_next(self, reader_name, uid):
+        """Запись следующего номера на карту; False, если диапазон исчерпан"""
+        lock_no = self.allocator.allocate()
+        if lock_no is None:
+            return False
+        started = time.time()
+        try:
+            result = self.write_card(reader_name, lock_no)
+        except Exception as e:
+            result = {"status": "error", "error": f"Ошибка: {e}"}
+        if result.get("status") == "success":
+            self.allocator.commit(lock_no)
+            self._record(reader_name, uid, lock_no, time.time() - started)
+        else:
+            self.allocator.give_back(lock_no)
+            with self._lock:
+                self.errors += 1
+        return True
+
+    def _produce(self, reader_name):
+        """Цикл считывателя: опрос наличия карты через card_uid()"""
+        last_uid = None
+        while not self._stop.is_set():
+            uid = self.card_uid(reader_name)
+            if uid is not None and uid in self._programmed:
+                last_uid = uid
+            if uid is None or uid == last_uid:
+                # Карты нет или на считывателе еще лежит уже записанная карта
+                if uid is None:
+                    last_uid = None
+                self._stop.wait(self.poll_interval)
+                continue
+            if not self._write_next(reader_name, uid):
+                break
+            if uid not in self._programmed:
+                # Запись не удалась - пауза перед повторной попыткой
+                self._stop.wait(self.poll_interval)
+
+    def _record(self, reader_name, uid, lock_no, duration):
+        with self._lock:
+            card = {"reader": reader_name, "uid": uid, "lock_no": lock_no,
+                    "duration": round(duration, 3), "time": time.time()}
+            self.cards.append(card)
+            self._programmed.add(uid)
+            self.per_reader[reader_name] += 1
+        if self.on_card:
+            self.on_card(card)
+
+    def get_stats(self):
+        """Статистика станции: карты, ошибки и карты в минуту"""
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        with self._lock:
+            count = len(self.cards)
+            return {
+                "running": self.running,
+                "readers": dict(self.per_reader),
+                "cards": count,
+                "errors": self.errors,
+                "elapsed": round(elapsed, 1),
+                "cards_per_minute": round(count * 60.0 / elapsed, 1) if elapsed > 0 else 0.0,
+                "last_card": self.cards[-1] if self.cards else None,
+                "allocator": self.allocator.get_stats(),
+            }
+
+
+class CardPresenceTracker(CardObserver):
+    """Наличие карт на считывателях по событиям CardMonitor"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._present = {}
+
+    def update(self, observable, actions):
+        (addedcards, removedcards) = actions
+        with self._condition:
+            for card in removedcards:
+                self._present[str(card.reader)] = False
+            for card in addedcards:
+                self._present[str(card.reader)] = True
+            self._condition.notify_all()
+
+    def wait_for(self, reader_name, present, stop_event, timeout=0.5):
+        """Ожидание появления (present=True) или снятия карты; False при остановке"""
+        with self._condition:
+            while self._present.get(reader_name, False) != present:
+                if stop_event.is_set():
+                    return False
+                self._condition.wait(timeout)
+        return not stop_event.is_set()
+
+
+class TapBatchSession(ProductionSession):
+    """Пакетная запись по прикладыванию карты
+
+    Вместо опроса считывателя сессия ждет событие появления карты от
+    CardMonitor, записывает следующий номер из диапазона и снова
+    взводится только после того, как карту убрали.
+    """
+
+    def __init__(self, reader_names, allocator, write_card, card_uid, on_card=None, monitor=None):
+        super().__init__(reader_names, allocator, write_card, card_uid, on_card=on_card)
+        self.tracker = CardPresenceTracker()
+        self.monitor = monitor
+
+    def start(self):
+        if self.monitor is None:
+            self.monitor = create_card_monitor()
+        self.monitor.addObserver(self.tracker)
+        super().start()
+
+    def _finished(self):
+        try:
+            self.monitor.deleteObserver(self.tracker)
+        except Exception:
+            pass
+
+    def _produce(self, reader_name):
+        while self.tracker.wait_for(reader_name, True, self._stop):
+            uid = self.card_uid(reader_name)
+            if uid is not None and uid not in self._programmed:
+                if not self._write_next(reader_name, uid):
+                    break
+            # Следующая карта - только после снятия текущей
+            if not self.tracker.wait_for(reader_name, False, self._stop):
+                break
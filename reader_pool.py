@@ -0,0 +1,237 @@
+import threading
+import time
+from smartcard.CardConnection import CardConnection
+from key_slots import KeySlotAuthenticator
+from reader_registry import reader_registry
+from card_geometry import CLASSIC_1K, detect_geometry
+from apdu_monitor import apdu_monitor
+from reader_watchdog import ReaderAbandoned, pcsc_call
+
+# Команда чтения UID, используется как проверка живости соединения
+GET_UID_CMD = [0xFF, 0xCA, 0x00, 0x00, 0x00]
+
+
+class PooledConnection:
+    """Соединение с картой, которое пул держит открытым между операциями"""
+
+    def __init__(self, reader_name, connection):
+        self.reader_name = reader_name
+        self.connection = connection
+        self.uid = None
+        # Тип карты (Mini, 1K, 4K) по ATR; по умолчанию 1K
+        self.geometry = CLASSIC_1K
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.uses = 0
+        # Слоты ключей считывателя, актуальные для этого соединения
+        self.key_slots = KeySlotAuthenticator()
+        # Число APDU текущей операции
+        self.operation_apdus = 0
+        # Соединение брошено сторожем зависших считывателей
+        self.abandoned = False
+
+    def begin_operation(self):
+        """Сброс счетчиков перед новой операцией"""
+        self.operation_apdus = 0
+        self.key_slots.begin_operation()
+
+    def _send(self, apdu):
+        """Передача APDU через исходное соединение pyscard с учетом в apdu_monitor"""
+        if self.abandoned:
+            # Брошенный поток не должен слать APDU вперемешку с новым
+            raise ReaderAbandoned(f"Соединение со считывателем {self.reader_name} брошено")
+        started = time.perf_counter()
+        try:
+            with pcsc_call(self.reader_name, apdu):
+                response, sw1, sw2 = self.connection.transmit(apdu)
+        except Exception:
+            apdu_monitor.record(self.reader_name, apdu, None, time.perf_counter() - started)
+            raise
+        apdu_monitor.record(self.reader_name, apdu, (sw1, sw2), time.perf_counter() - started)
+        if self.abandoned:
+            # Ответ пришел после срока: считыватель уже отдан новому потоку
+            raise ReaderAbandoned(f"Соединение со считывателем {self.reader_name} брошено")
+        return response, sw1, sw2
+
+    def transmit(self, apdu):
+        """Передача APDU операции"""
+        self.operation_apdus += 1
+        return self._send(apdu)
+
+    def probe_uid(self):
+        """Проверка соединения командой GET UID (None - карта не отвечает)"""
+        try:
+            response, sw1, sw2 = self._send(GET_UID_CMD)
+        except Exception:
+            return None
+        if sw1 == 0x90 and sw2 == 0x00:
+            return ''.join(f'{b:02X}' for b in response)
+        return None
+
+    def close(self):
+        """Закрытие соединения"""
+        try:
+            with pcsc_call(self.reader_name, "disconnect"):
+                self.connection.disconnect()
+        except Exception:
+            pass
+
+
+class ReaderConnectionPool:
+    """Пул соединений по имени считывателя
+
+    Соединение остается открытым, пока карта лежит на считывателе. Перед
+    каждой выдачей соединение проверяется командой GET UID: если карта
+    убрана или заменена, соединение переоткрывается. На время операции
+    считыватель блокируется, чтобы два вызова не перемешали APDU.
+    """
+
+    def __init__(self, registry=None):
+        # Реестр считывателей (PC/SC или симулятор)
+        self.registry = registry if registry is not None else reader_registry
+        self._lock = threading.Lock()
+        self._reader_locks = {}
+        # Блокировки, полученные потоком в acquire(): release() отпускает именно их,
+        # даже если сторож уже заменил блокировку считывателя
+        self._held = threading.local()
+        self._entries = {}
+        self.stats = {
+            "acquired": 0,
+            "reused": 0,
+            "connected": 0,
+            "reconnected": 0,
+            "card_swaps": 0,
+            "failures": 0,
+            "abandoned": 0,
+        }
+
+    def _reader_lock(self, reader_name):
+        with self._lock:
+            lock = self._reader_locks.get(reader_name)
+            if lock is None:
+                lock = threading.RLock()
+                self._reader_locks[reader_name] = lock
+            return lock
+
+    def _held_locks(self, reader_name):
+        locks = getattr(self._held, "locks", None)
+        if locks is None:
+            locks = self._held.locks = {}
+        return locks.setdefault(reader_name, [])
+
+    def _find_reader(self, reader_name):
+        """Поиск считывателя в реестре; перечисление - только если его там еще нет"""
+        reader = self.registry.get(reader_name)
+        if reader is None:
+            # Считыватель могли подключить после последнего опроса реестра
+            self.registry.refresh()
+            reader = self.registry.get(reader_name)
+        if reader is None:
+            raise Exception("Считыватель не найден!")
+        return reader
+
+    def _connect(self, reader_name):
+        reader = self._find_reader(reader_name)
+        connection = reader.createConnection()
+        with pcsc_call(reader_name, "connect"):
+            connection.connect(CardConnection.T1_protocol)
+        entry = PooledConnection(reader_name, connection)
+        try:
+            entry.geometry = detect_geometry(connection.getATR())
+        except Exception:
+            pass
+        return entry
+
+    def acquire(self, reader_name):
+        """Выдача проверенного соединения; считыватель блокируется до release()"""
+        lock = self._reader_lock(reader_name)
+        lock.acquire()
+        held = self._held_locks(reader_name)
+        held.append(lock)
+        try:
+            entry = self._entries.get(reader_name)
+            previous_uid = entry.uid if entry else None
+            uid = entry.probe_uid() if entry else None
+            if entry and uid is not None and uid == previous_uid:
+                self.stats["reused"] += 1
+            else:
+                if entry:
+                    # Карта убрана, заменена или соединение сломалось
+                    entry.close()
+                    self._entries.pop(reader_name, None)
+                    self.stats["reconnected"] += 1
+                entry = self._connect(reader_name)
+                self.stats["connected"] += 1
+                uid = entry.probe_uid()
+                if previous_uid is not None and uid != previous_uid:
+                    self.stats["card_swaps"] += 1
+                entry.uid = uid
+                if self._reader_locks.get(reader_name) is not lock:
+                    # Пока соединение открывалось, поток был брошен сторожем
+                    entry.abandoned = True
+                    entry.close()
+                    raise ReaderAbandoned(f"Соединение со считывателем {reader_name} брошено")
+                self._entries[reader_name] = entry
+            self.stats["acquired"] += 1
+            entry.uses += 1
+            entry.last_used = time.time()
+            entry.begin_operation()
+            return entry
+        except Exception:
+            self.stats["failures"] += 1
+            held.pop()
+            lock.release()
+            raise
+
+    def release(self, reader_name, discard=False):
+        """Возврат соединения в пул (discard=True - закрыть соединение)"""
+        held = self._held_locks(reader_name)
+        if not held:
+            raise RuntimeError(f"Считыватель {reader_name} не был получен этим потоком")
+        lock = held.pop()
+        try:
+            # Брошенный сторожем поток не закрывает соединение, открытое уже после него
+            if discard and self._reader_locks.get(reader_name) is lock:
+                self.invalidate(reader_name)
+        finally:
+            lock.release()
+
+    def invalidate(self, reader_name):
+        """Закрытие соединения считывателя"""
+        entry = self._entries.pop(reader_name, None)
+        if entry:
+            entry.close()
+
+    def abandon(self, reader_name):
+        """Отказ от зависшего считывателя
+
+        Поток, застрявший в вызове PC/SC, держит блокировку считывателя;
+        новая блокировка позволяет следующему потоку открыть новое
+        соединение. Старое соединение закрывается в отдельном потоке -
+        disconnect тоже может зависнуть.
+        """
+        with self._lock:
+            self._reader_locks[reader_name] = threading.RLock()
+            entry = self._entries.pop(reader_name, None)
+            self.stats["abandoned"] += 1
+        if entry:
+            entry.abandoned = True
+            threading.Thread(target=entry.close, daemon=True, name=f"pcsc-close-{reader_name}").start()
+
+    def close_all(self):
+        """Закрытие всех соединений пула"""
+        for reader_name in list(self._entries):
+            self.invalidate(reader_name)
+
+    def get_stats(self):
+        """Статистика пула и доля переиспользованных соединений"""
+        stats = dict(self.stats)
+        acquired = stats["acquired"]
+        stats["reuse_rate"] = round(stats["reused"] / acquired, 3) if acquired else 0.0
+        stats["readers"] = {
+            name: {"uid": entry.uid, "card": entry.geometry.name, "uses": entry.uses,
+                   "age": round(time.time() - entry.created_at, 1),
+                   "key_slots": dict(entry.key_slots.totals)}
+            for name, entry in list(self._entries.items())
+        }
+        return stats
@@ -0,0 +1,170 @@
+"""Реестр подключенных считывателей
+
+Перечисление считывателей PC/SC (smartcard.System.readers()) - обращение
+к службе смарт-карт, и раньше оно выполнялось на каждое обновление списка
+в окне, на каждое задание сервера и при промахе кэша пула. Теперь список
+опрашивается одним фоновым потоком раз в READER_POLL_INTERVAL, хранится
+словарем "имя -> считыватель", а подписчики (окно Eel, клиенты WebSocket,
+пул соединений) получают изменения: считыватель подключили или отключили.
+
+Перечисление PC/SC может зависнуть вместе с драйвером. Поэтому опрос
+идет в одном долгоживущем потоке, а внеочередной refresh() только будит
+его и ждет результата: зависшее перечисление держит один поток, а не
+новый на каждый опрос, и следующий опрос не начинается, пока не
+закончился предыдущий.
+
+    reader_registry.start()
+    reader_registry.add_listener(lambda added, removed, names: ...)
+    reader = reader_registry.get("ACR1252 0")
+"""
+import threading
+from card_simulator import system_readers
+from reader_watchdog import APDU_TIMEOUT
+
+# Период опроса списка считывателей, секунд
+READER_POLL_INTERVAL = 0.5
+
+
+class ReaderRegistry:
+    """Кэшированный список считывателей с уведомлениями об изменениях"""
+
+    def __init__(self, list_readers=system_readers, interval=READER_POLL_INTERVAL):
+        # Источник списка считывателей (PC/SC или симулятор)
+        self.list_readers = list_readers
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._scanned = threading.Condition(self._lock)
+        self._readers = {}
+        self._listeners = []
+        self._loaded = False
+        # Идет перечисление и число законченных перечислений
+        self._scanning = False
+        self._scan_count = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self.error = None
+        self.stats = {"scans": 0, "changes": 0, "errors": 0, "skipped": 0, "timeouts": 0}
+
+    def start(self):
+        """Запуск фонового опроса (повторный вызов ничего не делает)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll_loop, daemon=True, name="reader-registry")
+        self._thread.start()
+        # Первый список нужен сразу после запуска
+        self.refresh()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            self._scan()
+            self._wake.wait(self.interval)
+
+    def refresh(self, timeout=APDU_TIMEOUT):
+        """Внеочередное перечисление считывателей
+
+        Ждет до timeout секунд перечисления, начатого после вызова. При
+        фоновом опросе его выполняет поток опроса, без него (пакетный
+        режим) - разовый поток, и то лишь если предыдущее перечисление
+        уже закончилось. Если перечисление не удалось или не ответило,
+        прежний список сохраняется, а ошибка - в self.error.
+        """
+        polling = self._thread is not None and self._thread.is_alive()
+        with self._scanned:
+            target = self._scan_count + 1
+            if polling:
+                # Уже идущее перечисление могло начаться до подключения считывателя
+                if self._scanning:
+                    target += 1
+                self._wake.set()
+            elif not self._scanning:
+                threading.Thread(target=self._scan, daemon=True, name="reader-registry-scan").start()
+            if not self._scanned.wait_for(lambda: self._scan_count >= target, timeout):
+                self._loaded = True
+                self.stats["timeouts"] += 1
+                self.error = "Перечисление считывателей не отвечает"
+
+    def _scan(self):
+        """Перечисление считывателей и уведомление подписчиков об изменениях"""
+        with self._lock:
+            if self._scanning:
+                # Предыдущее перечисление еще не закончилось (зависло)
+                self.stats["skipped"] += 1
+                return
+            self._scanning = True
+        try:
+            found = {reader.name: reader for reader in self.list_readers()}
+            error = None
+        except Exception as e:
+            found = None
+            error = f"Не удалось получить список считывателей: {e}"
+        with self._lock:
+            self._scanning = False
+            self._scan_count += 1
+            self._scanned.notify_all()
+            self.stats["scans"] += 1
+            self._loaded = True
+            self.error = error
+            if found is None:
+                self.stats["errors"] += 1
+                return
+            added = [name for name in found if name not in self._readers]
+            removed = [name for name in self._readers if name not in found]
+            self._readers = found
+            if not added and not removed:
+                return
+            self.stats["changes"] += 1
+            listeners = list(self._listeners)
+            names = list(found)
+        for listener in listeners:
+            try:
+                listener(added, removed, names)
+            except Exception:
+                pass
+
+    def _ensure_loaded(self):
+        # Без фонового опроса (пакетный режим) список читается при первом обращении
+        if not self._loaded:
+            self.refresh()
+
+    def get(self, reader_name):
+        """Считыватель по имени (None, если он не подключен)"""
+        self._ensure_loaded()
+        return self._readers.get(reader_name)
+
+    def __contains__(self, reader_name):
+        return self.get(reader_name) is not None
+
+    def names(self):
+        """Имена подключенных считывателей"""
+        self._ensure_loaded()
+        return list(self._readers)
+
+    def add_listener(self, listener):
+        """listener(added, removed, names) вызывается в потоке опроса при изменении списка"""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["readers"] = len(self._readers)
+            stats["error"] = self.error
+            stats["polling"] = bool(self._thread and self._thread.is_alive())
+            return stats
+
+
+# Общий реестр приложения
+reader_registry = ReaderRegistry()
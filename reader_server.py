@@ -0,0 +1,754 @@
+"""Сервер считывателей: операции над картами по HTTP и WebSocket
+
+Считыватели подключены к одному компьютеру, а проверять замки и писать
+настроечные карты нужно и со стойки администратора, и с планшета
+техника. Сервер принимает задания по сети (цикл asyncio, только
+стандартная библиотека) и ставит их в очереди считывателей вместе с
+заданиями окна Eel, которое работает с сервером как еще один клиент.
+
+Задания одного считывателя выполняются по одному в его собственном
+потоке, разных считывателей - параллельно. Очередь считывателя
+справедливая: клиенты обслуживаются по кругу. Для каждого задания и в
+статистике разделены ожидание в очереди и время выполнения. Сторож
+(reader_watchdog.py) бросает поток, зависший в PC/SC, и задание
+завершается со статусом "timeout".
+
+HTTP (JSON):
+    GET  /api/readers               список считывателей
+    GET  /api/operations            операции и их параметры
+    POST /api/jobs                  {"op": "check", "reader": "...", "wait": true}
+    GET  /api/jobs, /api/jobs/<id>  задания
+    POST /api/jobs/<id>/cancel      отмена задания
+    GET  /api/stats                 очереди, ожидание и выполнение по считывателям и клиентам
+
+WebSocket /ws: сообщения {"type": "run", "ref": 1, "op": ..., "reader": ...},
+{"type": "cancel", "job_id": ...}, {"type": "stats"}; сервер присылает
+queued, progress, event и finished с заданием, а при подключении или
+отключении считывателя - {"type": "readers", "readers": [...]}.
+
+    python reader_server.py --host 0.0.0.0 --port 8766 --token secret
+    python reader_server.py --simulator 2 --token secret
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from urllib.parse import parse_qs, urlsplit
+from apdu_monitor import LatencyHistogram
+from audit_store import AuditStore
+from card_service import (CONFIG_FILE, DEFAULT_SERVER_PORT, OPERATIONS, CardService,
+                          load_config, resolve_operation)
+from reader_registry import reader_registry
+from job_queue import Job, MAX_FINISHED_JOBS
+from reader_watchdog import WATCHDOG_INTERVAL, ReaderWatchdog, ReaderWorker
+
+# Наибольший размер тела запроса и сообщения WebSocket, байт
+MAX_MESSAGE_SIZE = 64 * 1024
+# Сколько клиентов без заданий помнит справедливая очередь
+MAX_TRACKED_CLIENTS = 256
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_TEXT, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x8, 0x9, 0xA
+
+HttpRequest = namedtuple("HttpRequest", "method path query headers body peer")
+
+HTTP_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 401: "Unauthorized",
+                403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 415: "Unsupported Media Type"}
+
+
+class ServerJob(Job):
+    """Задание сервера: клиент, который его поставил, и обработчик завершения"""
+
+    def __init__(self, job_id, name, reader_name, func, args, client, on_finished=None):
+        super().__init__(job_id, name, reader_name, func, args)
+        self.client = client
+        self.on_finished = on_finished
+
+    def to_dict(self):
+        job = super().to_dict()
+        job["client"] = self.client
+        return job
+
+
+class FairReaderQueue:
+    """Очередь заданий одного считывателя с обходом клиентов по кругу
+
+    У каждого клиента своя FIFO очередь, следующее задание берется у
+    клиента, который дольше всех не обслуживался (новый клиент - первым):
+    пакет из сотни карт с ноутбука наладчика не задерживает проверку
+    замка на стойке администратора больше чем на одно задание.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        # Номер последнего обслуживания клиента
+        self._served = {}
+        self._turns = itertools.count()
+
+    def __len__(self):
+        return sum(len(jobs) for jobs in self._clients.values())
+
+    def put(self, job):
+        self._clients.setdefault(job.client, deque()).append(job)
+
+    def get(self):
+        """Следующее задание или None, если очередь пуста"""
+        if not self._clients:
+            return None
+        client = min(self._clients, key=lambda name: self._served.get(name, -1))
+        jobs = self._clients[client]
+        job = jobs.popleft()
+        self._served[client] = next(self._turns)
+        if not jobs:
+            self._drop(client)
+        return job
+
+    def remove(self, job):
+        jobs = self._clients.get(job.client)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                self._drop(job.client)
+
+    def _drop(self, client):
+        del self._clients[client]
+        if len(self._served) > MAX_TRACKED_CLIENTS:
+            self._served = {name: turn for name, turn in self._served.items() if name in self._clients}
+
+    def clients(self):
+        """Число заданий в очереди по клиентам"""
+        return {client: len(jobs) for client, jobs in self._clients.items()}
+
+
+class TimingStats:
+    """Ожидание в очереди и время выполнения заданий"""
+
+    def __init__(self):
+        self.done = 0
+        self.wait = LatencyHistogram()
+        self.service = LatencyHistogram()
+
+    def add(self, job):
+        self.done += 1
+        self.wait.add((job.started_at - job.created_at) * 1000)
+        self.service.add((job.finished_at - job.started_at) * 1000)
+
+    def to_dict(self):
+        return {"done": self.done, "wait": self.wait.to_dict(), "service": self.service.to_dict()}
+
+
+class ReaderServer:
+    """Очереди считывателей и HTTP/WebSocket сервер над ними
+
+    port=0 - без сетевого доступа (только задания, поставленные submit()).
+    token обязателен для работы по сети: клиенты передают его в заголовке
+    "Authorization: Bearer <token>" или параметром ?token=. origins -
+    страницы (Origin), с которых браузеру разрешено подключаться по WebSocket.
+    """
+
+    def __init__(self, service, host="127.0.0.1", port=DEFAULT_SERVER_PORT, token="", watchdog=None,
+                 registry=None, origins=()):
+        self.service = service
+        self.registry = registry if registry is not None else reader_registry
+        self.host = host
+        self.port = port
+        self.token = token or ""
+        # Страницы, которым разрешено подключение по WebSocket (заголовок Origin)
+        self.origins = set(origins or ())
+        self.loop = None
+        self.error = None
+        self._server = None
+        self._thread = None
+        # Сроки APDU и операций; у каждого считывателя свой поток PC/SC
+        self.watchdog = watchdog or ReaderWatchdog()
+        self._reader_workers = {}
+        self._abandoned_workers = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = OrderedDict()
+        self._queues = {}
+        self._running = {}
+        self._wakeups = {}
+        self._dispatchers = {}
+        self._reader_stats = {}
+        self._client_stats = {}
+        self._connections = 0
+        # Отправка сообщений подключенным клиентам WebSocket
+        self._subscribers = set()
+
+    # --- Очереди считывателей ---
+
+    def submit(self, client, name, reader_name, func, *args, on_finished=None):
+        """Постановка задания в очередь считывателя; func(job, *args) -> результат
+
+        Можно вызывать из любого потока. on_finished(job) вызывается после
+        завершения или отмены задания.
+        """
+        with self._lock:
+            job = ServerJob(f"job-{next(self._ids)}", name, reader_name, func, args, client, on_finished)
+            self._jobs[job.id] = job
+            self._queues.setdefault(reader_name, FairReaderQueue()).put(job)
+            self._trim()
+        self.loop.call_soon_threadsafe(self._wake, reader_name)
+        return job
+
+    def call(self, client, name, reader_name, func, *args):
+        """Задание в очереди считывателя с ожиданием результата
+
+        Для рабочих потоков (сессии записи настроечных карт), не для цикла
+        asyncio: операция выполняется в потоке считывателя под присмотром
+        сторожа, и зависший считыватель дает результат "timeout".
+        """
+        done = threading.Event()
+        job = self.submit(client, name, reader_name, func, *args, on_finished=lambda job: done.set())
+        done.wait()
+        return job.result
+
+    def submit_operation(self, client, spec, send=None, on_finished=None):
+        """Задание из описания {"op", "reader", параметры}; send(message) - ход выполнения"""
+        name, args = resolve_operation(spec)
+        reader_name = spec.get("reader")
+        if not reader_name:
+            raise Exception("Укажите считыватель")
+        if reader_name not in self.registry:
+            raise Exception(f"Считыватель не найден: {reader_name}")
+        return self.submit(client, name, reader_name, self._run_operation, name, args, send,
+                           on_finished=on_finished)
+
+    def _run_operation(self, job, name, args, send):
+        operation, _ = OPERATIONS[name]
+
+        def progress(done, total, message):
+            job.progress = {"done": done, "total": total, "message": message}
+            if send:
+                send({"type": "progress", "job_id": job.id, **job.progress})
+
+        def emit(event):
+            if send:
+                send({"type": "event", "job_id": job.id, "event": event})
+
+        return self.service.run(job.reader_name, operation, *args, progress=progress,
+                                cancel_event=job.cancel_event, emit=emit)
+
+    def _wake(self, reader_name):
+        """Пробуждение обработчика очереди считывателя (в потоке цикла asyncio)"""
+        event = self._wakeups.get(reader_name)
+        if event is None:
+            event = self._wakeups[reader_name] = asyncio.Event()
+            self._dispatchers[reader_name] = self.loop.create_task(self._dispatcher(reader_name, event))
+        event.set()
+
+    async def _dispatcher(self, reader_name, event):
+        """Обработчик очереди считывателя: задания по одному в потоке считывателя"""
+        while True:
+            await event.wait()
+            event.clear()
+            while True:
+                job = self._next_job(reader_name)
+                if job is None:
+                    break
+                job.result = await self._execute_watched(reader_name, job)
+                self._finished(job)
+
+    def _next_job(self, reader_name):
+        with self._lock:
+            job = self._queues[reader_name].get()
+            if job is not None:
+                job.status = "running"
+                job.started_at = time.time()
+                self._running[reader_name] = job
+            return job
+
+    def _reader_worker(self, reader_name):
+        worker = self._reader_workers.get(reader_name)
+        if worker is None:
+            worker = self._reader_workers[reader_name] = ReaderWorker(reader_name)
+        return worker
+
+    async def _execute_watched(self, reader_name, job):
+        """Выполнение задания в потоке считывателя под присмотром сторожа"""
+        worker = self._reader_worker(reader_name)
+        done = asyncio.wrap_future(worker.submit(self._execute, job))
+        deadline_reason = None
+        while True:
+            finished, _ = await asyncio.wait({done}, timeout=WATCHDOG_INTERVAL)
+            if finished:
+                result = done.result()
+                if deadline_reason and result.get("status") == "cancelled":
+                    # Отменено сторожем по сроку операции, а не пользователем
+                    job.status = "timeout"
+                    result["status"] = "timeout"
+                    result["error"] = deadline_reason
+                return result
+            verdict = self.watchdog.check(job, worker.ident)
+            if verdict is None:
+                continue
+            action, reason = verdict
+            if action == "cancel":
+                if deadline_reason is None:
+                    deadline_reason = reason
+                    job.cancel_event.set()
+                    self.watchdog.record(reader_name, action, reason)
+                continue
+            self._abandon(reader_name, worker, job, reason)
+            return {"status": "timeout", "data": "", "error": reason}
+
+    def _abandon(self, reader_name, worker, job, reason):
+        """Поток считывателя завис в PC/SC: он бросается, следующее задание получит новый"""
+        job.cancel_event.set()
+        job.status = "timeout"
+        worker.abandon()
+        self._abandoned_workers = [other for other in self._abandoned_workers if other.alive] + [worker]
+        if self._reader_workers.get(reader_name) is worker:
+            del self._reader_workers[reader_name]
+        self.service.pool.abandon(reader_name)
+        self.watchdog.record(reader_name, "abandon", reason)
+        self.service.notify(reason)
+
+    def _execute(self, job):
+        """Выполнение задания в потоке считывателя"""
+        try:
+            result = job.func(job, *job.args)
+            if job.status == "running":
+                job.status = "cancelled" if job.cancelled else "done"
+            return result
+        except Exception as e:
+            if job.status == "running":
+                job.status = "error"
+            return {"status": "error", "data": "", "error": f"Ошибка: {e}"}
+
+    def _finished(self, job):
+        with self._lock:
+            if job.started_at is not None:
+                job.finished_at = time.time()
+                self._running.pop(job.reader_name, None)
+                self._reader_stats.setdefault(job.reader_name, TimingStats()).add(job)
+                self._client_stats.setdefault(job.client, TimingStats()).add(job)
+        if job.on_finished:
+            try:
+                job.on_finished(job)
+            except Exception as e:
+                print(f"Ошибка обработчика задания {job.id}: {e}")
+
+    def cancel(self, job_id):
+        """Отмена задания: из очереди удаляется сразу, выполняющееся - между секторами"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.status not in ("queued", "running"):
+                return False
+            job.cancel_event.set()
+            was_queued = job.status == "queued"
+            if was_queued:
+                self._queues[job.reader_name].remove(job)
+                job.status = "cancelled"
+                job.result = {"status": "cancelled", "data": "", "error": "Операция отменена"}
+        if was_queued:
+            self._finished(job)
+        return True
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def list_jobs(self):
+        return [job.to_dict() for job in list(self._jobs.values())]
+
+    def _trim(self):
+        """Удаление самых старых завершенных заданий (под self._lock)"""
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.status in ("done", "error", "cancelled", "timeout")]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def readers(self):
+        return self.registry.names()
+
+    def _readers_changed(self, added, removed, names):
+        """Новый список считывателей клиентам WebSocket (в потоке реестра)"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for send in subscribers:
+            send({"type": "readers", "readers": names, "added": added, "removed": removed})
+
+    def get_stats(self):
+        """Очереди считывателей, ожидание и выполнение по считывателям и клиентам"""
+        with self._lock:
+            readers = {}
+            for reader_name in set(self._queues) | set(self._reader_stats):
+                queue = self._queues.get(reader_name)
+                running = self._running.get(reader_name)
+                stats = self._reader_stats.get(reader_name, TimingStats()).to_dict()
+                stats["queued"] = len(queue) if queue else 0
+                stats["queued_by_client"] = queue.clients() if queue else {}
+                stats["running"] = running.id if running else None
+                readers[reader_name] = stats
+            return {
+                "listening": f"{self.host}:{self.port}" if self._server else None,
+                "error": self.error,
+                "connections": self._connections,
+                "readers": readers,
+                "clients": {client: stats.to_dict() for client, stats in self._client_stats.items()},
+                "watchdog": self.watchdog.get_stats(),
+                "registry": self.registry.get_stats(),
+                # Брошенные потоки, которые все еще висят в драйвере
+                "hung_threads": sum(1 for worker in self._abandoned_workers if worker.alive),
+            }
+
+    # --- Запуск и остановка ---
+
+    async def _listen(self):
+        self.loop = asyncio.get_running_loop()
+        self.registry.add_listener(self._readers_changed)
+        if not self.port:
+            return
+        if not self.token:
+            # Без токена любая страница в браузере оператора могла бы ставить задания
+            self.error = "Сервер считывателей не запущен: задайте токен доступа (reader_server_token)"
+            print(self.error)
+            return
+        try:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, int(self.port))
+        except OSError as e:
+            self.error = f"Сервер считывателей не запущен ({self.host}:{self.port}): {e}"
+            print(self.error)
+
+    def start(self):
+        """Запуск цикла asyncio в отдельном потоке (для окна Eel)"""
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self._listen())
+            ready.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True, name="reader-server")
+        self._thread.start()
+        ready.wait()
+
+    async def serve_forever(self):
+        """Работа сервера в текущем цикле asyncio (запуск без окна)"""
+        await self._listen()
+        if self._server is None:
+            raise Exception(self.error or "Не задан порт сервера")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def shutdown(self):
+        """Отмена всех заданий и остановка сервера"""
+        self.registry.remove_listener(self._readers_changed)
+        for job in list(self._jobs.values()):
+            job.cancel_event.set()
+        if self.loop is not None and self._thread is not None:
+            self.loop.call_soon_threadsafe(self._stop)
+        for worker in list(self._reader_workers.values()):
+            worker.stop()
+
+    def _stop(self):
+        """Остановка цикла asyncio, запущенного start() (в потоке цикла)"""
+        if self._server is not None:
+            self._server.close()
+        for task in self._dispatchers.values():
+            task.cancel()
+        # Отмененные обработчики завершаются раньше остановки цикла
+        self.loop.call_soon(self.loop.stop)
+
+    # --- HTTP ---
+
+    def _authorized(self, request):
+        if not self.token:
+            return False
+        header = request.headers.get("authorization", "")
+        supplied = header[7:] if header.startswith("Bearer ") else request.query.get("token", [""])[0]
+        return hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    def _origin_allowed(self, request):
+        """WebSocket из браузера - только со страниц из списка; клиенты без Origin не ограничены"""
+        origin = request.headers.get("origin")
+        return origin is None or origin in self.origins
+
+    def _client_name(self, request, spec=None):
+        """Клиент для справедливой очереди: заданный явно или адрес подключения"""
+        client = (spec or {}).get("client") or request.headers.get("x-client") or \
+            request.query.get("client", [""])[0]
+        return str(client or request.peer)
+
+    async def _handle_connection(self, reader, writer):
+        self._connections += 1
+        try:
+            request = await read_http_request(reader, writer)
+            if request is None:
+                return
+            if not self._authorized(request):
+                write_response(writer, 401, {"status": "error", "error": "Неверный токен"})
+            elif request.path == "/ws" and request.headers.get("upgrade", "").lower() == "websocket":
+                if not self._origin_allowed(request):
+                    write_response(writer, 403, {"status": "error", "error": "Подключение с этой страницы запрещено"})
+                else:
+                    await self._websocket(request, reader, writer)
+            else:
+                status, payload = await self._route(request)
+                write_response(writer, status, payload)
+            await writer.drain()
+        except ValueError as e:
+            write_response(writer, 413 if "размер" in str(e) else 400, {"status": "error", "error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def _route(self, request):
+        """Обработка запроса HTTP API: (код ответа, JSON)"""
+        parts = [part for part in request.path.split("/") if part]
+        if parts[:1] != ["api"]:
+            return 404, {"status": "error", "error": "Неизвестный адрес"}
+        parts = parts[1:]
+        if request.method == "GET":
+            if parts == ["readers"]:
+                return 200, {"status": "success", "readers": self.readers()}
+            if parts == ["operations"]:
+                return 200, {"status": "success", "operations": {
+                    name: [param for param, _ in params] for name, (_, params) in OPERATIONS.items()}}
+            if parts == ["jobs"]:
+                return 200, {"status": "success", "jobs": self.list_jobs()}
+            if len(parts) == 2 and parts[0] == "jobs":
+                job = self.get(parts[1])
+                return (200, job) if job else (404, {"status": "error", "error": "Задание не найдено"})
+            if parts == ["stats"]:
+                return 200, self.get_stats()
+        elif request.method == "POST":
+            if parts == ["jobs"]:
+                return await self._post_job(request)
+            if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                return 200, {"status": "success" if self.cancel(parts[1]) else "error"}
+        else:
+            return 405, {"status": "error", "error": "Метод не поддерживается"}
+        return 404, {"status": "error", "error": "Неизвестный адрес"}
+
+    async def _post_job(self, request):
+        # Простой междоменный запрос браузера (text/plain, форма) сюда не проходит
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            return 415, {"status": "error", "error": "Ожидается Content-Type: application/json"}
+        try:
+            spec = json.loads(request.body or b"{}")
+            if not isinstance(spec, dict):
+                raise Exception("Задание должно быть объектом JSON")
+        except ValueError as e:
+            return 400, {"status": "error", "error": f"Неверный JSON: {e}"}
+        done = self.loop.create_future()
+
+        def on_finished(job):
+            self.loop.call_soon_threadsafe(lambda: done.done() or done.set_result(job))
+
+        try:
+            job = await self.loop.run_in_executor(
+                None, lambda: self.submit_operation(self._client_name(request, spec), spec,
+                                                              on_finished=on_finished))
+        except Exception as e:
+            return 400, {"status": "error", "error": str(e)}
+        if not spec.get("wait"):
+            return 200, {"status": "queued", "job_id": job.id}
+        await done
+        return 200, job.to_dict()
+
+    # --- WebSocket ---
+
+    async def _websocket(self, request, reader, writer):
+        key = request.headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        client = self._client_name(request)
+        outbox = asyncio.Queue()
+        loop = self.loop
+
+        def send(message, opcode=WS_TEXT):
+            payload = message if isinstance(message, bytes) else \
+                json.dumps(message, ensure_ascii=False, default=str).encode("utf-8")
+            loop.call_soon_threadsafe(outbox.put_nowait, (opcode, payload))
+
+        sender = loop.create_task(self._ws_sender(writer, outbox))
+        with self._lock:
+            self._subscribers.add(send)
+        try:
+            while True:
+                opcode, payload = await read_ws_frame(reader)
+                if opcode == WS_CLOSE:
+                    send(b"", WS_CLOSE)
+                    break
+                if opcode == WS_PING:
+                    send(payload, WS_PONG)
+                    continue
+                if opcode != WS_TEXT:
+                    continue
+                try:
+                    message = json.loads(payload.decode("utf-8"))
+                    reply = await self._ws_message(message, client, send)
+                except Exception as e:
+                    reply = {"type": "error", "error": str(e)}
+                if reply:
+                    send(reply)
+        finally:
+            with self._lock:
+                self._subscribers.discard(send)
+            # После уже запланированных send(), в том числе кадра закрытия
+            loop.call_soon(outbox.put_nowait, None)
+            await sender
+
+    async def _ws_message(self, message, client, send):
+        """Обработка сообщения клиента WebSocket; возвращает ответ"""
+        kind = message.get("type", "run")
+        if kind == "run":
+            ref = message.get("ref")
+
+            def on_finished(job):
+                send({"type": "finished", "ref": ref, "job": job.to_dict()})
+
+            job = await self.loop.run_in_executor(
+                None, lambda: self.submit_operation(message.get("client") or client, message,
+                                                              send=send, on_finished=on_finished))
+            return {"type": "queued", "ref": ref, "job_id": job.id,
+                    "position": self.get_stats()["readers"].get(job.reader_name, {}).get("queued", 0)}
+        if kind == "cancel":
+            return {"type": "cancel", "job_id": message.get("job_id"),
+                    "status": "success" if self.cancel(message.get("job_id")) else "error"}
+        if kind == "stats":
+            return {"type": "stats", "stats": self.get_stats()}
+        if kind == "readers":
+            return {"type": "readers", "readers": self.readers()}
+        return {"type": "error", "error": f"Неизвестный тип сообщения: {kind}"}
+
+    async def _ws_sender(self, writer, outbox):
+        """Отправка сообщений клиенту WebSocket по порядку"""
+        while True:
+            item = await outbox.get()
+            if item is None:
+                return
+            opcode, payload = item
+            try:
+                writer.write(ws_frame(opcode, payload))
+                await writer.drain()
+            except ConnectionError:
+                return
+            if opcode == WS_CLOSE:
+                return
+
+
+async def read_http_request(reader, writer):
+    """Запрос HTTP/1.1 (None, если клиент закрыл соединение)"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("Превышен размер заголовков")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise ValueError("Неверная строка запроса")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError("Превышен размер тела запроса")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    peer = writer.get_extra_info("peername")
+    return HttpRequest(method.upper(), url.path, parse_qs(url.query), headers, body,
+                       peer[0] if peer else "local")
+
+
+def write_response(writer, status, payload):
+    """Ответ JSON; соединение закрывается после ответа"""
+    body = b"" if payload is None else json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+
+
+async def read_ws_frame(reader):
+    """Кадр WebSocket: (opcode, данные); кадры клиента замаскированы"""
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError("Превышен размер сообщения")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return opcode, payload
+
+
+def ws_frame(opcode, payload):
+    """Кадр WebSocket сервера (без маски, одним фрагментом)"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сервер считывателей: операции над картами по HTTP и WebSocket")
+    parser.add_argument("--host", help="адрес (по умолчанию - из конфигурации, 127.0.0.1)")
+    parser.add_argument("--port", type=int, help=f"порт (по умолчанию - из конфигурации, {DEFAULT_SERVER_PORT})")
+    parser.add_argument("--token", help="токен доступа клиентов (обязателен)")
+    parser.add_argument("--config", default=CONFIG_FILE, help="файл конфигурации")
+    parser.add_argument("--simulator", type=int, metavar="N", help="симулятор из N считывателей вместо PC/SC")
+    parser.add_argument("--no-audit", action="store_true", help="не записывать операции в журнал")
+    args = parser.parse_args(argv)
+
+    if args.simulator:
+        # До первого обращения к списку считывателей
+        os.environ["PSOFT_SIMULATOR"] = str(args.simulator)
+    config = load_config(args.config)
+    service = CardService(config, audit=None if args.no_audit else AuditStore(),
+                          notify=lambda message: print(message, file=sys.stderr))
+    server = ReaderServer(service, host=args.host or config.get("reader_server_host", "127.0.0.1"),
+                          port=args.port or config.get("reader_server_port") or DEFAULT_SERVER_PORT,
+                          token=args.token if args.token is not None else config.get("reader_server_token", ""),
+                          origins=config.get("reader_server_origins", []))
+    reader_registry.start()
+    print(f"Сервер считывателей: http://{server.host}:{server.port}/api/readers", file=sys.stderr)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    finally:
+        server.shutdown()
+        reader_registry.stop()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
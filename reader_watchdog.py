@@ -0,0 +1,257 @@
+"""Сторож зависших считывателей: сроки APDU и операций
+
+Сбойный USB считыватель или драйвер PC/SC может навсегда застрять в
+connect/transmit: исключения нет, поток просто не возвращается. Каждый
+вызов PC/SC регистрируется в pcsc_calls со временем начала, и сторож
+сервера считывателей (reader_server.py) видит, что вызов идет дольше
+APDU_TIMEOUT или операция - дольше своего срока. Зависший поток
+считывателя бросается и заменяется новым, вызывающий получает результат
+со статусом "timeout", остальные считыватели продолжают работать.
+"""
+import itertools
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# Срок одного вызова PC/SC (APDU, connect, disconnect), секунд
+APDU_TIMEOUT = 5.0
+# Сроки операций, секунд; остальным операциям - DEFAULT_OPERATION_TIMEOUT
+OPERATION_TIMEOUTS = {
+    "dump_card": 120.0,
+    "clear_all_blocks": 180.0,
+    "encode": 60.0,
+    "decode": 60.0,
+}
+DEFAULT_OPERATION_TIMEOUT = 30.0
+# Сколько операция может завершаться после отмены по сроку, прежде чем поток бросят
+CANCEL_GRACE = 5.0
+# Период проверки сроков, секунд
+WATCHDOG_INTERVAL = 0.25
+
+PcscCall = namedtuple("PcscCall", "reader_name what started")
+
+
+class ReaderTimeout(Exception):
+    """Вызов PC/SC или операция не уложились в срок
+
+    thread - брошенный поток call_with_timeout(), который все еще ждет ответа.
+    """
+
+    def __init__(self, message, thread=None):
+        super().__init__(message)
+        self.thread = thread
+
+
+class ReaderAbandoned(Exception):
+    """Поток считывателя брошен сторожем; его результат больше никому не нужен"""
+
+
+class PcscCalls:
+    """Выполняющиеся вызовы PC/SC по потокам"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def begin(self, reader_name, what):
+        with self._lock:
+            self._calls[threading.get_ident()] = PcscCall(reader_name, what, time.monotonic())
+
+    def end(self):
+        with self._lock:
+            self._calls.pop(threading.get_ident(), None)
+
+    def current(self, thread_ident):
+        """Вызов PC/SC, который сейчас выполняет поток (None, если его нет)"""
+        with self._lock:
+            return self._calls.get(thread_ident)
+
+    def forget(self, thread_ident):
+        """Брошенный поток больше не отслеживается"""
+        with self._lock:
+            self._calls.pop(thread_ident, None)
+
+
+pcsc_calls = PcscCalls()
+
+
+@contextmanager
+def pcsc_call(reader_name, what):
+    """Учет вызова PC/SC: with pcsc_call(reader_name, apdu): connection.transmit(apdu)
+
+    what - APDU (список байт) или название вызова ("connect").
+    """
+    pcsc_calls.begin(reader_name, what)
+    try:
+        yield
+    finally:
+        pcsc_calls.end()
+
+
+def describe_call(call):
+    """Вызов PC/SC строкой: "APDU FF B0" или название"""
+    if isinstance(call.what, str):
+        return call.what
+    return "APDU " + " ".join(f"{byte:02X}" for byte in call.what[:2])
+
+
+def call_with_timeout(func, timeout=APDU_TIMEOUT, name="pcsc-call"):
+    """Вызов func() в отдельном потоке с ожиданием не дольше timeout
+
+    Если поток не успел, он бросается (daemon) и выбрасывается
+    ReaderTimeout; исключение func() передается вызывающему.
+    """
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True, name=name)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise ReaderTimeout(f"Считыватель не ответил за {timeout:g} с", thread)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+class HungCalls:
+    """Зависшие вызовы call_with_timeout() по считывателям
+
+    Пока брошенный поток считывателя висит в драйвере, новый вызов для
+    этого считывателя не запускается - иначе при опросе раз в доли секунды
+    зависшие потоки копились бы без ограничения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def call(self, reader_name, func, timeout=APDU_TIMEOUT, name="pcsc-call"):
+        """call_with_timeout(func); ReaderTimeout без thread сразу, если прежний вызов еще висит"""
+        with self._lock:
+            thread = self._threads.get(reader_name)
+            if thread is not None and not thread.is_alive():
+                del self._threads[reader_name]
+                thread = None
+        if thread is not None:
+            raise ReaderTimeout(f"Считыватель {reader_name} все еще не отвечает")
+        try:
+            return call_with_timeout(func, timeout, name)
+        except ReaderTimeout as e:
+            with self._lock:
+                self._threads[reader_name] = e.thread
+            raise
+
+
+class ReaderWorker:
+    """Отдельный поток PC/SC одного считывателя
+
+    Зависший в драйвере поток нельзя прервать, но можно бросить:
+    abandon() помечает его, и считыватель получает новый ReaderWorker.
+    Поток daemon и не мешает завершению приложения.
+    """
+
+    _generations = itertools.count(1)
+
+    def __init__(self, reader_name):
+        self.reader_name = reader_name
+        self.abandoned = False
+        self._tasks = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True,
+                                        name=f"pcsc-{reader_name}-{next(self._generations)}")
+        self._thread.start()
+
+    @property
+    def ident(self):
+        return self._thread.ident
+
+    @property
+    def alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, func, *args):
+        """Выполнение func(*args) в потоке считывателя; возвращает Future"""
+        future = Future()
+        self._tasks.put((future, func, args))
+        return future
+
+    def _loop(self):
+        while True:
+            task = self._tasks.get()
+            if task is None or self.abandoned:
+                return
+            future, func, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def stop(self):
+        self._tasks.put(None)
+
+    def abandon(self):
+        """Поток брошен: после возврата из зависшего вызова он завершится"""
+        self.abandoned = True
+        pcsc_calls.forget(self.ident)
+        self._tasks.put(None)
+
+
+class ReaderWatchdog:
+    """Сроки APDU и операций и счетчики срабатываний по считывателям"""
+
+    def __init__(self, apdu_timeout=APDU_TIMEOUT, operation_timeouts=None,
+                 default_timeout=DEFAULT_OPERATION_TIMEOUT, cancel_grace=CANCEL_GRACE):
+        self.apdu_timeout = apdu_timeout
+        self.operation_timeouts = dict(OPERATION_TIMEOUTS if operation_timeouts is None else operation_timeouts)
+        self.default_timeout = default_timeout
+        self.cancel_grace = cancel_grace
+        self._lock = threading.Lock()
+        self.readers = {}
+
+    def operation_timeout(self, name):
+        return self.operation_timeouts.get(name, self.default_timeout)
+
+    def check(self, job, thread_ident, now=None):
+        """Проверка выполняющегося задания: ("cancel" | "abandon", причина) или None
+
+        Зависший вызов PC/SC бросается сразу. Операция, вышедшая за срок,
+        сначала отменяется (между секторами), и только если за cancel_grace
+        она не завершилась, поток бросается.
+        """
+        now = time.time() if now is None else now
+        call = pcsc_calls.current(thread_ident)
+        if call is not None and time.monotonic() - call.started > self.apdu_timeout:
+            return "abandon", f"Считыватель не отвечает: {describe_call(call)} дольше {self.apdu_timeout:g} с"
+        timeout = self.operation_timeout(job.name)
+        elapsed = now - job.started_at
+        if elapsed > timeout + self.cancel_grace:
+            return "abandon", f"Операция {job.name} не завершилась за {timeout:g} с"
+        if elapsed > timeout:
+            return "cancel", f"Операция {job.name} превысила срок {timeout:g} с"
+        return None
+
+    def record(self, reader_name, action, reason):
+        """Учет срабатывания сторожа"""
+        with self._lock:
+            stats = self.readers.setdefault(reader_name, {"cancelled": 0, "abandoned": 0, "last": None})
+            stats["cancelled" if action == "cancel" else "abandoned"] += 1
+            stats["last"] = {"ts": time.time(), "action": action, "reason": reason}
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "apdu_timeout": self.apdu_timeout,
+                "operation_timeouts": dict(self.operation_timeouts),
+                "default_timeout": self.default_timeout,
+                "readers": {name: dict(stats) for name, stats in self.readers.items()},
+            }
@@ -1,67 +1,247 @@
+import queue
 import threading
 import time
-import ctypes
-from smartcard.System import readers
-from smartcard.CardMonitoring import CardMonitor, CardObserver
-from smartcard.util import toHexString
-import win32api
-import win32con
-import win32gui
-import win32clipboard
+from collections import deque
+from smartcard.CardMonitoring import CardObserver
+from card_simulator import create_card_monitor
+from uid_sinks import create_sinks
+from operation_profiler import operation_profiler
+from reader_watchdog import ReaderTimeout, call_with_timeout
+
+# Размер очереди событий карт; при переполнении отбрасывается самое старое появление карты
+EVENT_QUEUE_SIZE = 64
+# Окно анти-дублирования одного UID на одном считывателе, секунды
+DEDUPE_WINDOW = 1.0
+GET_UID_CMD = [0xFF, 0xCA, 0x00, 0x00, 0x00]
+
+
+class CardEventQueue:
+    """Ограниченная очередь событий карт (kind, card, detected_at)
+
+    Снятие карты не отбрасывается никогда: потерянное снятие оставило бы
+    соединение и UID прежней карты. При переполнении вместо него
+    отбрасывается самое старое появление карты.
+    """
+
+    def __init__(self, maxsize=EVENT_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._events = deque()
+        self._condition = threading.Condition()
+
+    def put(self, event):
+        """Постановка события; возвращает отброшенное событие или None"""
+        dropped = None
+        with self._condition:
+            if len(self._events) >= self.maxsize:
+                oldest_added = next((queued for queued in self._events if queued[0] == "added"), None)
+                if oldest_added is not None:
+                    self._events.remove(oldest_added)
+                    dropped = oldest_added
+                elif event[0] == "added":
+                    return event
+            self._events.append(event)
+            self._condition.notify()
+        return dropped
+
+    def get(self, timeout=None):
+        """Следующее событие; queue.Empty, если за timeout его не было"""
+        with self._condition:
+            if not self._events and not self._condition.wait_for(lambda: self._events, timeout):
+                raise queue.Empty
+            return self._events.popleft()
+
+    def qsize(self):
+        with self._condition:
+            return len(self._events)
 
 
 class RFIDCardObserver(CardObserver):
-    def __init__(self, callback=None):
+    """Наблюдатель CardMonitor с очередью событий
+
+    update() вызывается в потоке опроса CardMonitor и только ставит
+    событие в ограниченную очередь. Чтение UID и ввод выполняет отдельный
+    поток-диспетчер, поэтому медленный ввод не мешает монитору замечать
+    следующие прикладывания.
+
+    UID читается через соединение со считывателем самой карты;
+    соединение держится, пока карта лежит на считывателе, и повторное
+    появление карты проверяется одной командой GET UID на нем.
+    """
+
+    def __init__(self, callback=None, queue_size=EVENT_QUEUE_SIZE, dedupe_window=DEDUPE_WINDOW):
         self.callback = callback
+        self.dedupe_window = dedupe_window
+        self.events = CardEventQueue(queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Последний UID и время по каждому считывателю
+        self._last_seen = {}
+        # Карта на считывателе: открытое соединение и прочитанный UID
+        self._presence = {}
+        self.stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "dropped": 0,
+            "duplicates": 0,
+            "errors": 0,
+            "max_queue_depth": 0,
+            "uid_reads": 0,
+            "uid_cached": 0,
+            "atr_fallbacks": 0,
+            "timeouts": 0,
+        }
+
+    def start(self):
+        """Запуск потока-диспетчера"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True, name="rfid-dispatcher")
+        self._thread.start()
+
+    def stop(self):
+        """Остановка потока-диспетчера (необработанные события отбрасываются)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        for reader_name in list(self._presence):
+            self._release(reader_name)
 
     def update(self, observable, actions):
         (addedcards, removedcards) = actions
+        # Снятие карты обрабатывается в той же очереди, чтобы не обогнать ее появление
+        for card in removedcards:
+            self._enqueue("removed", card)
         for card in addedcards:
+            self._enqueue("added", card)
+
+    def _enqueue(self, kind, card):
+        event = (kind, card, time.time())
+        dropped = self.events.put(event)
+        with self._lock:
+            if dropped is not None:
+                self.stats["dropped"] += 1
+            if dropped is not event:
+                self.stats["enqueued"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.events.qsize())
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            try:
+                kind, card, detected_at = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                if kind == "removed":
+                    self._card_removed(card)
+                else:
+                    with operation_profiler.profile("card_detected", str(card.reader)):
+                        self._process(card, detected_at)
+            except Exception:
+                with self._lock:
+                    self.stats["errors"] += 1
+
+    def _process(self, card, detected_at):
+        # Получаем реальный UID карты
+        uid = self.get_real_card_uid(card)
+        if not uid:
+            return
+        reader_name = str(card.reader)
+        with self._lock:
+            last_uid, last_time = self._last_seen.get(reader_name, (None, 0))
+            self._last_seen[reader_name] = (uid, detected_at)
+            # Анти-дублирование отдельно для каждого считывателя
+            if uid == last_uid and detected_at - last_time <= self.dedupe_window:
+                self.stats["duplicates"] += 1
+                return
+            self.stats["processed"] += 1
+        if self.callback:
+            self.callback(uid, detected_at)
+
+    def _card_removed(self, card):
+        reader_name = str(card.reader)
+        self._release(reader_name)
+        with self._lock:
+            # Повторное прикладывание той же карты - новое событие
+            self._last_seen.pop(reader_name, None)
+
+    def _release(self, reader_name):
+        """Закрытие соединения с картой, которую убрали со считывателя"""
+        entry = self._presence.pop(reader_name, None)
+        if entry and entry["connection"] is not None:
             try:
-                # Получаем реальный UID карты
-                uid = self.get_real_card_uid(card)
-                if uid and self.callback:
-                    self.callback(uid)
-            except Exception as e:
+                call_with_timeout(entry["connection"].disconnect, name="rfid-disconnect")
+            except Exception:
                 pass
 
-    def get_real_card_uid(self, card):
-        """Получение реального UID карты с прямым подключением"""
-        try:
-            # Создаем новое подключение к карте
-            from smartcard.System import readers
-            reader_list = readers()
-            if not reader_list:
-                # Если нет считывателей, извлекаем из ATR
-                return self.extract_from_atr_fallback(card.atr)
-
-            # Используем первый доступный считыватель
-            reader = reader_list[0]
-            connection = reader.createConnection()
-            connection.connect()
+    def get_stats(self):
+        """Счетчики очереди событий"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["queue_depth"] = self.events.qsize()
+        stats["running"] = bool(self._thread and self._thread.is_alive())
+        return stats
 
+    def get_real_card_uid(self, card):
+        """Получение реального UID карты через соединение с ее считывателем
+
+        Соединение держится, пока карта лежит на считывателе. ATR у всех
+        карт 1K одинаковый, поэтому та же ли это карта, решает GET UID на
+        удерживаемом соединении: после замены карты оно ломается, и UID
+        читается через новое. ATR используется, только если GET UID не удался.
+        """
+        reader_name = str(card.reader)
+        entry = self._presence.get(reader_name)
+        if entry and entry["connection"] is not None:
             try:
-                # Метод 1: Прямое чтение UID
-                get_uid_cmd = [0xFF, 0xCA, 0x00, 0x00, 0x00]  # GET UID
-                response, sw1, sw2 = connection.transmit(get_uid_cmd)
-
-                if sw1 == 0x90 and sw2 == 0x00:
-                    uid = ''.join([f'{b:02X}' for b in response])
-                    return uid
-            except:
-                pass
-            finally:
-                try:
-                    connection.disconnect()
-                except:
-                    pass
+                uid = call_with_timeout(lambda: self._transmit_uid(entry["connection"]), name="rfid-uid")
+            except Exception:
+                uid = None
+            if uid is not None:
+                with self._lock:
+                    self.stats["uid_cached"] += 1
+                entry["uid"] = uid
+                return uid
+        self._release(reader_name)
+
+        connection = None
+        uid = None
+        try:
+            # Зависший считыватель не должен останавливать разбор событий остальных
+            connection, uid = call_with_timeout(lambda: self._read_uid(card), name="rfid-uid")
+        except ReaderTimeout:
+            with self._lock:
+                self.stats["timeouts"] += 1
+        except Exception:
+            pass
 
-            # Если прямое чтение не удалось, извлекаем из ATR
-            return self.extract_from_atr_fallback(card.atr)
+        with self._lock:
+            self.stats["uid_reads"] += 1
+            if uid is None:
+                self.stats["atr_fallbacks"] += 1
+        if uid is None:
+            # Прямое чтение не удалось - извлекаем из ATR
+            uid = self.extract_from_atr_fallback(card.atr)
+        self._presence[reader_name] = {"connection": connection, "uid": uid}
+        return uid
+
+    def _read_uid(self, card):
+        """Соединение с тем считывателем, на котором лежит карта, и UID (None, если GET UID не удался)"""
+        connection = card.createConnection()
+        connection.connect()
+        try:
+            return connection, self._transmit_uid(connection)
+        except Exception:
+            return connection, None
 
-        except Exception as e:
-            # Резервный метод - извлечение из ATR
-            return self.extract_from_atr_fallback(card.atr)
+    def _transmit_uid(self, connection):
+        """GET UID на открытом соединении (None, если карта ответила ошибкой)"""
+        response, sw1, sw2 = connection.transmit(GET_UID_CMD)
+        if sw1 == 0x90 and sw2 == 0x00:
+            return ''.join([f'{b:02X}' for b in response])
+        return None
 
     def extract_from_atr_fallback(self, atr_bytes):
         """Резервный метод извлечения из ATR"""
@@ -89,115 +269,23 @@ class RFIDCardObserver(CardObserver):
 
 
 class RFIDReader:
-    def __init__(self):
+    def __init__(self, sinks=None):
         self.card_monitor = None
         self.observer = None
         self.monitoring = False
-        self.english_layout = 0x00000409
-        self.last_uid = None
-        self.last_card_time = 0
-
-    def switch_to_english_temporarily(self):
-        """Временное переключение на английский язык"""
-        try:
-            # Множественные попытки переключения
-            for i in range(15):
-                try:
-                    ctypes.windll.user32.ActivateKeyboardLayout(self.english_layout, 0)
-                    ctypes.windll.user32.PostMessageW(0xFFFF, 0x0050, 0, self.english_layout)
-                except:
-                    pass
-                if i < 14:
-                    time.sleep(0.0001)
-            return True
-        except:
-            return False
-
-    def input_rfid_via_shift_keys(self, uid):
-        """Ввод RFID с удерживанием Shift для заглавных букв"""
-        try:
-            # Преобразуем UID в заглавные буквы
-            uid_upper = uid.upper()
-
-            # Вводим каждый символ с удерживанием Shift для букв
-            for char in uid_upper:
-                if char.isalnum():
-                    vk_code = None
-                    if char.isdigit():
-                        # Для цифр используем обычные коды
-                        vk_code = 0x30 + int(char)  # 0x30 = '0'
-                        win32api.keybd_event(vk_code, 0, 0, 0)
-                        time.sleep(0.001)
-                        win32api.keybd_event(vk_code, 0, win32con.KEYEVENTF_KEYUP, 0)
-                        time.sleep(0.001)
-                    elif char.isalpha():
-                        # Для букв удерживаем Shift
-                        vk_code = 0x41 + (ord(char.upper()) - ord('A'))  # 0x41 = 'A'
-                        win32api.keybd_event(0x10, 0, 0, 0)  # Shift down
-                        time.sleep(0.0005)
-                        win32api.keybd_event(vk_code, 0, 0, 0)  # Key down
-                        time.sleep(0.001)
-                        win32api.keybd_event(vk_code, 0, win32con.KEYEVENTF_KEYUP, 0)  # Key up
-                        time.sleep(0.0005)
-                        win32api.keybd_event(0x10, 0, win32con.KEYEVENTF_KEYUP, 0)  # Shift up
-                        time.sleep(0.001)
-
-            return True
-        except Exception as e:
-            return False
-
-    def input_rfid_via_clipboard(self, uid):
-        """Ввод RFID через буфер обмена (заглавными буквами)"""
-        try:
-            # Преобразуем UID в заглавные буквы
-            uid_upper = uid.upper()
-
-            # Копируем в буфер обмена
-            win32clipboard.OpenClipboard()
-            win32clipboard.EmptyClipboard()
-            win32clipboard.SetClipboardText(uid_upper)
-            win32clipboard.CloseClipboard()
-
-            time.sleep(0.005)
-
-            # Ctrl+V
-            win32api.keybd_event(0x11, 0, 0, 0)  # Ctrl down
-            time.sleep(0.001)
-            win32api.keybd_event(0x56, 0, 0, 0)  # V down
-            time.sleep(0.001)
-            win32api.keybd_event(0x56, 0, win32con.KEYEVENTF_KEYUP, 0)  # V up
-            time.sleep(0.001)
-            win32api.keybd_event(0x11, 0, win32con.KEYEVENTF_KEYUP, 0)  # Ctrl up
-
-            return True
-        except Exception as e:
-            return False
-
-    def handle_card_detected(self, uid):
-        """Обработчик обнаружения карты"""
-        current_time = time.time()
-
-        # Анти-дублирование (1 секунда)
-        if uid != self.last_uid or (current_time - self.last_card_time) > 1.0:
-            self.last_uid = uid
-            self.last_card_time = current_time
-
-            try:
-                # Переключаем на английский
-                self.switch_to_english_temporarily()
+        # Приемники UID (клавиатура, буфер обмена, сокет, файл/stdout)
+        self.sinks = sinks if sinks is not None else create_sinks({})
 
-                # Ждем немного
-                time.sleep(0.02)  # 20 миллисекунд
+    def set_sinks(self, sinks):
+        """Замена приемников UID (старые закрываются)"""
+        old_sinks, self.sinks = self.sinks, sinks
+        for sink in old_sinks:
+            sink.close()
 
-                # Пробуем ввести через Shift (для заглавных букв)
-                success = self.input_rfid_via_shift_keys(uid)
-
-                if not success:
-                    # Если не удалось, пробуем через буфер обмена
-                    self.input_rfid_via_clipboard(uid)
-
-            except Exception as e:
-                pass
+    def handle_card_detected(self, uid, detected_at=None):
+        """Обработчик обнаружения карты (поток-диспетчер, повторы уже отсеяны)"""
+        for sink in list(self.sinks):
+            sink.send(uid, detected_at)
 
     def start_monitoring(self):
         """Запуск мониторинга карт"""
@@ -205,11 +293,12 @@ class RFIDReader:
             return
 
         try:
-            self.card_monitor = CardMonitor()
+            self.card_monitor = create_card_monitor()
             self.observer = RFIDCardObserver(self.handle_card_detected)
+            self.observer.start()
             self.card_monitor.addObserver(self.observer)
             self.monitoring = True
-        except Exception as e:
+        except Exception:
             pass
 
     def stop_monitoring(self):
@@ -219,9 +308,20 @@ class RFIDReader:
         try:
             if self.card_monitor and self.observer:
                 self.card_monitor.deleteObserver(self.observer)
+                self.observer.stop()
             self.monitoring = False
         except:
             pass
+        for sink in self.sinks:
+            sink.close()
+
+    def get_stats(self):
+        """Состояние мониторинга и счетчики очереди событий"""
+        stats = {"monitoring": self.monitoring}
+        if self.observer:
+            stats.update(self.observer.get_stats())
+        stats["sinks"] = {sink.name: sink.get_stats() for sink in self.sinks}
+        return stats
 
 
 # Глобальный экземпляр RFID читателя
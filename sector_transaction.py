@@ -0,0 +1,132 @@
+from card_keyring import KEY_TYPE_CODES
+from apdu_monitor import apdu_monitor
+
+# Ответ карты, после которого аутентификация сектора сохраняется
+SW_OK = (0x90, 0x00)
+# Ответ вместо команды, которую не отправили: сектор не удалось аутентифицировать заново
+SW_AUTH_FAILED = (0x63, 0x00)
+
+
+def authenticate_sector(connection, keyring, sector, preferred=(), key_types=("A",)):
+    """Перебор ключей сектора: сначала подошедший к этой карте, затем адаптивный порядок
+
+    Возвращает (тип ключа, ключ) или None.
+    """
+    for key_type, key in keyring.candidates(connection.uid, sector, preferred, key_types):
+        if connection.key_slots.authenticate(connection, sector, KEY_TYPE_CODES[key_type], key):
+            keyring.record_success(connection.uid, sector, key_type, key)
+            return key_type, key
+        keyring.record_failure(connection.uid, sector, key_type, key)
+    return None
+
+
+class SectorTransaction:
+    """Пакет чтений и записей блоков одного сектора под одной аутентификацией
+
+    Сектор аутентифицируется один раз при open(), все его блоки (включая
+    16 блоков больших секторов карты 4K) читаются и пишутся под этой
+    аутентификацией. Любой ответ, кроме 90 00, переводит Mifare Classic в
+    HALT: сессия считается потерянной, и перед следующей командой сектор
+    аутентифицируется заново тем же ключом. Отклоненная команда не
+    повторяется - отказ в доступе от повтора не изменится.
+    """
+
+    def __init__(self, connection, keyring, sector, preferred=(), key_types=("A",)):
+        self.connection = connection
+        self.keyring = keyring
+        self.sector = int(sector)
+        self.preferred = list(preferred)
+        self.key_types = key_types
+        self.key_type = None
+        self.key = None
+        # Карта в HALT после отказа: аутентификация нужна перед следующей командой
+        self.halted = False
+        self.auth_count = 0
+        self.reauth_count = 0
+
+    @property
+    def authenticated(self):
+        return self.key is not None
+
+    @property
+    def geometry(self):
+        return self.connection.geometry
+
+    @property
+    def blocks(self):
+        """Номера блоков сектора (4 или 16 для больших секторов карты 4K)"""
+        return self.geometry.sector_blocks(self.sector)
+
+    @property
+    def trailer_block(self):
+        return self.geometry.trailer_block(self.sector)
+
+    def open(self):
+        """Аутентификация сектора перебором ключей; True при успехе"""
+        auth = authenticate_sector(self.connection, self.keyring, self.sector,
+                                   self.preferred, self.key_types)
+        self.auth_count += 1
+        self.halted = False
+        if auth:
+            self.key_type, self.key = auth
+            return True
+        self.key_type, self.key = None, None
+        return False
+
+    def authenticate(self, key_type, key):
+        """Аутентификация конкретным ключом (например, проверка нового ключа)"""
+        self.auth_count += 1
+        self.halted = False
+        if self.connection.key_slots.authenticate(self.connection, self.sector,
+                                                  KEY_TYPE_CODES[key_type], key):
+            self.key_type, self.key = key_type, key.upper()
+            return True
+        self.key_type, self.key = None, None
+        return False
+
+    def _check_block(self, block_num):
+        if block_num not in self.blocks:
+            raise Exception(f"Блок {block_num} не принадлежит сектору {self.sector}")
+
+    def _transmit(self, apdu):
+        if self.halted:
+            # Предыдущий отказ сбросил аутентификацию - восстанавливаем ее тем же ключом
+            if not self.authenticated:
+                sw1, sw2 = SW_AUTH_FAILED
+                return [], sw1, sw2
+            self.reauth_count += 1
+            apdu_monitor.record_retry(self.connection.reader_name)
+            if not self.authenticate(self.key_type, self.key):
+                self.halted = True
+                sw1, sw2 = SW_AUTH_FAILED
+                return [], sw1, sw2
+        response, sw1, sw2 = self.connection.transmit(apdu)
+        if (sw1, sw2) != SW_OK:
+            self.halted = True
+        return response, sw1, sw2
+
+    def read_block(self, block_num):
+        """Чтение блока: (данные или None, sw1, sw2)"""
+        self._check_block(block_num)
+        response, sw1, sw2 = self._transmit([0xFF, 0xB0, 0x00, block_num, 16])
+        if sw1 == 0x90 and sw2 == 0x00:
+            return response, sw1, sw2
+        return None, sw1, sw2
+
+    def read_into(self, image, block_num):
+        """Чтение блока сразу в образ карты (CardImage): (успех, sw1, sw2)"""
+        response, sw1, sw2 = self.read_block(block_num)
+        if response is None or len(response) != 16:
+            image.forget_block(block_num)
+            return False, sw1, sw2
+        image.set_block(block_num, response)
+        return True, sw1, sw2
+
+    def write_block(self, block_num, data):
+        """Запись 16 байт в блок: (успех, sw1, sw2)"""
+        self._check_block(block_num)
+        data = list(data)
+        if len(data) != 16:
+            raise Exception(f"Для блока {block_num} нужно 16 байт, получено {len(data)}")
+        response, sw1, sw2 = self._transmit([0xFF, 0xD6, 0x00, block_num, 0x10] + data)
+        return sw1 == 0x90 and sw2 == 0x00, sw1, sw2
@@ -0,0 +1,266 @@
+"""Доставка UID приложенной карты: клавиатура, буфер обмена, сокет, файл/stdout
+
+Каждый приемник (sink) получает UID и время появления карты и считает
+задержку "приложили карту -> UID доставлен". Клавиатура и буфер обмена
+работают только в Windows (pywin32); сокет и файл/stdout - везде.
+"""
+import ctypes
+import socket
+import sys
+import threading
+import time
+from apdu_monitor import LatencyHistogram
+
+try:
+    import win32clipboard
+except ImportError:
+    win32clipboard = None
+
+# Порт сокета для кассового ПО по умолчанию
+DEFAULT_SOCKET_PORT = 8765
+
+
+def win32_available():
+    return win32clipboard is not None and hasattr(ctypes, "windll")
+
+
+def default_sink_names():
+    """Приемники по умолчанию: ввод с клавиатуры в Windows, stdout в остальных системах"""
+    return ["keyboard"] if win32_available() else ["stdout"]
+
+
+class UidSink:
+    """Приемник UID; подклассы реализуют deliver()"""
+
+    name = "sink"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = LatencyHistogram()
+        self.delivered = 0
+        self.failures = 0
+        self.last_ms = None
+
+    def deliver(self, uid):
+        """Доставка UID; True при успехе"""
+        raise NotImplementedError
+
+    def send(self, uid, detected_at=None):
+        """Доставка с учетом задержки от появления карты"""
+        try:
+            ok = self.deliver(uid)
+        except Exception:
+            ok = False
+        elapsed_ms = (time.time() - detected_at) * 1000.0 if detected_at else None
+        with self._lock:
+            if ok:
+                self.delivered += 1
+                if elapsed_ms is not None:
+                    self.latency.add(elapsed_ms)
+                    self.last_ms = round(elapsed_ms, 1)
+            else:
+                self.failures += 1
+        return ok
+
+    def close(self):
+        pass
+
+    def get_stats(self):
+        with self._lock:
+            latency = self.latency.to_dict()
+            return {
+                "delivered": self.delivered,
+                "failures": self.failures,
+                "last_ms": self.last_ms,
+                "avg_ms": latency["avg_ms"],
+                "p95_ms": latency["p95_ms"],
+                "max_ms": latency["max_ms"],
+            }
+
+
+# Структуры SendInput (winuser.h)
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+VK_CONTROL = 0x11
+VK_V = 0x56
+
+
+class KEYBDINPUT(ctypes.Structure):
+    _fields_ = [("wVk", ctypes.c_ushort), ("wScan", ctypes.c_ushort), ("dwFlags", ctypes.c_ulong),
+                ("time", ctypes.c_ulong), ("dwExtraInfo", ctypes.c_void_p)]
+
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = [("dx", ctypes.c_long), ("dy", ctypes.c_long), ("mouseData", ctypes.c_ulong),
+                ("dwFlags", ctypes.c_ulong), ("time", ctypes.c_ulong), ("dwExtraInfo", ctypes.c_void_p)]
+
+
+class _INPUTUNION(ctypes.Union):
+    _fields_ = [("ki", KEYBDINPUT), ("mi", MOUSEINPUT)]
+
+
+class INPUT(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_ulong), ("union", _INPUTUNION)]
+
+
+def send_key_events(events):
+    """Все события клавиатуры одним вызовом SendInput; True, если приняты все"""
+    inputs = (INPUT * len(events))()
+    for index, (vk, scan, flags) in enumerate(events):
+        inputs[index].type = INPUT_KEYBOARD
+        inputs[index].union.ki = KEYBDINPUT(vk, scan, flags, 0, None)
+    sent = ctypes.windll.user32.SendInput(len(events), inputs, ctypes.sizeof(INPUT))
+    return sent == len(events)
+
+
+class ClipboardSink(UidSink):
+    """UID в буфер обмена и вставка Ctrl+V"""
+
+    name = "clipboard"
+
+    def __init__(self, paste=True):
+        super().__init__()
+        self.paste = paste
+
+    def deliver(self, uid):
+        if not win32_available():
+            return False
+        win32clipboard.OpenClipboard()
+        try:
+            win32clipboard.EmptyClipboard()
+            win32clipboard.SetClipboardText(uid.upper())
+        finally:
+            win32clipboard.CloseClipboard()
+        if not self.paste:
+            return True
+        return send_key_events([
+            (VK_CONTROL, 0, 0), (VK_V, 0, 0),
+            (VK_V, 0, KEYEVENTF_KEYUP), (VK_CONTROL, 0, KEYEVENTF_KEYUP),
+        ])
+
+
+class KeyboardSink(UidSink):
+    """Ввод UID в активное окно одним вызовом SendInput
+
+    Символы передаются как Unicode (KEYEVENTF_UNICODE), поэтому ввод не
+    зависит от раскладки и переключать ее на английскую не нужно. Если
+    ввод не удался, UID вставляется через буфер обмена.
+    """
+
+    name = "keyboard"
+
+    def __init__(self, fallback=None):
+        super().__init__()
+        self.fallback = fallback
+
+    def deliver(self, uid):
+        if win32_available():
+            events = []
+            for char in uid.upper():
+                events.append((0, ord(char), KEYEVENTF_UNICODE))
+                events.append((0, ord(char), KEYEVENTF_UNICODE | KEYEVENTF_KEYUP))
+            if send_key_events(events):
+                return True
+        return self.fallback.deliver(uid) if self.fallback else False
+
+
+class SocketSink(UidSink):
+    """Локальный TCP сервер: каждый UID отправляется строкой всем подключенным клиентам
+
+    Кассовое ПО подключается к 127.0.0.1:<порт> и читает строки "UID\\n".
+    """
+
+    name = "socket"
+
+    def __init__(self, port=DEFAULT_SOCKET_PORT, host="127.0.0.1"):
+        super().__init__()
+        self.clients = []
+        self._clients_lock = threading.Lock()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, int(port)))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True, name="uid-socket")
+        self._thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._clients_lock:
+                self.clients.append(client)
+
+    def deliver(self, uid):
+        line = (uid.upper() + "\n").encode("ascii")
+        delivered = False
+        with self._clients_lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(line)
+                    delivered = True
+                except OSError:
+                    self.clients.remove(client)
+                    client.close()
+        return delivered
+
+    def close(self):
+        try:
+            self.server.close()
+        except OSError:
+            pass
+        with self._clients_lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["port"] = self.port
+        stats["clients"] = len(self.clients)
+        return stats
+
+
+class StreamSink(UidSink):
+    """UID строкой в файл (дозапись) или в stdout"""
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path
+        self.name = "file" if path else "stdout"
+        self.stream = open(path, "a", encoding="utf-8") if path else sys.stdout
+
+    def deliver(self, uid):
+        self.stream.write(uid.upper() + "\n")
+        self.stream.flush()
+        return True
+
+    def close(self):
+        if self.path:
+            self.stream.close()
+
+
+def create_sinks(config):
+    """Приемники UID по списку "uid_sinks" из конфигурации"""
+    sinks = []
+    for name in config.get("uid_sinks") or default_sink_names():
+        try:
+            if name == "keyboard":
+                sinks.append(KeyboardSink(fallback=ClipboardSink()))
+            elif name == "clipboard":
+                sinks.append(ClipboardSink())
+            elif name == "socket":
+                sinks.append(SocketSink(config.get("uid_socket_port", DEFAULT_SOCKET_PORT)))
+            elif name == "file":
+                sinks.append(StreamSink(config.get("uid_file", "uids.txt")))
+            elif name == "stdout":
+                sinks.append(StreamSink())
+            else:
+                print(f"Неизвестный приемник UID: {name}")
+        except Exception as e:
+            print(f"Ошибка создания приемника UID {name}: {e}")
+    return sinks
@@ -1,16 +1,78 @@
 // script.js
 document.addEventListener('DOMContentLoaded', function() {
     // Инициализация при загрузке страницы
-    updateReaders('dump');
-    updateReaders('encode');
-    updateReaders('setup');
-    updateReaders('check');
+    updateAllReaders();
     loadConfig();
+    loadKeyring();
 
     // Регистрируем функцию showStatus как обратный вызов для Python
     eel.expose(showStatus);
+    // Обратные вызовы очереди заданий
+    eel.expose(jobProgress);
+    eel.expose(jobFinished);
+    eel.expose(jobEvent);
+    eel.expose(productionUpdate);
+    // Подключение и отключение считывателей
+    eel.expose(readersChanged);
 });
 
+// Задания, ожидающие результата: job_id -> {resolve, onProgress, onEvent, tab}
+const pendingJobs = {};
+// Результаты, пришедшие раньше, чем ответ с job_id
+const earlyResults = {};
+
+// Прогресс задания из Python
+function jobProgress(jobId, done, total, message) {
+    const job = pendingJobs[jobId];
+    if (job && job.onProgress) {
+        job.onProgress(done, total, message);
+    }
+}
+
+// Структурированное событие задания (например, готовый сектор дампа)
+function jobEvent(jobId, event) {
+    const job = pendingJobs[jobId];
+    if (job && job.onEvent) {
+        job.onEvent(event);
+    }
+}
+
+// Результат задания из Python
+function jobFinished(jobId, result) {
+    const job = pendingJobs[jobId];
+    if (job) {
+        delete pendingJobs[jobId];
+        job.resolve(result);
+    } else {
+        earlyResults[jobId] = result;
+    }
+}
+
+// Запуск задания: Python сразу возвращает job_id, результат приходит через jobFinished
+async function runJob(call, tab, onProgress, onEvent) {
+    const started = await call();
+    if (started.status !== 'queued') {
+        return started;
+    }
+    if (started.job_id in earlyResults) {
+        const result = earlyResults[started.job_id];
+        delete earlyResults[started.job_id];
+        return result;
+    }
+    return new Promise(resolve => {
+        pendingJobs[started.job_id] = {resolve, onProgress, onEvent, tab};
+    });
+}
+
+// Отмена всех заданий, запущенных с вкладки
+async function cancelJobs(tab) {
+    for (const [jobId, job] of Object.entries(pendingJobs)) {
+        if (job.tab === tab) {
+            await eel.cancel_job(jobId)();
+        }
+    }
+}
+
 // Функция переключения вкладок
 function openTab(evt, tabName) {
     // Скрыть все вкладки
@@ -42,26 +104,51 @@ function showStatus(message) {
     }, 5000);
 }
 
-// Обновление списка считывателей
-async function updateReaders(tab) {
-    try {
-        const readers = await eel.get_readers_list()();
-        const selectElement = document.getElementById(`reader-${tab}`);
-        selectElement.innerHTML = '';
-
-        if (readers.length > 0 && !readers[0].includes('Ошибка')) {
-            readers.forEach(reader => {
-                const option = document.createElement('option');
-                option.value = reader;
-                option.textContent = reader;
-                selectElement.appendChild(option);
-            });
-        } else {
+// Вкладки со списком считывателей
+const READER_TABS = ['dump', 'encode', 'setup', 'check'];
+
+// Заполнение списка считывателей вкладки; выбранный считыватель сохраняется, если он подключен
+function fillReaders(tab, readers) {
+    const selectElement = document.getElementById(`reader-${tab}`);
+    const selected = selectElement.value;
+    selectElement.innerHTML = '';
+
+    if (readers.length > 0 && !readers[0].includes('Ошибка')) {
+        readers.forEach(reader => {
             const option = document.createElement('option');
-            option.value = '';
-            option.textContent = 'Нет доступных считывателей';
+            option.value = reader;
+            option.textContent = reader;
             selectElement.appendChild(option);
+        });
+        if (readers.includes(selected)) {
+            selectElement.value = selected;
         }
+    } else {
+        const option = document.createElement('option');
+        option.value = '';
+        option.textContent = 'Нет доступных считывателей';
+        selectElement.appendChild(option);
+    }
+}
+
+// Список считывателей изменился (вызывается из Python)
+function readersChanged(readers) {
+    READER_TABS.forEach(tab => fillReaders(tab, readers));
+}
+
+// Заполнение списков всех вкладок одним запросом
+async function updateAllReaders() {
+    try {
+        readersChanged(await eel.get_readers_list()());
+    } catch (error) {
+        console.error('Ошибка при получении списка считывателей:', error);
+    }
+}
+
+// Обновление списка считывателей
+async function updateReaders(tab) {
+    try {
+        fillReaders(tab, await eel.get_readers_list()());
     } catch (error) {
         console.error('Ошибка при получении списка считывателей:', error);
         const selectElement = document.getElementById(`reader-${tab}`);
@@ -69,6 +156,82 @@ async function updateReaders(tab) {
     }
 }
 
+// Строка статистики APDU операции
+function formatApduStats(stats) {
+    if (!stats) {
+        return '';
+    }
+    return `\nAPDU: LOAD KEY ${stats.load_key_sent}, AUTH ${stats.auth_sent}, ` +
+        `сэкономлено LOAD KEY: ${stats.apdu_saved}\n`;
+}
+
+// Текст сектора дампа
+function formatDumpSector(sector) {
+    let text = `\n--- Сектор ${sector.sector} ---\n`;
+    if (!sector.key) {
+        return text + `Не удалось аутентифицироваться в секторе ${sector.sector}\n`;
+    }
+    text += `Аутентифицирован с ключом ${sector.key_type} (${sector.key})\n`;
+    sector.blocks.forEach(block => {
+        const blockNum = String(block.block).padStart(2, '0');
+        if (block.denied) {
+            text += `Блок ${blockNum}: Чтение этим ключом запрещено битами доступа\n`;
+        } else if (block.data === null) {
+            text += `Блок ${blockNum}: Ошибка чтения ${block.sw}\n`;
+        } else {
+            text += `Блок ${blockNum}: ${block.data}\n`;
+        }
+    });
+    if (sector.trailer) {
+        text += `  Ключ A: ${sector.trailer.key_a}\n`;
+        text += `  Биты доступа: ${sector.trailer.access_bits}\n`;
+        text += `  Ключ B: ${sector.trailer.key_b}\n`;
+    }
+    return text;
+}
+
+// Текст сектора очистки
+function formatClearSector(sector) {
+    let text = '';
+    if (sector.key) {
+        text += `Аутентификация сектора ${sector.sector} успешна (ключ ${sector.key})\n`;
+    }
+    sector.blocks.forEach(block => {
+        if (block.status === 'skipped') {
+            text += `Пропущен трейлерный блок ${block.block} (сектор ${sector.sector})\n`;
+        } else if (block.status === 'forbidden') {
+            text += `Пропущен блок ${block.block}: запись запрещена (биты доступа или блок производителя)\n`;
+        } else if (block.status === 'auth_error') {
+            text += `Ошибка аутентификации для блока ${block.block} (сектор ${sector.sector})\n`;
+        } else if (block.status === 'cleared') {
+            text += `Блок ${block.block} успешно очищен\n`;
+        } else if (block.status === 'unchanged') {
+            text += `Блок ${block.block} уже пуст, запись пропущена\n`;
+        } else if (block.status === 'verify_error') {
+            text += `Блок ${block.block} записан, но проверка чтением не прошла\n`;
+        } else {
+            text += `Ошибка очистки блока ${block.block}: ${block.message || block.sw}\n`;
+        }
+    });
+    return text;
+}
+
+// Потоковый вывод секторов: текст добавляется, а не пересобирается
+function streamSectors(outputElement, formatter) {
+    const shown = new Set();
+    return {
+        append(sector) {
+            if (!shown.has(sector.sector)) {
+                shown.add(sector.sector);
+                outputElement.append(formatter(sector));
+            }
+        },
+        finish(sectors) {
+            (sectors || []).forEach(sector => this.append(sector));
+        }
+    };
+}
+
 // Очистка вывода
 function clearOutput(elementId) {
     document.getElementById(elementId).textContent = '';
@@ -85,13 +248,16 @@ async function dumpCard() {
     }
 
     outputElement.textContent = 'Выполняется дамп карты...\n';
+    const stream = streamSectors(outputElement, formatDumpSector);
 
     try {
-        const result = await eel.dump_card(readerName)();
+        const result = await runJob(eel.dump_card(readerName), 'dump', null, event => stream.append(event));
         if (result.status === 'success') {
-            outputElement.textContent = result.data;
+            stream.finish(result.sectors);
+            outputElement.append(`\n--- Полный дамп завершен (${result.card}) ---\n` + formatApduStats(result.apdu_stats));
         } else {
-            outputElement.textContent = `Ошибка: ${result.error}`;
+            // Уже выведенные секторы остаются на экране
+            outputElement.append(`\nОшибка: ${result.error}\n`);
         }
     } catch (error) {
         outputElement.textContent = `Ошибка: ${error}`;
@@ -113,14 +279,21 @@ async function clearAllBlocks() {
     //     return;
     // }
 
-    outputElement.textContent = 'Очистка всех блоков...\n';
+    outputElement.textContent = 'Начало очистки всех блоков карты...\n';
+    const stream = streamSectors(outputElement, formatClearSector);
 
     try {
-        const result = await eel.clear_all_blocks(readerName)();
+        const result = await runJob(eel.clear_all_blocks(readerName), 'dump', null, event => stream.append(event));
         if (result.status === 'success') {
-            outputElement.textContent = result.data;
+            stream.finish(result.sectors);
+            const unchanged = result.summary.unchanged !== undefined
+                ? `, Без изменений: ${result.summary.unchanged}` : '';
+            outputElement.append(`\nОчистка завершена. Успешно: ${result.summary.cleared}${unchanged}, ` +
+                `Ошибок: ${result.summary.errors}, Запрещено: ${result.summary.forbidden}\n` +
+                formatApduStats(result.apdu_stats));
         } else {
-            outputElement.textContent = `Ошибка: ${result.error}`;
+            // Уже выведенные секторы остаются на экране
+            outputElement.append(`\nОшибка: ${result.error}\n`);
         }
     } catch (error) {
         outputElement.textContent = `Ошибка: ${error}`;
@@ -137,7 +310,7 @@ async function encode() {
     }
 
     try {
-        const result = await eel.encode(readerName)();
+        const result = await runJob(eel.encode(readerName), 'encode');
         if (result.status === 'success') {
             // Успешно, сообщение будет показано через showStatus
         } else {
@@ -158,7 +331,7 @@ async function decode() {
     }
 
     try {
-        const result = await eel.decode(readerName)();
+        const result = await runJob(eel.decode(readerName), 'encode');
         if (result.status === 'success') {
             // Успешно, сообщение будет показано через showStatus
         } else {
@@ -185,9 +358,9 @@ async function writeSetupCard() {
     }
 
     try {
-        const result = await eel.write_setup_card(
+        const result = await runJob(eel.write_setup_card(
             readerName, lockNo, waitTime, soundMode, alarmMode, lockMode, cbAuto1
-        )();
+        ), 'setup');
 
         if (result.status === 'success') {
             // Успешно, сообщение будет показано через showStatus
@@ -218,7 +391,7 @@ async function clearSetupBlocks() {
     // }
 
     try {
-        const result = await eel.clear_setup_blocks(readerName)();
+        const result = await runJob(eel.clear_setup_blocks(readerName), 'setup');
         if (result.status === 'success') {
             // Успешно, сообщение будет показано через showStatus
         } else {
@@ -229,6 +402,24 @@ async function clearSetupBlocks() {
     }
 }
 
+// Сохранение последнего дампа в файл .mfd
+async function saveDumpMfd() {
+    const readerName = document.getElementById('reader-dump').value;
+    const outputElement = document.getElementById('dump-output');
+
+    if (!readerName) {
+        outputElement.textContent = 'Пожалуйста, выберите считыватель';
+        return;
+    }
+
+    try {
+        const result = await eel.save_dump_mfd(readerName)();
+        outputElement.append(result.status === 'success' ? `\n${result.data}\n` : `\nОшибка: ${result.error}\n`);
+    } catch (error) {
+        outputElement.append(`\nОшибка: ${error}\n`);
+    }
+}
+
 // Проверка номера замка
 async function checkLockNumber() {
     const readerName = document.getElementById('reader-check').value;
@@ -239,7 +430,7 @@ async function checkLockNumber() {
     }
 
     try {
-        const result = await eel.check_lock_number(readerName)();
+        const result = await runJob(eel.check_lock_number(readerName), 'check');
         if (result.status === 'success') {
             // Успешно, сообщение будет показано через showStatus
         } else {
@@ -258,6 +449,8 @@ async function loadConfig() {
         document.getElementById('settings-key-b').value = config.default_key_b;
         document.getElementById('settings-access-bits').value = config.default_access_bits;
         document.getElementById('settings-block').value = config.default_block;
+        document.getElementById('settings-delta-writes').checked = !!config.delta_writes;
+        document.getElementById('settings-profiling').checked = !!config.profiling;
     } catch (error) {
         console.error('Ошибка при загрузке конфигурации:', error);
     }
@@ -269,14 +462,17 @@ async function saveSettings() {
     const keyB = document.getElementById('settings-key-b').value;
     const accessBits = document.getElementById('settings-access-bits').value;
     const block = document.getElementById('settings-block').value;
+    const deltaWrites = document.getElementById('settings-delta-writes').checked;
+    const profiling = document.getElementById('settings-profiling').checked;
 
     const statusElement = document.getElementById('settings-status');
 
     try {
-        const result = await eel.save_settings(keyA, keyB, accessBits, block)();
+        const result = await eel.save_settings(keyA, keyB, accessBits, block, deltaWrites, profiling)();
         if (result.status === 'success') {
             statusElement.textContent = result.message;
             statusElement.className = 'success';
+            loadKeyring();
         } else {
             statusElement.textContent = result.message;
             statusElement.className = 'error';
@@ -299,9 +495,12 @@ async function resetSettings() {
             document.getElementById('settings-key-b').value = result.config.default_key_b;
             document.getElementById('settings-access-bits').value = result.config.default_access_bits;
             document.getElementById('settings-block').value = result.config.default_block;
+            document.getElementById('settings-delta-writes').checked = !!result.config.delta_writes;
+            document.getElementById('settings-profiling').checked = !!result.config.profiling;
 
             statusElement.textContent = result.message;
             statusElement.className = 'success';
+            loadKeyring();
         } else {
             statusElement.textContent = result.message;
             statusElement.className = 'error';
@@ -310,4 +509,304 @@ async function resetSettings() {
         statusElement.textContent = `Ошибка: ${error}`;
         statusElement.className = 'error';
     }
-}
\ No newline at end of file
+}
+
+// Отображение набора ключей
+function renderKeyring(keyring) {
+    const listElement = document.getElementById('keyring-list');
+    listElement.innerHTML = '';
+    Object.entries(keyring.named_keys).forEach(([name, key]) => {
+        const row = document.createElement('div');
+        const hitsA = keyring.hits[`A:${key}`] || 0;
+        const hitsB = keyring.hits[`B:${key}`] || 0;
+        row.textContent = `${name}: ${key} (успешно A: ${hitsA}, B: ${hitsB}) `;
+        if (!['transport', 'default_key_a', 'default_key_b'].includes(name)) {
+            const button = document.createElement('button');
+            button.textContent = 'Удалить';
+            button.className = 'danger';
+            button.onclick = () => deleteKeyringKey(name);
+            row.appendChild(button);
+        }
+        listElement.appendChild(row);
+    });
+    const footer = document.createElement('div');
+    footer.textContent = `Известных карт: ${keyring.known_cards}`;
+    listElement.appendChild(footer);
+}
+
+// Загрузка набора ключей
+async function loadKeyring() {
+    try {
+        renderKeyring(await eel.get_keyring()());
+    } catch (error) {
+        console.error('Ошибка при загрузке набора ключей:', error);
+    }
+}
+
+// Добавление именованного ключа
+async function saveKeyringKey() {
+    const name = document.getElementById('keyring-name').value;
+    const key = document.getElementById('keyring-key').value;
+    const statusElement = document.getElementById('settings-status');
+
+    try {
+        const result = await eel.save_keyring_key(name, key)();
+        statusElement.textContent = result.message;
+        statusElement.className = result.status;
+        if (result.status === 'success') {
+            renderKeyring(result.keyring);
+        }
+    } catch (error) {
+        statusElement.textContent = `Ошибка: ${error}`;
+        statusElement.className = 'error';
+    }
+}
+
+// Удаление именованного ключа
+async function deleteKeyringKey(name) {
+    try {
+        const result = await eel.delete_keyring_key(name)();
+        renderKeyring(result.keyring);
+    } catch (error) {
+        console.error('Ошибка при удалении ключа:', error);
+    }
+}
+
+
+// Статистика параллельной записи
+function productionUpdate(stats) {
+    const outputElement = document.getElementById('production-output');
+    if (!stats) {
+        outputElement.textContent = '';
+        return;
+    }
+    let text = `${stats.running ? 'Идет запись' : 'Остановлено'}: карт ${stats.cards}, ` +
+        `ошибок ${stats.errors}, ${stats.cards_per_minute} карт/мин\n`;
+    Object.entries(stats.readers).forEach(([reader, count]) => {
+        text += `  ${reader}: ${count}\n`;
+    });
+    if (stats.last_card) {
+        text += `Последняя карта: замок ${stats.last_card.lock_no} (${stats.last_card.reader})\n`;
+    }
+    if (stats.allocator.next !== null) {
+        document.getElementById('lock-no').value = stats.allocator.next;
+    }
+    outputElement.textContent = text;
+}
+
+// Запуск параллельной записи
+async function startProduction() {
+    try {
+        const result = await eel.start_production(
+            document.getElementById('lock-no').value,
+            document.getElementById('production-end').value,
+            document.getElementById('wait-time').value,
+            document.getElementById('sound-mode').value,
+            document.getElementById('alarm-mode').value,
+            document.getElementById('lock-mode').value
+        )();
+        document.getElementById('production-output').textContent = result.message;
+    } catch (error) {
+        alert(`Ошибка: ${error}`);
+    }
+}
+
+// Пакетная запись по прикладыванию карт к выбранному считывателю
+async function startTapBatch() {
+    const readerName = document.getElementById('reader-setup').value;
+
+    if (!readerName) {
+        alert('Пожалуйста, выберите считыватель');
+        return;
+    }
+
+    try {
+        const result = await eel.start_tap_batch(
+            readerName,
+            document.getElementById('lock-no').value,
+            document.getElementById('production-end').value,
+            document.getElementById('wait-time').value,
+            document.getElementById('sound-mode').value,
+            document.getElementById('alarm-mode').value,
+            document.getElementById('lock-mode').value
+        )();
+        document.getElementById('production-output').textContent = result.status === 'success'
+            ? `Приложите первую карту (замки ${document.getElementById('lock-no').value}-` +
+              `${document.getElementById('production-end').value})`
+            : result.message;
+    } catch (error) {
+        alert(`Ошибка: ${error}`);
+    }
+}
+
+// Остановка параллельной или пакетной записи
+async function stopProduction() {
+    try {
+        productionUpdate(await eel.stop_production()());
+    } catch (error) {
+        alert(`Ошибка: ${error}`);
+    }
+}
+
+// Текст статистики APDU
+function formatDiagnostics(stats) {
+    let text = 'Считыватели:\n';
+    Object.entries(stats.readers).forEach(([reader, readerStats]) => {
+        text += `${reader}: APDU ${readerStats.apdus}, ошибок ${readerStats.errors}, ` +
+            `повторов ${readerStats.retries}\n`;
+        Object.entries(readerStats.commands).forEach(([command, h]) => {
+            text += `  ${command.padEnd(9)} ${h.count} шт., среднее ${h.avg_ms} мс, ` +
+                `p50 ${h.p50_ms} мс, p95 ${h.p95_ms} мс, макс ${h.max_ms} мс\n`;
+        });
+        const statusWords = Object.entries(readerStats.status_words)
+            .map(([sw, count]) => `${sw}: ${count}`).join(', ');
+        text += `  Статусы: ${statusWords}\n`;
+    });
+    text += '\nОперации (среднее на вызов):\n';
+    Object.entries(stats.operations).forEach(([name, op]) => {
+        text += `${name}: ${op.count} вызовов, ошибок ${op.errors}, APDU ${op.apdus_avg}, ` +
+            `всего ${op.duration_ms_avg} мс (карта ${op.apdu_ms_avg} мс, код ${op.code_ms_avg} мс)\n`;
+    });
+    text += '\nПоследние операции:\n';
+    stats.recent.slice().reverse().forEach(span => {
+        const time = new Date(span.started_at * 1000).toLocaleTimeString();
+        text += `${time} ${span.name} (${span.reader}): ${span.status}, APDU ${span.apdus}, ` +
+            `${span.duration_ms} мс, повторов ${span.retries}${span.error ? ', ' + span.error : ''}\n`;
+    });
+    return text;
+}
+
+// Текст счетчиков очереди событий карт
+function formatRfidStats(stats) {
+    let text = 'Мониторинг карт: остановлен\n';
+    if (stats.monitoring) {
+        text = `Мониторинг карт: в очереди ${stats.queue_depth} (макс. ${stats.max_queue_depth}), ` +
+            `обработано ${stats.processed}, повторов ${stats.duplicates}, ` +
+            `отброшено ${stats.dropped}, ошибок ${stats.errors}\n` +
+            `UID: прочитано ${stats.uid_reads}, из кэша ${stats.uid_cached}, по ATR ${stats.atr_fallbacks}, ` +
+            `зависаний считывателя ${stats.timeouts}\n`;
+    }
+    Object.entries(stats.sinks).forEach(([name, sink]) => {
+        text += `Доставка UID (${name}): ${sink.delivered}, ошибок ${sink.failures}, ` +
+            `от прикладывания: последняя ${sink.last_ms} мс, среднее ${sink.avg_ms} мс, p95 ${sink.p95_ms} мс\n`;
+    });
+    return text + '\n';
+}
+
+// Сервер считывателей: очереди, ожидание и выполнение заданий
+function formatServerStats(stats) {
+    let text = stats.listening ? `Сервер считывателей: ${stats.listening}, подключений ${stats.connections}\n`
+        : `Сервер считывателей: только окно${stats.error ? ` (${stats.error})` : ''}\n`;
+    const timing = (name, row) => `  ${name}: заданий ${row.done}, ожидание p50 ${row.wait.p50_ms} мс ` +
+        `(p95 ${row.wait.p95_ms}), выполнение p50 ${row.service.p50_ms} мс (p95 ${row.service.p95_ms})`;
+    Object.entries(stats.readers).forEach(([name, reader]) => {
+        text += timing(name, reader) + `, в очереди ${reader.queued}\n`;
+    });
+    Object.entries(stats.clients).forEach(([name, client]) => {
+        text += timing(`клиент ${name}`, client) + '\n';
+    });
+    Object.entries(stats.watchdog.readers).forEach(([name, reader]) => {
+        text += `  Сторож ${name}: отменено по сроку ${reader.cancelled}, брошено потоков ${reader.abandoned}` +
+            (reader.last ? `, последнее: ${reader.last.reason}` : '') + '\n';
+    });
+    if (stats.hung_threads) {
+        text += `  Зависших потоков PC/SC: ${stats.hung_threads}\n`;
+    }
+    text += `  Считыватели: подключено ${stats.registry.readers}, опросов ${stats.registry.scans}, ` +
+        `изменений ${stats.registry.changes}` + (stats.registry.error ? ` (${stats.registry.error})` : '') + '\n';
+    return text + '\n';
+}
+
+// Профили операций: файлы и самые затратные функции последних операций
+function formatProfilerStats(stats) {
+    if (!stats.enabled && !stats.recent.length) {
+        return '';
+    }
+    let text = `Профилирование: ${stats.enabled ? 'включено' : 'выключено'}, профилей ${stats.written}, ` +
+        `каталог ${stats.directory}\n`;
+    stats.recent.slice(0, 5).forEach(profile => {
+        text += `  ${profile.name}${profile.reader ? ` [${profile.reader}]` : ''}: ${profile.duration_ms} мс` +
+            (profile.error ? ` (ошибка записи: ${profile.error})` : '') + '\n';
+        profile.top.slice(0, 3).forEach(row => {
+            text += `    ${row.function}: ${row.self_ms} мс (всего ${row.total_ms}), вызовов ${row.calls}\n`;
+        });
+    });
+    return text + '\n';
+}
+
+// Контрольные точки операций, прерванных сбоем связи
+function formatCheckpointStats(stats) {
+    let text = `Контрольные точки: продолжено ${stats.resumed}, завершено ${stats.completed}, ` +
+        `истекло ${stats.expired}\n`;
+    stats.pending.forEach(checkpoint => {
+        text += `  ${checkpoint.operation} UID ${checkpoint.uid}: продолжится с сектора ` +
+            `${checkpoint.next_sector} (${checkpoint.age} с назад)\n`;
+    });
+    return text + '\n';
+}
+
+// Загрузка статистики APDU
+async function loadDiagnostics() {
+    try {
+        const rfidStats = await eel.get_rfid_stats()();
+        const checkpointStats = await eel.get_checkpoint_stats()();
+        const serverStats = await eel.get_server_stats()();
+        const profilerStats = await eel.get_profiler_stats()();
+        document.getElementById('diagnostics-output').textContent =
+            formatRfidStats(rfidStats) + formatServerStats(serverStats) + formatCheckpointStats(checkpointStats) +
+            formatProfilerStats(profilerStats) + formatDiagnostics(await eel.get_apdu_stats()());
+    } catch (error) {
+        console.error('Ошибка при получении статистики APDU:', error);
+    }
+}
+
+// Сброс статистики APDU
+async function resetDiagnostics() {
+    try {
+        document.getElementById('diagnostics-output').textContent =
+            formatDiagnostics(await eel.reset_apdu_stats()());
+    } catch (error) {
+        console.error('Ошибка при сбросе статистики APDU:', error);
+    }
+}
+
+// Строка записи журнала операций
+function formatAuditRecord(record) {
+    const time = new Date(record.ts * 1000).toLocaleString();
+    let text = `${time} ${record.operation} UID ${record.uid || '-'} (${record.reader}): ${record.status}`;
+    if (record.lock_no !== null) {
+        text += `, замок ${record.lock_no}`;
+    }
+    if (record.key_a) {
+        text += `, ключ A ${record.key_a}`;
+    }
+    text += `, ${record.duration_ms} мс, APDU ${record.apdus}`;
+    if (record.error) {
+        text += `, ${record.error}`;
+    }
+    return text + '\n';
+}
+
+// Поиск в журнале операций
+async function searchAudit() {
+    const outputElement = document.getElementById('audit-output');
+    try {
+        const result = await eel.search_audit(
+            document.getElementById('audit-uid').value,
+            document.getElementById('audit-lock-no').value,
+            document.getElementById('audit-key-a').value,
+            document.getElementById('audit-operation').value
+        )();
+        if (result.status !== 'success') {
+            outputElement.textContent = result.message;
+            return;
+        }
+        let text = `Найдено записей: ${result.records.length} (${result.elapsed_ms} мс)\n\n`;
+        result.records.forEach(record => {
+            text += formatAuditRecord(record);
+        });
+        outputElement.textContent = text;
+    } catch (error) {
+        outputElement.textContent = `Ошибка: ${error}`;
+    }
+}
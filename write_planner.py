@@ -0,0 +1,97 @@
+"""Запись только отличающихся блоков (delta write)
+
+UPDATE - самая медленная команда Mifare Classic и изнашивает EEPROM.
+Планировщик читает текущее содержимое блоков сектора, записывает только
+те, что отличаются от нужного образа, и проверяет записанное чтением.
+"""
+from card_image import CardImage
+
+# Состояния блока в отчете
+WRITTEN = "written"
+SKIPPED = "skipped"
+VERIFY_FAILED = "verify_failed"
+ERROR = "error"
+
+
+def known_trailer(transaction, current):
+    """Известная часть трейлера: (байты, маска известных байт)
+
+    Ключ A никогда не читается, но известен, если сектор открыт ключом A.
+    Ключ B, прочитанный как нули, считается неизвестным (чтение запрещено).
+    """
+    data = bytearray(current)
+    mask = [False] * 6 + [True] * 4 + [any(current[10:16])] * 6
+    if transaction.key_type == "A" and transaction.key:
+        data[0:6] = bytes.fromhex(transaction.key)
+        mask[0:6] = [True] * 6
+    return data, mask
+
+
+def block_differs(transaction, block_num, current, desired):
+    """Нужно ли записывать блок (current - текущее содержимое или None)"""
+    if current is None:
+        return True
+    if block_num != transaction.trailer_block:
+        return current != desired
+    data, mask = known_trailer(transaction, current)
+    return any(not known or data[i] != desired[i] for i, known in enumerate(mask))
+
+
+def verify_block(transaction, block_num, desired):
+    """Проверка записанного чтением (для трейлера - читаемые части)"""
+    response, sw1, sw2 = transaction.read_block(block_num)
+    if response is None:
+        return False
+    response = bytes(response)
+    if block_num != transaction.trailer_block:
+        return response == desired
+    # Ключ A не читается; ключ B - только если его разрешено читать
+    if response[6:10] != desired[6:10]:
+        return False
+    return not any(response[10:16]) or response[10:16] == desired[10:16]
+
+
+def write_sector_delta(transaction, desired, verify=True, image=None):
+    """Запись блоков сектора, которые отличаются от desired {блок: 16 байт}
+
+    Текущие блоки читаются в image (CardImage), туда же попадает
+    записанное; блоки, уже известные образу, повторно не читаются. Блоки пишутся в порядке desired, трейлер - последним.
+    Возвращает {блок: {"status", "sw"}}.
+    """
+    image = image if image is not None else CardImage(transaction.geometry)
+    report = {}
+    # Блоки в порядке desired, трейлер - последним: после него ключи могут смениться
+    order = sorted(desired, key=lambda block_num: block_num == transaction.trailer_block)
+    for block_num in order:
+        data = bytes(desired[block_num])
+        sw = None
+        if image.is_known(block_num):
+            # Блок уже прочитан или записан в этой операции - READ не нужен
+            current = bytes(image.block(block_num))
+        else:
+            # Неудачный READ переводит карту в HALT; перед UPDATE транзакция
+            # аутентифицирует сектор заново
+            ok, sw1, sw2 = transaction.read_into(image, block_num)
+            current = bytes(image.block(block_num)) if ok else None
+            sw = f"{sw1:02X} {sw2:02X}"
+        if not block_differs(transaction, block_num, current, data):
+            report[block_num] = {"status": SKIPPED, "sw": sw}
+            continue
+        ok, sw1, sw2 = transaction.write_block(block_num, data)
+        entry = {"status": WRITTEN if ok else ERROR, "sw": f"{sw1:02X} {sw2:02X}"}
+        if ok:
+            image.set_block(block_num, data)
+            if verify and not verify_block(transaction, block_num, data):
+                entry["status"] = VERIFY_FAILED
+                image.forget_block(block_num)
+        report[block_num] = entry
+    return report
+
+
+def summarize(reports):
+    """Итог по нескольким отчетам write_sector_delta"""
+    summary = {WRITTEN: 0, SKIPPED: 0, VERIFY_FAILED: 0, ERROR: 0}
+    for report in reports:
+        for entry in report.values():
+            summary[entry["status"]] += 1
+    return summary